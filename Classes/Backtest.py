@@ -0,0 +1,66 @@
+# Runs the Main.py pipeline for one strategy configuration and returns its statistics:
+# strategy -> trades -> PortfolioConstructor -> TradeAnalysis / PortfolioAnalysis
+
+from Classes.PortfolioConstructor import PortfolioConstructor
+from Classes.TradeAnalysis import TradeAnalysis
+from Classes.PortfolioAnalysis import PortfolioAnalysis
+
+
+def run_backtest(
+    strategy_class,
+    ticker,
+    start_date,
+    end_date,
+    params,
+    data_source,
+    data=None,
+    cost_model=None,
+):
+    """
+    Returns a dict of trade and portfolio statistics for strategy_class run with params.
+    The portfolio pays the costs of cost_model (a CostModel) when one is given.
+
+    Strategies are constructed the same way as TestStrategy1:
+    strategy_class(start, end, ticker, **params, data_source=..., data=...)
+    """
+    statistics, _, _ = run_backtest_with_artifacts(
+        strategy_class,
+        ticker,
+        start_date,
+        end_date,
+        params,
+        data_source,
+        data,
+        cost_model,
+    )
+    return statistics
+
+
+def run_backtest_with_artifacts(
+    strategy_class,
+    ticker,
+    start_date,
+    end_date,
+    params,
+    data_source,
+    data=None,
+    cost_model=None,
+):
+    """
+    Returns the statistics of run_backtest, the portfolio dataframe and the trades table,
+    e.g. to keep in a ResultsStore. The portfolio is None when there are no trades.
+    """
+    strategy = strategy_class(
+        start_date, end_date, ticker, **params, data_source=data_source, data=data
+    )
+    trades = strategy.trades_list
+    if len(trades) == 0:
+        return {"Trades": 0}, None, trades
+
+    statistics = {}
+    statistics.update(TradeAnalysis(trades, data_source).get_statistics())
+    portfolio = PortfolioConstructor(
+        trades, data_source, cost_model=cost_model
+    ).get_portfolio()
+    statistics.update(PortfolioAnalysis(portfolio).get_statistics())
+    return statistics, portfolio, trades
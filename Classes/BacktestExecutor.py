@@ -0,0 +1,311 @@
+# Runs many (strategy, ticker, params, date range) backtests over a process pool.
+#
+# Prices are shared with the workers through the memory-mapped files of a
+# LocalDataStore rather than pickled into every task: the parent tops the store
+# up once for every ticker, then each worker opens the store offline and maps the
+# same files. Workers only send back the statistics dicts of run_backtest.
+#
+# With a ResultsStore, jobs already stored for the same prices are read back in the
+# parent and never sent to a worker. Each worker inserts the results of its chunk, with
+# their equity curves and trades, into the store in one transaction.
+
+import datetime as dt
+import itertools
+import tempfile
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from Classes.MarketDataSource import LocalDataStore, YahooDataSource
+from Classes.Backtest import run_backtest_with_artifacts
+from Classes.ResultsStore import ResultsStore, get_history_version, get_key, make_row
+
+BacktestJob = namedtuple(
+    "BacktestJob", ["strategy_class", "ticker", "params", "start_date", "end_date"]
+)
+
+# Columns of every result row besides the job's params and statistics, see get_job_row.
+JOB_COLUMNS = ["Job", "Strategy", "Ticker", "Start", "End", "Error"]
+
+# One offline store (and results store) per worker process, so memory maps and
+# database connections are reused between chunks.
+worker_stores = {}
+worker_results_stores = {}
+
+
+def run_jobs(
+    store_root,
+    jobs,
+    raise_on_error=False,
+    interval="1d",
+    cost_model=None,
+    results_root=None,
+    keys=None,
+):
+    """
+    Worker entry point, returns one result row per (job number, job). With results_root,
+    the successful jobs are stored under keys[number] = (key, data version).
+    """
+    if (store_root, interval) not in worker_stores:
+        worker_stores[store_root, interval] = LocalDataStore(
+            store_root, interval=interval
+        )
+    data_source = worker_stores[store_root, interval]
+
+    results = []
+    new_results = []
+    for number, job in jobs:
+        row = BacktestExecutor.get_job_row(number, job)
+        try:
+            statistics, portfolio, trades = run_backtest_with_artifacts(
+                job.strategy_class,
+                job.ticker,
+                job.start_date,
+                job.end_date,
+                job.params,
+                data_source,
+                cost_model=cost_model,
+            )
+            row.update(statistics)
+            if results_root is not None:
+                new_results.append(
+                    make_row(
+                        keys[number][0],
+                        job.strategy_class,
+                        job.ticker,
+                        job.start_date,
+                        job.end_date,
+                        job.params,
+                        keys[number][1],
+                        statistics,
+                        portfolio,
+                        trades,
+                    )
+                )
+        except Exception:
+            if raise_on_error:
+                raise
+            row["Error"] = traceback.format_exc(limit=3)
+        results.append(row)
+
+    if new_results:
+        if results_root not in worker_results_stores:
+            worker_results_stores[results_root] = ResultsStore(results_root)
+        worker_results_stores[results_root].insert_many(new_results)
+    return results
+
+
+class BacktestExecutor:
+    """
+    max_workers     number of worker processes (None = one per CPU, 0 = run in this process)
+    chunk_size      number of jobs sent to a worker per task
+    raise_on_error  re-raise the first failing job instead of recording its error
+                    in the "Error" column and carrying on with the other jobs
+    cost_model      CostModel applied to every job's portfolio (None = no costs)
+    results_store   ResultsStore to read finished jobs from and store new ones in
+
+    Without a LocalDataStore or store_root the prices are copied into a temporary
+    store, removed by close() or at the end of a with block.
+    """
+
+    def __init__(
+        self,
+        data_source=None,
+        max_workers=None,
+        chunk_size=8,
+        raise_on_error=False,
+        store_root=None,
+        cost_model=None,
+        results_store=None,
+    ):
+        self.temporary_directory = None
+        if isinstance(data_source, LocalDataStore):
+            self.store = data_source
+        else:
+            # Copy whatever the data source serves into a store the workers can map.
+            upstream = data_source if data_source is not None else YahooDataSource()
+            root = store_root
+            if root is None:
+                # Removed by close(), or when the executor is garbage collected.
+                self.temporary_directory = tempfile.TemporaryDirectory(
+                    prefix="backtest_store_"
+                )
+                root = self.temporary_directory.name
+            self.store = LocalDataStore(root, upstream=upstream)
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.raise_on_error = raise_on_error
+        self.cost_model = cost_model
+        self.results_store = results_store
+
+    def close(self):
+        """Removes the temporary price store made when no store_root was given"""
+        if self.temporary_directory is not None:
+            self.store.arrays.clear()
+            # Jobs run in this process (max_workers=0) map the store's files too.
+            worker_store = worker_stores.pop(
+                (self.store.root, self.store.interval), None
+            )
+            if worker_store is not None:
+                worker_store.arrays.clear()
+            self.temporary_directory.cleanup()
+            self.temporary_directory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+        return False
+
+    @staticmethod
+    def make_jobs(strategy_class, tickers, param_grid, start_date, end_date):
+        """Returns a job for every ticker and every combination in the parameter grid"""
+        names = list(param_grid)
+        return [
+            BacktestJob(
+                strategy_class, ticker, dict(zip(names, values)), start_date, end_date
+            )
+            for ticker in tickers
+            for values in itertools.product(*param_grid.values())
+        ]
+
+    @staticmethod
+    def get_job_row(number, job):
+        return {
+            "Job": number,
+            "Strategy": job.strategy_class.__name__,
+            "Ticker": job.ticker,
+            "Start": job.start_date,
+            "End": job.end_date,
+            **job.params,
+            "Error": None,
+        }
+
+    def prepare_data(self, jobs):
+        """
+        Tops the store up once per ticker for the whole range any job needs and
+        returns the tickers that could not be loaded with their errors
+        """
+        ranges = {}
+        for job in jobs:
+            start = pd.Timestamp(job.start_date)
+            # Open positions are sold on the end date, so its price is needed too.
+            end = pd.Timestamp(job.end_date) + dt.timedelta(days=1)
+            if job.ticker in ranges:
+                start = min(start, ranges[job.ticker][0])
+                end = max(end, ranges[job.ticker][1])
+            ranges[job.ticker] = (start, end)
+        errors = {}
+        for ticker, (start, end) in ranges.items():
+            try:
+                self.store.top_up(ticker, start, end)
+            except Exception as error:
+                if self.raise_on_error:
+                    raise
+                errors[ticker] = repr(error)
+        return errors
+
+    def get_keys(self, jobs):
+        """Returns {job number: (results store key, data version)} for (number, job) pairs"""
+        versions = {}
+        keys = {}
+        for number, job in jobs:
+            prices = (job.ticker, job.start_date, job.end_date)
+            if prices not in versions:
+                versions[prices] = get_history_version(self.store, *prices)
+            keys[number] = (
+                get_key(
+                    job.strategy_class,
+                    job.params,
+                    job.ticker,
+                    job.start_date,
+                    job.end_date,
+                    versions[prices],
+                    self.cost_model,
+                ),
+                versions[prices],
+            )
+        return keys
+
+    def run(self, jobs):
+        """Returns a dataframe with one row of parameters and statistics per job, in job order"""
+        jobs = list(enumerate(jobs))
+        data_errors = self.prepare_data([job for _, job in jobs])
+
+        results = []
+        for number, job in jobs:
+            if job.ticker in data_errors:
+                row = self.get_job_row(number, job)
+                row["Error"] = data_errors[job.ticker]
+                results.append(row)
+        jobs = [(number, job) for number, job in jobs if job.ticker not in data_errors]
+
+        keys = None
+        results_root = None
+        if self.results_store is not None:
+            keys = self.get_keys(jobs)
+            stored = self.results_store.get_many(key for key, _ in keys.values())
+            for number, job in jobs:
+                if keys[number][0] in stored:
+                    results.append(
+                        {**self.get_job_row(number, job), **stored[keys[number][0]]}
+                    )
+            jobs = [
+                (number, job) for number, job in jobs if keys[number][0] not in stored
+            ]
+            results_root = self.results_store.root
+
+        chunks = [
+            jobs[i : i + self.chunk_size] for i in range(0, len(jobs), self.chunk_size)
+        ]
+
+        if self.max_workers == 0:
+            for chunk in chunks:
+                results.extend(
+                    run_jobs(
+                        self.store.root,
+                        chunk,
+                        self.raise_on_error,
+                        self.store.interval,
+                        self.cost_model,
+                        results_root,
+                        keys,
+                    )
+                )
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {
+                    pool.submit(
+                        run_jobs,
+                        self.store.root,
+                        chunk,
+                        self.raise_on_error,
+                        self.store.interval,
+                        self.cost_model,
+                        results_root,
+                        {number: keys[number] for number, _ in chunk} if keys else None,
+                    ): chunk
+                    for chunk in chunks
+                }
+                for future in as_completed(futures):
+                    try:
+                        results.extend(future.result())
+                    except Exception as error:
+                        # A whole chunk failed, e.g. its worker process died.
+                        if self.raise_on_error:
+                            raise
+                        for number, job in futures[future]:
+                            row = self.get_job_row(number, job)
+                            row["Error"] = repr(error)
+                            results.append(row)
+
+        if not results:
+            return pd.DataFrame(columns=JOB_COLUMNS)
+        return pd.DataFrame(results).sort_values("Job").reset_index(drop=True)
+
+
+# executor = BacktestExecutor(LocalDataStore("market_data", upstream=YahooDataSource()))
+# jobs = executor.make_jobs(TestStrategy1, ["GLD", "SPY"], {"MA_period": [10, 20, 50]}, dt.date(2019, 1, 1), dt.date(2023, 2, 2))
+# print(executor.run(jobs))
@@ -0,0 +1,143 @@
+# Helpers for bars of any frequency, from minute bars to monthly ones.
+#
+# Dates are handled as int64 nanoseconds (the same axis as LocalDataStore's index.npy),
+# so lookups and bins are array operations rather than string-keyed .loc.
+#
+# get_periods_per_year    bars in a year of trading, used to annualise instead of 252
+# get_bin_labels          start of the bin (e.g. "5min", "h", "D", "W", "M") of every bar
+# resample                aggregates bars into coarser bars, OHLCV fields as candles
+#
+# Only bins holding at least one bar are returned, so resampling minute bars to hours
+# doesn't add empty bins for nights, weekends and holidays.
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS_PER_YEAR = 252
+CALENDAR_DAYS_PER_YEAR = 365
+DAY = pd.Timedelta(days=1).value
+
+# How each OHLCV field is aggregated into a coarser bar, other columns keep their last value.
+AGGREGATIONS = {
+    "Open": "first",
+    "High": "max",
+    "Low": "min",
+    "Close": "last",
+    "Adj Close": "last",
+    "Volume": "sum",
+}
+
+
+def to_nanoseconds(dates):
+    """Returns dates (an index, array or list) as int64 nanoseconds"""
+    dates = pd.DatetimeIndex(dates)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    return dates.as_unit("ns").asi8
+
+
+def get_trading_days_per_year(dates):
+    """Returns 365 for markets that trade at weekends (e.g. crypto), otherwise 252"""
+    weekdays = ((to_nanoseconds(dates) // DAY) + 3) % 7
+    # 1970-01-01 was a Thursday, so Monday = 0 and Saturday and Sunday are 5 and 6.
+    if len(weekdays) and np.mean(weekdays >= 5) > 0.05:
+        return CALENDAR_DAYS_PER_YEAR
+    return TRADING_DAYS_PER_YEAR
+
+
+def get_periods_per_year(dates):
+    """
+    Returns the number of bars in a year of trading for the spacing of dates:
+    252 for daily bars, 252 x the bars in a session for intraday bars, and
+    365 days / the bar length for weekly and longer bars.
+    """
+    nanoseconds = to_nanoseconds(dates)
+    if len(nanoseconds) < 2:
+        return TRADING_DAYS_PER_YEAR
+    spacing = np.median(np.diff(nanoseconds))
+    trading_days = get_trading_days_per_year(dates)
+    if spacing < DAY:
+        # Sessions are counted per calendar day, the median ignores half days.
+        _, bars_per_day = np.unique(nanoseconds // DAY, return_counts=True)
+        return trading_days * float(np.median(bars_per_day))
+    # Daily bars skip weekends and holidays, so gaps of up to a long weekend are one bar.
+    if spacing < 4 * DAY:
+        return trading_days
+    return CALENDAR_DAYS_PER_YEAR * DAY / spacing
+
+
+def get_bin_labels(dates, rule):
+    """
+    Returns the int64 start of the bin holding every bar for a pandas frequency rule.
+    Fixed rules (e.g. "15min", "h", "D") are aligned to midnight, calendar rules
+    (e.g. "W", "M", "Y") to their periods.
+    """
+    nanoseconds = to_nanoseconds(dates)
+    offset = pd.tseries.frequencies.to_offset(rule)
+    try:
+        step = pd.Timedelta(offset).value
+    except ValueError:
+        # Weeks, months and years have no fixed length.
+        periods = pd.DatetimeIndex(nanoseconds.view("datetime64[ns]")).to_period(rule)
+        return periods.start_time.as_unit("ns").asi8
+    return nanoseconds - nanoseconds % step
+
+
+def get_bin_starts(labels):
+    """Returns the first row of every bin in sorted bin labels"""
+    return np.flatnonzero(np.append(True, labels[1:] != labels[:-1]))
+
+
+def aggregate(values, starts, how):
+    """
+    Returns the (bin x column) aggregate of the (bar x column) values over the bins
+    starting at the rows in starts, ignoring NaNs. how is one of first, last, max,
+    min or sum, and bins without a value in a column give NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    rows = np.arange(len(values))[:, np.newaxis]
+    if how == "first":
+        # First and last rows with a value in each bin, the rows outside mark no value.
+        first = np.minimum.reduceat(np.where(valid, rows, len(values)), starts, axis=0)
+        result = np.take_along_axis(values, np.minimum(first, len(values) - 1), axis=0)
+    elif how == "last":
+        last = np.maximum.reduceat(np.where(valid, rows, -1), starts, axis=0)
+        result = np.take_along_axis(values, np.maximum(last, 0), axis=0)
+    elif how == "max":
+        result = np.fmax.reduceat(values, starts, axis=0)
+    elif how == "min":
+        result = np.fmin.reduceat(values, starts, axis=0)
+    elif how == "sum":
+        result = np.add.reduceat(np.where(valid, values, 0.0), starts, axis=0)
+    else:
+        raise ValueError(f"Unknown aggregation: {how}")
+    counts = np.add.reduceat(valid, starts, axis=0)
+    return np.where(counts > 0, result, np.nan)
+
+
+def resample(df, rule, how=None):
+    """
+    Returns df aggregated into bars of a pandas frequency rule, labelled with the start
+    of each bin. OHLCV columns (or (field, ticker) columns of a panel) are aggregated as
+    in AGGREGATIONS and other columns keep their last value, unless how is given for
+    every column.
+    """
+    if len(df) == 0:
+        return df.copy()
+    labels = get_bin_labels(df.index, rule)
+    starts = get_bin_starts(labels)
+    values = df.to_numpy(dtype=np.float64)
+    result = np.empty((len(starts), df.shape[1]))
+
+    fields = df.columns.get_level_values(0) if df.shape[1] else []
+    aggregations = np.array(
+        [how or AGGREGATIONS.get(field, "last") for field in fields], dtype=object
+    )
+    # One reduceat pass per kind of aggregation.
+    for aggregation in np.unique(aggregations):
+        columns = np.flatnonzero(aggregations == aggregation)
+        result[:, columns] = aggregate(values[:, columns], starts, aggregation)
+
+    index = pd.DatetimeIndex(labels[starts].view("datetime64[ns]"), name=df.index.name)
+    return pd.DataFrame(result, index=index, columns=df.columns)
@@ -0,0 +1,86 @@
+# Trading costs applied by PortfolioConstructor(trades, cost_model=CostModel(...)).
+#
+# Every method works on arrays with one value per fill (or per trade), so the costs of
+# a whole trade table are worked out in a few array operations. Subclass and override
+# a method for another model, e.g. tiered commissions.
+#
+# Fills:
+#     price paid     price x (1 + spread / 2 + impact x participation ** impact_exponent)
+#     price received price x (1 - spread / 2 - impact x participation ** impact_exponent)
+# where participation is the shares traded / the volume of the bar (at most 1, and 1
+# when the bar has no volume). With the default exponent of 0.5 the impact follows the
+# square root law.
+#
+# Commissions are charged on every fill: commission_per_share x shares +
+# commission_rate x value traded, and at least minimum_commission.
+#
+# Financing accrues over the calendar time a trade is held: financing_rate a year on the
+# cash borrowed for a leveraged long (the value x (leverage - 1) / leverage), and
+# borrow_rate a year on the value of the shares borrowed for a short.
+
+import numpy as np
+
+
+class CostModel:
+    """
+    commission_per_share  $ per share bought or sold
+    commission_rate       fraction of the value traded, e.g. 0.0005 = 5 basis points
+    minimum_commission    $ charged at least per fill
+    spread                bid-ask spread as a fraction of the price, half paid on each fill
+    impact                slippage as a fraction of the price at a participation of 1
+    impact_exponent       how slippage grows with participation
+    financing_rate        annual rate on the cash borrowed for leverage
+    borrow_rate           annual fee on the value of shares borrowed to short
+    """
+
+    def __init__(
+        self,
+        commission_per_share=0.0,
+        commission_rate=0.0,
+        minimum_commission=0.0,
+        spread=0.0,
+        impact=0.0,
+        impact_exponent=0.5,
+        financing_rate=0.0,
+        borrow_rate=0.0,
+    ):
+        self.commission_per_share = commission_per_share
+        self.commission_rate = commission_rate
+        self.minimum_commission = minimum_commission
+        self.spread = spread
+        self.impact = impact
+        self.impact_exponent = impact_exponent
+        self.financing_rate = financing_rate
+        self.borrow_rate = borrow_rate
+
+    def get_slippage(self, shares, volumes):
+        """Returns the fraction of the price lost on every fill to the spread and market impact"""
+        slippage = np.full(np.shape(shares), self.spread / 2)
+        if self.impact:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                participation = np.abs(shares) / volumes
+            participation = np.where(
+                np.isfinite(participation), np.minimum(participation, 1.0), 1.0
+            )
+            slippage += self.impact * participation**self.impact_exponent
+        return slippage
+
+    def get_fill_prices(self, prices, shares, volumes):
+        """Returns the price of every fill, shares are positive for buys and negative for sells"""
+        return prices * (1 + np.sign(shares) * self.get_slippage(shares, volumes))
+
+    def get_commissions(self, prices, shares):
+        """Returns the commission of every fill"""
+        shares = np.abs(shares)
+        commissions = (
+            self.commission_per_share * shares + self.commission_rate * shares * prices
+        )
+        return np.maximum(commissions, self.minimum_commission)
+
+    def get_financing_costs(self, prices, shares, leverage):
+        """Returns the financing cost of holding every trade for a year, from its entry value"""
+        value = np.abs(shares) * prices
+        borrowed = value * np.maximum(leverage - 1, 0) / np.maximum(leverage, 1)
+        return np.where(
+            shares < 0, self.borrow_rate * value, self.financing_rate * borrowed
+        )
@@ -0,0 +1,228 @@
+# Event-driven backtest engine, run alongside the vectorised pipeline.
+#
+# The vectorised pipeline fixes every trade in advance (100 shares, filled at the close
+# of the signal date). This engine walks the bars one at a time instead and calls the
+# strategy's on_bar hook after every close, so a strategy can size positions from its
+# equity, place stops and limits, and react to its own fills.
+#
+# Orders placed on a bar are worked from the next bar:
+#     market  fills at the open
+#     limit   fills at the open if it is already at or better than the limit price,
+#             otherwise at the limit price once the bar's range reaches it
+#     stop    fills at the open if it has gapped through the stop price,
+#             otherwise at the stop price once the bar's range reaches it
+# Limit and stop orders stay working until they fill or are cancelled.
+#
+# Prices are read once from the strategy's data into (date x ticker) arrays and adjusted
+# by Adj Close / Close, so fills and valuations use the same adjusted prices as the rest
+# of the pipeline. The loop itself never touches a dataframe.
+
+import numpy as np
+import pandas as pd
+
+MARKET = "market"
+LIMIT = "limit"
+STOP = "stop"
+
+
+class Order:
+    __slots__ = (
+        "order_id",
+        "ticker",
+        "column",
+        "quantity",
+        "order_type",
+        "price",
+        "bar",
+    )
+
+    def __init__(self, order_id, ticker, column, quantity, order_type, price, bar):
+        self.order_id = order_id
+        self.ticker = ticker
+        self.column = column
+        # Positive to buy, negative to sell.
+        self.quantity = quantity
+        self.order_type = order_type
+        # Limit or stop price, None for market orders.
+        self.price = price
+        # Bar the order was placed on.
+        self.bar = bar
+
+    def __repr__(self):
+        return (
+            f"Order({self.order_id}, {self.ticker}, {self.quantity}, "
+            f"{self.order_type}, {self.price})"
+        )
+
+
+class Fill:
+    __slots__ = ("order_id", "ticker", "quantity", "price", "bar", "date")
+
+    def __init__(self, order_id, ticker, quantity, price, bar, date):
+        self.order_id = order_id
+        self.ticker = ticker
+        self.quantity = quantity
+        self.price = price
+        self.bar = bar
+        self.date = date
+
+    def __repr__(self):
+        return f"Fill({self.order_id}, {self.ticker}, {self.quantity}, {self.price}, {pd.Timestamp(self.date)})"
+
+
+class EventEngine:
+    def __init__(self, strategy, initial_cash=18000):
+        self.strategy = strategy
+        self.initial_cash = initial_cash
+
+        # (date x ticker x field) prices, adjusted the same way as Adj Close.
+        panel = strategy.get_panel_array(["Open", "High", "Low", "Close", "Adj Close"])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            adjustment = panel[:, :, 4] / panel[:, :, 3]
+        self.open = panel[:, :, 0] * adjustment
+        self.high = panel[:, :, 1] * adjustment
+        self.low = panel[:, :, 2] * adjustment
+        self.close = panel[:, :, 4]
+        # Positions are valued at the last close seen when a ticker has no bar.
+        self.last_close = pd.DataFrame(self.close).ffill().to_numpy()
+        self.dates = strategy.data.index.to_numpy(dtype="datetime64[ns]")
+        self.tickers = list(strategy.tickers)
+        self.columns = {ticker: column for column, ticker in enumerate(self.tickers)}
+        self.number_of_bars, self.number_of_tickers = self.close.shape
+
+        self.cash = float(initial_cash)
+        self.positions = np.zeros(self.number_of_tickers)
+        self.orders = []
+        self.fills = []
+        self.next_order_id = 0
+        self.bar = -1
+
+        # Preallocated history, recorded at every close.
+        self.cash_history = np.empty(self.number_of_bars)
+        self.position_history = np.empty((self.number_of_bars, self.number_of_tickers))
+
+    def run(self):
+        """Runs the strategy over every bar and returns the portfolio dataframe"""
+        self.strategy.on_start(self)
+        for bar in range(self.number_of_bars):
+            self.bar = bar
+            if self.orders:
+                self.fill_orders(bar)
+            self.cash_history[bar] = self.cash
+            self.position_history[bar] = self.positions
+            self.strategy.on_bar(self, bar)
+        return self.get_portfolio()
+
+    def submit_order(self, ticker, quantity, order_type=MARKET, price=None):
+        """Places an order to be worked from the next bar and returns it"""
+        if order_type not in (MARKET, LIMIT, STOP):
+            raise ValueError(f"Unknown order type: {order_type}")
+        if order_type != MARKET and price is None:
+            raise ValueError(f"A {order_type} order needs a price")
+        order = Order(
+            self.next_order_id,
+            ticker,
+            self.columns[ticker],
+            quantity,
+            order_type,
+            price,
+            self.bar,
+        )
+        self.next_order_id += 1
+        self.orders.append(order)
+        return order
+
+    def cancel_order(self, order):
+        """Cancels a working order, returns False if it has already filled or been cancelled"""
+        if order in self.orders:
+            self.orders.remove(order)
+            return True
+        return False
+
+    def order_target(self, ticker, target_quantity, order_type=MARKET, price=None):
+        """Places an order for the difference between target_quantity and the position plus working orders"""
+        column = self.columns[ticker]
+        quantity = target_quantity - self.positions[column]
+        quantity -= sum(
+            order.quantity for order in self.orders if order.column == column
+        )
+        if quantity == 0:
+            return None
+        return self.submit_order(ticker, quantity, order_type, price)
+
+    def fill_orders(self, bar):
+        open_prices, high_prices, low_prices = (
+            self.open[bar],
+            self.high[bar],
+            self.low[bar],
+        )
+        working = []
+        for order in self.orders:
+            column = order.column
+            opening = open_prices[column]
+            price = np.nan
+            if order.order_type == MARKET:
+                price = opening
+            elif (order.order_type == LIMIT) == (order.quantity > 0):
+                # Buy limit or sell stop: filled at or below the order price.
+                if opening <= order.price:
+                    price = opening
+                elif low_prices[column] <= order.price:
+                    price = order.price
+            else:
+                # Sell limit or buy stop: filled at or above the order price.
+                if opening >= order.price:
+                    price = opening
+                elif high_prices[column] >= order.price:
+                    price = order.price
+
+            # Not triggered, or no price on this bar (the ticker wasn't trading).
+            if price != price:
+                working.append(order)
+                continue
+            self.cash -= order.quantity * price
+            self.positions[column] += order.quantity
+            self.fills.append(
+                Fill(
+                    order.order_id,
+                    order.ticker,
+                    order.quantity,
+                    price,
+                    bar,
+                    self.dates[bar],
+                )
+            )
+        self.orders = working
+
+    def get_position(self, ticker):
+        return self.positions[self.columns[ticker]]
+
+    def get_equity(self):
+        """Returns cash plus the positions valued at the last close up to the current bar"""
+        closes = self.last_close[max(self.bar, 0)]
+        # Still NaN only before a ticker's first bar, where nothing can be held.
+        return self.cash + np.nansum(self.positions * closes)
+
+    def get_portfolio(self):
+        """
+        Returns a dataframe with the value held in each ticker, cash and "Portfolio Value"
+        at every close, the same columns as PortfolioConstructor.get_portfolio
+        """
+        index = pd.DatetimeIndex(self.dates, name="Date")
+        holdings = self.position_history * np.nan_to_num(self.last_close)
+        df = pd.DataFrame(holdings, index=index, columns=self.tickers)
+        df["cash"] = self.cash_history
+        df["Portfolio Value"] = holdings.sum(axis=1) + self.cash_history
+        return df
+
+    def get_fills(self):
+        """Returns every fill as a dataframe"""
+        return pd.DataFrame(
+            {
+                "Order": [fill.order_id for fill in self.fills],
+                "Ticker": [fill.ticker for fill in self.fills],
+                "Quantity": [fill.quantity for fill in self.fills],
+                "Price": [fill.price for fill in self.fills],
+                "Date": pd.DatetimeIndex([fill.date for fill in self.fills]),
+            }
+        )
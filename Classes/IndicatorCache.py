@@ -0,0 +1,108 @@
+# Memoizes indicator series so composed indicators (MACD -> EMAs), several strategies
+# and parameter sweeps share results instead of recomputing full-history windows.
+#
+# Entries are keyed by (ticker, field, indicator, params, data version), where the
+# data version is a hash of the input prices, so a changed price history never hits
+# a stale entry. The cache holds at most max_bytes in memory and evicts the least
+# recently used entries, optionally spilling them to disk to be read back later.
+# Cached values are shared between callers and should be treated as read-only.
+
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def get_data_version(values):
+    """Returns a short hash of a Series/DataFrame (values and index) to key cache entries by"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(values.index.asi8).tobytes())
+    digest.update(np.ascontiguousarray(values.to_numpy(dtype=np.float64)).tobytes())
+    if isinstance(values, pd.DataFrame):
+        digest.update(repr(list(values.columns)).encode())
+    return digest.hexdigest()
+
+
+class IndicatorCache:
+    def __init__(self, max_bytes=256 * 1024**2, spill_directory=None):
+        self.max_bytes = max_bytes
+        self.spill_directory = spill_directory
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        """Returns the cached value for key, calling compute() and storing the result on a miss"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        value = self.read_spilled(key)
+        if value is None:
+            self.misses += 1
+            value = compute()
+        else:
+            self.hits += 1
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        if key in self.entries:
+            self.remove(key)
+        size = self.get_size(value)
+        self.entries[key] = value
+        self.sizes[key] = size
+        self.total_bytes += size
+        # Evict least recently used entries, but always keep the newest one.
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            oldest_key = next(iter(self.entries))
+            self.spill(oldest_key, self.entries[oldest_key])
+            self.remove(oldest_key)
+
+    def remove(self, key):
+        del self.entries[key]
+        self.total_bytes -= self.sizes.pop(key)
+
+    def clear(self):
+        self.entries.clear()
+        self.sizes.clear()
+        self.total_bytes = 0
+
+    @staticmethod
+    def get_size(value):
+        if isinstance(value, pd.DataFrame):
+            return int(value.memory_usage(index=True).sum())
+        if isinstance(value, pd.Series):
+            return int(value.memory_usage(index=True))
+        return int(getattr(value, "nbytes", 0))
+
+    def get_spill_path(self, key):
+        name = hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+        return os.path.join(self.spill_directory, name + ".pkl")
+
+    def spill(self, key, value):
+        """Writes an evicted entry to disk when a spill directory is set"""
+        if self.spill_directory is None:
+            return
+        os.makedirs(self.spill_directory, exist_ok=True)
+        path = self.get_spill_path(key)
+        if not os.path.exists(path):
+            pd.to_pickle(value, path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+    def read_spilled(self, key):
+        if self.spill_directory is None:
+            return None
+        path = self.get_spill_path(key)
+        if not os.path.exists(path):
+            return None
+        return pd.read_pickle(path)
+
+
+# Shared by every StrategyBrain that isn't given its own cache.
+default_indicator_cache = IndicatorCache()
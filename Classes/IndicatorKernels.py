@@ -0,0 +1,162 @@
+# Indicator kernels working on contiguous float64 arrays of a single field.
+#
+# Every kernel takes a 1d array (one ticker) or a 2d (date x ticker) array and works
+# along the first axis, so universe mode runs all tickers in one call. NaNs follow
+# the pandas conventions used by StrategyBrain: a rolling window with a NaN in it is
+# NaN, and the EMA skips NaNs while still decaying the weights of older values.
+#
+# Rolling sums are taken as differences of running (prefix) sums, which makes every
+# window O(1). The running sums restart every BLOCK_SIZE rows so rounding error
+# stays bounded by one block rather than growing with the length of the history.
+
+import numpy as np
+from scipy.signal import lfilter
+
+BLOCK_SIZE = 1024
+
+
+def as_float_array(values):
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+
+def block_prefix_sums(values, block):
+    """Returns running sums restarting at every block of rows, and the total of every block"""
+    length = len(values)
+    padded_length = -(-length // block) * block
+    padded = np.zeros((padded_length,) + values.shape[1:])
+    padded[:length] = values
+    blocks = np.cumsum(padded.reshape((-1, block) + values.shape[1:]), axis=1)
+    return blocks.reshape(padded.shape)[:length], blocks[:, -1]
+
+
+def window_sums(values, window):
+    """Returns the sum of the trailing window at every row (partial windows at the start)"""
+    values = as_float_array(values)
+    block = max(BLOCK_SIZE, window)
+    prefix, totals = block_prefix_sums(values, block)
+
+    sums = prefix.copy()
+    sums[window:] -= prefix[:-window]
+    # Windows starting in the previous block (window <= block) also need the rest of
+    # that block, which is its total minus the running sum already subtracted.
+    for start in range(block, len(values), block):
+        sums[start : start + window] += totals[start // block - 1]
+    return sums
+
+
+def window_counts(valid, window):
+    """Returns the number of valid rows in the trailing window at every row"""
+    counts = np.cumsum(valid, axis=0)
+    counts[window:] = counts[window:] - counts[:-window]
+    return counts
+
+
+def rolling_sum(values, window):
+    """Returns the trailing rolling sum, NaN until the window is full or if it holds a NaN"""
+    values = as_float_array(values)
+    valid = ~np.isnan(values)
+    sums = window_sums(np.where(valid, values, 0.0), window)
+    sums[window_counts(valid, window) < window] = np.nan
+    return sums
+
+
+def sma(values, window):
+    """Returns the simple moving average over the trailing window"""
+    return rolling_sum(values, window) / window
+
+
+def rolling_std(values, window, ddof=1):
+    """
+    Returns the rolling standard deviation over the trailing window.
+
+    Welford's recurrence is sequential, so this takes the same route to stability
+    in vectorised form: sums and sums of squares are taken of values shifted by the
+    mean of their block, so they stay small and S2 - S1^2 / n doesn't cancel away
+    the variance. The part of a window in the previous block is moved onto the
+    current block's shift with the usual shifted-moment identities.
+    """
+    values = as_float_array(values)
+    valid = ~np.isnan(values)
+    has_gaps = not valid.all()
+    length = len(values)
+    block = max(BLOCK_SIZE, window)
+    number_of_blocks = -(-length // block)
+    padded = np.zeros((number_of_blocks * block,) + values.shape[1:])
+    padded[:length] = np.where(valid, values, 0.0) if has_gaps else values
+    blocks = padded.reshape((number_of_blocks, block) + values.shape[1:])
+
+    # Mean of the valid values in every block, used as that block's shift.
+    if has_gaps:
+        counts = np.cumsum(valid, axis=0)
+        padded_valid = np.zeros(padded.shape, dtype=bool)
+        padded_valid[:length] = valid
+        block_counts = padded_valid.reshape(blocks.shape).sum(axis=1)
+    else:
+        block_counts = np.minimum(block, length - np.arange(number_of_blocks) * block)
+        block_counts = block_counts.reshape((-1,) + (1,) * (values.ndim - 1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shifts = np.nan_to_num(blocks.sum(axis=1) / block_counts)
+    shifted = blocks - shifts[:, np.newaxis]
+    if has_gaps:
+        shifted.reshape(padded.shape)[:length][~valid] = 0.0
+
+    prefix = np.cumsum(shifted, axis=1)
+    prefix_squares = np.cumsum(shifted * shifted, axis=1)
+    totals, totals_squares = prefix[:, -1], prefix_squares[:, -1]
+    prefix = prefix.reshape(padded.shape)[:length]
+    prefix_squares = prefix_squares.reshape(padded.shape)[:length]
+
+    sum_of_values = prefix.copy()
+    sum_of_squares = prefix_squares.copy()
+    sum_of_values[window:] -= prefix[:-window]
+    sum_of_squares[window:] -= prefix_squares[:-window]
+
+    for start in range(block, length, block):
+        # Rows of these windows in the previous block, moved onto this block's shift.
+        # The running sums at the leaving rows were already subtracted above.
+        rows = slice(start, min(start + window, length))
+        leaving = slice(start - window, rows.stop - window)
+        previous = start // block - 1
+        earlier_values = totals[previous] - prefix[leaving]
+        if has_gaps:
+            earlier_counts = counts[start - 1] - counts[leaving]
+        else:
+            earlier_counts = np.arange(window - 1, window - 1 - (rows.stop - start), -1)
+            earlier_counts = earlier_counts.reshape((-1,) + (1,) * (values.ndim - 1))
+        delta = shifts[previous] - shifts[previous + 1]
+        sum_of_values[rows] += totals[previous] + earlier_counts * delta
+        sum_of_squares[rows] += (
+            totals_squares[previous]
+            + 2 * delta * earlier_values
+            + earlier_counts * delta * delta
+        )
+
+    variance = (sum_of_squares - sum_of_values * sum_of_values / window) / (
+        window - ddof
+    )
+    standard_deviation = np.sqrt(np.maximum(variance, 0.0))
+    if has_gaps:
+        standard_deviation[window_counts(valid, window) < window] = np.nan
+    else:
+        standard_deviation[: window - 1] = np.nan
+    return standard_deviation
+
+
+def ema(values, span, min_periods=0):
+    """
+    Returns the exponential moving average with the pandas ewm(span=span, adjust=True)
+    weighting, computed with the recursions
+        numerator(t)   = x(t) + (1 - alpha) * numerator(t - 1)
+        denominator(t) = 1    + (1 - alpha) * denominator(t - 1)
+    run as a linear filter. NaNs add nothing to either sum but still decay them.
+    """
+    values = as_float_array(values)
+    alpha = 2 / (span + 1)
+    valid = ~np.isnan(values)
+    coefficients = [1.0, -(1 - alpha)]
+    numerator = lfilter([1.0], coefficients, np.where(valid, values, 0.0), axis=0)
+    denominator = lfilter([1.0], coefficients, valid.astype(np.float64), axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average = numerator / denominator
+    average[np.cumsum(valid, axis=0) < max(min_periods, 1)] = np.nan
+    return average
@@ -0,0 +1,163 @@
+# Timing instrumentation for the pipeline stages.
+#
+# The public stages of StrategyBrain, PortfolioConstructor, TradeAnalysis and
+# PortfolioAnalysis are wrapped with @timed, and smaller steps with
+# instrumentation.timer("name"). Both only check a flag while instrumentation is off.
+# Once it is on, every stage records its number of calls, total and longest time and,
+# optionally, the peak memory it allocated (traced with tracemalloc).
+#
+# Turn it on in code:
+#     from Classes.Instrumentation import instrumentation
+#     instrumentation.enable(memory=True)
+#     ... run the pipeline ...
+#     instrumentation.print_report()
+#
+# or without touching the code, with BACKTEST_INSTRUMENTATION=1 (or =memory) in the
+# environment, which prints the report when the process exits. Times include nested
+# stages, e.g. PortfolioConstructor.__init__ includes construct_sweep. Worker
+# processes (BacktestExecutor, WalkForward) keep their own records.
+
+import atexit
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+
+class StageTimer:
+    __slots__ = ("instrumentation", "stage", "start")
+
+    def __init__(self, instrumentation, stage):
+        self.instrumentation = instrumentation
+        self.stage = stage
+
+    def __enter__(self):
+        if self.instrumentation.enabled:
+            self.start = self.instrumentation.start_stage()
+        else:
+            self.start = None
+        return self
+
+    def __exit__(self, *exception):
+        if self.start is not None:
+            self.instrumentation.end_stage(self.stage, self.start)
+        return False
+
+
+class Instrumentation:
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.records = {}
+        # [allocated at the start, peak so far] of every stage currently running.
+        self.memory_stack = []
+
+    def enable(self, memory=False):
+        self.enabled = True
+        self.trace_memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        self.enabled = False
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.trace_memory = False
+
+    def reset(self):
+        self.records = {}
+        self.memory_stack = []
+
+    def timer(self, stage):
+        """Returns a context manager recording the time spent in the block as stage"""
+        return StageTimer(self, stage)
+
+    def start_stage(self):
+        if self.trace_memory:
+            allocated, peak = tracemalloc.get_traced_memory()
+            # The outer stage keeps the peak reached so far before it is reset.
+            if self.memory_stack:
+                self.memory_stack[-1][1] = max(self.memory_stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            self.memory_stack.append([allocated, allocated])
+        return time.perf_counter()
+
+    def end_stage(self, stage, start):
+        seconds = time.perf_counter() - start
+        record = self.records.get(stage)
+        if record is None:
+            record = self.records[stage] = {
+                "calls": 0,
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+                "peak_memory_bytes": None,
+            }
+        record["calls"] += 1
+        record["total_seconds"] += seconds
+        record["max_seconds"] = max(record["max_seconds"], seconds)
+
+        if self.trace_memory and self.memory_stack:
+            allocated, peak = self.memory_stack.pop()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            if self.memory_stack:
+                self.memory_stack[-1][1] = max(self.memory_stack[-1][1], peak)
+            record["peak_memory_bytes"] = max(
+                record["peak_memory_bytes"] or 0, peak - allocated
+            )
+
+    def get_report(self):
+        """Returns one dict per stage, the stages taking the most time first"""
+        rows = [
+            {
+                "stage": stage,
+                **record,
+                "mean_seconds": record["total_seconds"] / record["calls"],
+            }
+            for stage, record in self.records.items()
+        ]
+        return sorted(rows, key=lambda row: row["total_seconds"], reverse=True)
+
+    def to_json(self):
+        return json.dumps(self.get_report(), indent=2)
+
+    def print_report(self):
+        print(
+            f"{'Stage':<45}{'Calls':>8}{'Total (s)':>12}{'Mean (ms)':>12}"
+            f"{'Max (ms)':>12}{'Peak (MB)':>12}"
+        )
+        for row in self.get_report():
+            peak = row["peak_memory_bytes"]
+            peak = "" if peak is None else f"{peak / 1024**2:.2f}"
+            print(
+                f"{row['stage']:<45}{row['calls']:>8}{row['total_seconds']:>12.4f}"
+                f"{row['mean_seconds'] * 1000:>12.3f}{row['max_seconds'] * 1000:>12.3f}"
+                f"{peak:>12}"
+            )
+
+
+# Shared by every instrumented stage in the process.
+instrumentation = Instrumentation()
+
+
+def timed(stage=None):
+    """Decorator recording every call of a function as stage (its qualified name by default)"""
+
+    def decorator(function):
+        name = stage or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return function(*args, **kwargs)
+            with instrumentation.timer(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+if os.environ.get("BACKTEST_INSTRUMENTATION"):
+    instrumentation.enable(memory=os.environ["BACKTEST_INSTRUMENTATION"] == "memory")
+    atexit.register(instrumentation.print_report)
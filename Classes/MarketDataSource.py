@@ -0,0 +1,449 @@
+# Market data sources used by every stage of the pipeline.
+#
+# StrategyBrain, PortfolioConstructor and TradeAnalysis all read their prices
+# through a MarketDataSource so one run only fetches each ticker once and can
+# be replayed offline.
+#
+# YahooDataSource   - downloads from yfinance (network).
+# CSVDataSource     - replays <TICKER>.csv fixtures from a directory (offline).
+# InMemoryDataSource - serves dataframes already loaded, e.g. shared across a sweep.
+# SyntheticDataSource - seeded random OHLCV bars for benchmarks and offline runs.
+# ResampledDataSource - coarser bars aggregated from another source, e.g. hourly from minutes.
+# LocalDataStore    - on-disk columnar store (one .npy file per ticker and field)
+#                     that tops up missing date ranges from an upstream source.
+#
+# All sources use the same date convention as yf.download: start inclusive,
+# end exclusive. Bars can be of any frequency ("1d", "1h", "1m", ... as in
+# yf.download's interval), the index then holds the start time of every bar.
+
+import datetime as dt
+import json
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from Classes.Instrumentation import timed
+from Classes.BarFrequency import resample
+
+
+def to_timestamp(date):
+    """Returns a timezone naive pandas Timestamp for a date, datetime, string or Timestamp"""
+    timestamp = pd.Timestamp(date)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_localize(None)
+    return timestamp
+
+
+def has_business_days(start, end):
+    """Returns whether [start, end) touches a weekday, when bars could be published"""
+    last_day = (end - pd.Timedelta(1, "ns")).date() + dt.timedelta(days=1)
+    return np.busday_count(start.date(), last_day) > 0
+
+
+class MarketDataSource:
+    """Interface for anything that can supply OHLCV history for a ticker"""
+
+    fields = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+    # Length of the bars served, in yf.download's interval format (or a pandas frequency).
+    interval = "1d"
+
+    def get_history(self, ticker, start_date, end_date):
+        """Returns a dataframe of OHLCV columns for ticker between start_date (inclusive) and end_date (exclusive)"""
+        raise NotImplementedError
+
+    def get_field(self, tickers, field, start_date, end_date):
+        """Returns a date x ticker dataframe of one field (e.g. "Adj Close") for the tickers"""
+        return pd.DataFrame(
+            {
+                ticker: self.get_history(ticker, start_date, end_date)[field]
+                for ticker in tickers
+            }
+        )
+
+    def get_panel(self, tickers, start_date, end_date):
+        """
+        Returns a dataframe with (field, ticker) columns, the same shape as
+        yf.download for a list of tickers, so data["Adj Close"][ticker] works.
+        """
+        frames = {
+            ticker: self.get_history(ticker, start_date, end_date) for ticker in tickers
+        }
+        panel = pd.concat(frames, axis=1)
+        return panel.swaplevel(axis=1).sort_index(axis=1)
+
+
+class YahooDataSource(MarketDataSource):
+    """Downloads history from Yahoo Finance on every call"""
+
+    def __init__(self, interval="1d"):
+        self.interval = interval
+
+    @timed()
+    def get_history(self, ticker, start_date, end_date):
+        df = yf.download(
+            ticker,
+            start_date,
+            end_date,
+            interval=self.interval,
+            progress=False,
+            auto_adjust=False,
+        )
+        # Newer yfinance versions return (field, ticker) columns even for one ticker.
+        if isinstance(df.columns, pd.MultiIndex):
+            df.columns = df.columns.get_level_values(0)
+        if df.index.tz is not None:
+            df.index = df.index.tz_localize(None)
+        df.index.name = "Date"
+        return df
+
+
+class CSVDataSource(MarketDataSource):
+    """
+    Replays history from CSV fixtures, one <TICKER>.csv per ticker with a Date (or
+    Datetime for intraday bars) column followed by the OHLCV columns (the format of
+    a Yahoo Finance export).
+    """
+
+    def __init__(self, directory, interval="1d"):
+        self.directory = directory
+        self.interval = interval
+        self.frames = {}
+
+    @timed()
+    def load(self, ticker):
+        """Returns the full fixture for ticker, reading the file on first use"""
+        if ticker not in self.frames:
+            path = os.path.join(self.directory, f"{ticker}.csv")
+            df = pd.read_csv(path, index_col=0, parse_dates=[0])
+            if df.index.tz is not None:
+                df.index = df.index.tz_localize(None)
+            df.index.name = "Date"
+            self.frames[ticker] = df.sort_index()
+        return self.frames[ticker]
+
+    def get_history(self, ticker, start_date, end_date):
+        df = self.load(ticker)
+        start, end = to_timestamp(start_date), to_timestamp(end_date)
+        return df[(df.index >= start) & (df.index < end)].copy()
+
+
+class InMemoryDataSource(MarketDataSource):
+    """Serves OHLCV dataframes that are already in memory, keyed by ticker"""
+
+    def __init__(self, frames, interval="1d"):
+        self.frames = frames
+        self.interval = interval
+
+    def get_history(self, ticker, start_date, end_date):
+        df = self.frames[ticker]
+        start, end = to_timestamp(start_date), to_timestamp(end_date)
+        first = df.index.searchsorted(start, side="left")
+        last = df.index.searchsorted(end, side="left")
+        return df.iloc[first:last].copy()
+
+
+class SyntheticDataSource(InMemoryDataSource):
+    """
+    Generates OHLCV bars for any ticker from a seeded geometric Brownian motion, so
+    the whole pipeline can run (and be benchmarked) without the network.
+
+    Every ticker gets `bars` bars of the given pandas frequency from start_date, the
+    same for the same seed and ticker. drift and volatility are annual, a bar is
+    1/252 of a year for daily bars and a fraction of a trading day for intraday ones.
+    """
+
+    def __init__(
+        self,
+        bars=2520,
+        frequency="B",
+        start_date="2000-01-03",
+        seed=0,
+        drift=0.05,
+        volatility=0.2,
+    ):
+        super().__init__({}, frequency)
+        self.bars = bars
+        self.frequency = frequency
+        self.start_date = start_date
+        self.seed = seed
+        self.drift = drift
+        self.volatility = volatility
+
+    def get_history(self, ticker, start_date, end_date):
+        if ticker not in self.frames:
+            self.frames[ticker] = self.generate(ticker)
+        return super().get_history(ticker, start_date, end_date)
+
+    def get_bar_fraction(self):
+        """Returns the length of one bar in years"""
+        bar_length = pd.tseries.frequencies.to_offset(self.frequency)
+        try:
+            bars_per_day = pd.Timedelta(days=1) / pd.Timedelta(bar_length)
+        except ValueError:
+            # Calendar frequencies (business days, weeks, months) are counted in trading days.
+            start = pd.Timestamp(self.start_date)
+            trading_days = np.busday_count(start.date(), (start + bar_length).date())
+            return max(trading_days, 1) / 252
+        return 1 / (252 * max(bars_per_day, 1))
+
+    def generate(self, ticker):
+        """Returns the full OHLCV history of ticker"""
+        # crc32 rather than hash() so the prices don't change between processes.
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode())])
+        dates = pd.date_range(
+            self.start_date, periods=self.bars, freq=self.frequency, name="Date"
+        )
+        fraction = self.get_bar_fraction()
+        log_returns = rng.normal(
+            (self.drift - self.volatility**2 / 2) * fraction,
+            self.volatility * fraction**0.5,
+            self.bars,
+        )
+        close = 100 * np.exp(np.cumsum(log_returns))
+        # Opens gap a little from the previous close, highs and lows extend past both.
+        previous_close = np.concatenate([[100.0], close[:-1]])
+        bar_volatility = self.volatility * fraction**0.5
+        open_ = previous_close * np.exp(rng.normal(0, bar_volatility / 4, self.bars))
+        spread = np.abs(rng.normal(0, bar_volatility / 2, (2, self.bars)))
+        high = np.maximum(open_, close) * np.exp(spread[0])
+        low = np.minimum(open_, close) * np.exp(-spread[1])
+        volume = np.round(rng.lognormal(13, 0.5, self.bars))
+        return pd.DataFrame(
+            {
+                "Open": open_,
+                "High": high,
+                "Low": low,
+                "Close": close,
+                "Adj Close": close,
+                "Volume": volume,
+            },
+            index=dates,
+        )
+
+
+class ResampledDataSource(MarketDataSource):
+    """
+    Serves the bars of another source aggregated into bars of a pandas frequency rule
+    (e.g. "15min", "h", "W"), see BarFrequency.resample. A bin is labelled with its start
+    and is complete once the requested range covers all of it.
+    """
+
+    def __init__(self, source, rule):
+        self.source = source
+        self.interval = rule
+
+    def get_history(self, ticker, start_date, end_date):
+        return resample(
+            self.source.get_history(ticker, start_date, end_date), self.interval
+        )
+
+
+class LocalDataStore(MarketDataSource):
+    """
+    On-disk columnar store with one memory-mapped .npy file per ticker and field.
+
+    Layout:
+        <root>/<TICKER>/index.npy       int64 nanosecond timestamps (sorted)
+        <root>/<TICKER>/<Field>.npy     float64 values, one file per field
+        <root>/<TICKER>/coverage.json   date range already fetched and field names
+
+    Daily bars are stored as above and bars of any other interval under
+    <root>/<interval>/<TICKER>/, so one root can hold several intervals. The interval
+    defaults to the upstream source's.
+
+    When a requested range is not covered, only the missing ranges before and
+    after the stored coverage are fetched from the upstream source. A range the
+    upstream returns no bars for, e.g. a failed download, is fetched again next
+    time unless it falls on a weekend. With no upstream the store works offline
+    and returns whatever it holds.
+    """
+
+    def __init__(self, root, upstream=None, interval=None):
+        self.root = root
+        self.upstream = upstream
+        if interval is None:
+            interval = getattr(upstream, "interval", MarketDataSource.interval)
+        self.interval = interval
+        # Arrays are memory-mapped once per ticker and reused between calls.
+        self.arrays = {}
+
+    @timed()
+    def get_history(self, ticker, start_date, end_date):
+        start, end = to_timestamp(start_date), to_timestamp(end_date)
+        self.top_up(ticker, start, end)
+        columns = self.load(ticker)
+        if columns is None:
+            return pd.DataFrame(
+                columns=self.fields, index=pd.DatetimeIndex([], name="Date")
+            )
+
+        # Range query on the sorted index.
+        index = columns["index"]
+        first = np.searchsorted(index, start.value, side="left")
+        last = np.searchsorted(index, end.value, side="left")
+        data = {
+            field: np.array(values[first:last])
+            for field, values in columns.items()
+            if field != "index"
+        }
+        dates = pd.DatetimeIndex(
+            np.array(index[first:last]).view("datetime64[ns]"), name="Date"
+        )
+        return pd.DataFrame(data, index=dates)
+
+    def get_directory(self, ticker):
+        if self.interval == MarketDataSource.interval:
+            return os.path.join(self.root, ticker)
+        return os.path.join(self.root, self.interval, ticker)
+
+    def get_coverage(self, ticker):
+        """Returns (start, end, fields) already stored for ticker or None"""
+        path = os.path.join(self.get_directory(ticker), "coverage.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            coverage = json.load(f)
+        return (
+            pd.Timestamp(coverage["start"]),
+            pd.Timestamp(coverage["end"]),
+            coverage["fields"],
+        )
+
+    def get_missing_ranges(self, ticker, start, end):
+        """Returns the list of (start, end) ranges that are not stored yet"""
+        # Today's bars may still be partial or not published yet, and a range stored as
+        # covered is never fetched again, so coverage stops at the last completed day.
+        end = min(end, to_timestamp(dt.date.today()))
+        if start >= end:
+            return []
+        coverage = self.get_coverage(ticker)
+        if coverage is None:
+            return [(start, end)]
+        covered_start, covered_end, _ = coverage
+        # Gaps between the request and the coverage are fetched too so the
+        # stored range always stays contiguous.
+        missing = []
+        if start < covered_start:
+            missing.append((start, covered_start))
+        if end > covered_end:
+            missing.append((covered_end, end))
+        return missing
+
+    @timed()
+    def top_up(self, ticker, start, end):
+        """Fetches and stores only the ranges of [start, end) missing from the store"""
+        if self.upstream is None:
+            return
+        missing = self.get_missing_ranges(ticker, start, end)
+        if not missing:
+            return
+
+        coverage = self.get_coverage(ticker)
+        covered = [coverage[:2]] if coverage else []
+        frames = []
+        for s, e in missing:
+            frame = self.upstream.get_history(ticker, s, e)
+            # yfinance returns an empty frame when a download fails, so an empty range
+            # only counts as covered when it has no business days to fetch.
+            if len(frame) or not has_business_days(s, e):
+                covered.append((s, e))
+                frames.append(frame)
+        if not covered:
+            return
+        # The missing ranges adjoin the coverage, so the covered range stays contiguous.
+        covered_start = min(s for s, _ in covered)
+        covered_end = max(e for _, e in covered)
+        if not any(len(frame) for frame in frames):
+            # Only weekends without bars (or nothing) to add, the data stays as it is.
+            if coverage is not None and coverage[:2] != (covered_start, covered_end):
+                self.write_coverage(ticker, covered_start, covered_end, coverage[2])
+            return
+
+        stored = self.get_history_from_disk(ticker)
+        if stored is not None:
+            frames.append(stored)
+        df = pd.concat([frame for frame in frames if len(frame)])
+        df = df[~df.index.duplicated(keep="first")].sort_index()
+        self.write(ticker, df, covered_start, covered_end)
+
+    def get_history_from_disk(self, ticker):
+        """Returns everything stored for ticker as a dataframe or None"""
+        columns = self.load(ticker)
+        if columns is None:
+            return None
+        data = {
+            field: np.array(values)
+            for field, values in columns.items()
+            if field != "index"
+        }
+        dates = pd.DatetimeIndex(
+            np.array(columns["index"]).view("datetime64[ns]"), name="Date"
+        )
+        return pd.DataFrame(data, index=dates)
+
+    def write(self, ticker, df, covered_start, covered_end):
+        """
+        Writes df to the store. Every file is written to a temporary file and renamed
+        over the old one, so no file is ever half written, but the files are replaced
+        one after another: a reader loading the ticker during a write can see the new
+        index next to old fields. Top up before readers load the ticker, as
+        BacktestExecutor does before starting its workers.
+        """
+        directory = self.get_directory(ticker)
+        os.makedirs(directory, exist_ok=True)
+        # Drop the memory maps before the files underneath them are replaced.
+        self.arrays.pop(ticker, None)
+
+        index = pd.DatetimeIndex(df.index).as_unit("ns")
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        self.save_array(directory, "index", index.asi8.astype(np.int64))
+        fields = [str(field) for field in df.columns]
+        for field in fields:
+            self.save_array(directory, field, df[field].to_numpy(dtype=np.float64))
+        self.write_coverage(ticker, covered_start, covered_end, fields)
+
+    def write_coverage(self, ticker, covered_start, covered_end, fields):
+        directory = self.get_directory(ticker)
+        coverage = {
+            "start": str(covered_start),
+            "end": str(covered_end),
+            "fields": fields,
+        }
+        temp_path = os.path.join(directory, "coverage.json.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(coverage, f)
+        os.replace(temp_path, os.path.join(directory, "coverage.json"))
+
+    def save_array(self, directory, name, array):
+        path = os.path.join(directory, self.file_name(name))
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(temp_path, path)
+
+    def load(self, ticker):
+        """Returns a dict of memory-mapped arrays for ticker, or None if nothing is stored"""
+        if ticker in self.arrays:
+            return self.arrays[ticker]
+        coverage = self.get_coverage(ticker)
+        if coverage is None:
+            return None
+        directory = self.get_directory(ticker)
+        columns = {
+            "index": np.load(
+                os.path.join(directory, self.file_name("index")), mmap_mode="r"
+            )
+        }
+        for field in coverage[2]:
+            columns[field] = np.load(
+                os.path.join(directory, self.file_name(field)), mmap_mode="r"
+            )
+        self.arrays[ticker] = columns
+        return columns
+
+    @staticmethod
+    def file_name(field):
+        return field.replace(" ", "_") + ".npy"
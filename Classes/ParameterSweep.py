@@ -0,0 +1,135 @@
+# Runs a strategy over a grid of parameters, e.g. every MA_period for TestStrategy1.
+#
+# The price history is loaded once and served from memory to every stage, and the
+# indicators that don't depend on the parameters (StrategyBrain.get_shared_indicators)
+# are computed once and handed to every grid point.
+#
+# With a ResultsStore, grid points already stored for the same prices are read back
+# instead of re-run (their dates come back as strings), and new ones are stored in
+# one batch.
+
+import datetime as dt
+import itertools
+import pandas as pd
+from Classes.MarketDataSource import YahooDataSource, InMemoryDataSource
+from Classes.StrategyBrain import StrategyBrain
+from Classes.Backtest import run_backtest, run_backtest_with_artifacts
+from Classes.ResultsStore import get_history_version, get_key, make_row
+
+
+class ParameterSweep:
+    def __init__(
+        self,
+        strategy_class,
+        ticker,
+        start_date,
+        end_date,
+        param_grid,
+        data_source=None,
+        cost_model=None,
+        results_store=None,
+    ):
+        self.strategy_class = strategy_class
+        self.ticker = ticker
+        self.start_date = start_date
+        self.end_date = end_date
+        # e.g. {"MA_period": [10, 20, 50]}
+        self.param_grid = param_grid
+        self.cost_model = cost_model
+        self.results_store = results_store
+        data_source = data_source if data_source is not None else YahooDataSource()
+
+        # Positions still open are sold on the end date, so its price is loaded as well.
+        history = data_source.get_history(
+            ticker, start_date, pd.Timestamp(end_date) + dt.timedelta(days=1)
+        )
+        self.data_source = InMemoryDataSource({ticker: history}, data_source.interval)
+        self.data = StrategyBrain(
+            ticker, start_date, end_date, self.data_source
+        ).get_shared_indicators()
+
+    def get_grid(self):
+        """Returns a list of parameter dicts, one per combination in the grid"""
+        names = list(self.param_grid)
+        return [
+            dict(zip(names, values))
+            for values in itertools.product(*self.param_grid.values())
+        ]
+
+    def run_grid_point(self, params):
+        """Returns the statistics of one grid point"""
+        return run_backtest(
+            self.strategy_class,
+            self.ticker,
+            self.start_date,
+            self.end_date,
+            params,
+            self.data_source,
+            data=self.data,
+            cost_model=self.cost_model,
+        )
+
+    def run(self):
+        """Returns a dataframe with one row of parameters and statistics per grid point"""
+        if self.results_store is not None:
+            return self.run_with_store()
+        rows = []
+        for params in self.get_grid():
+            rows.append({**params, **self.run_grid_point(params)})
+        return pd.DataFrame(rows)
+
+    def run_with_store(self):
+        grid = self.get_grid()
+        data_version = get_history_version(
+            self.data_source, self.ticker, self.start_date, self.end_date
+        )
+        keys = [
+            get_key(
+                self.strategy_class,
+                params,
+                self.ticker,
+                self.start_date,
+                self.end_date,
+                data_version,
+                self.cost_model,
+            )
+            for params in grid
+        ]
+        stored = self.results_store.get_many(keys)
+
+        rows, new_results = [], []
+        for params, key in zip(grid, keys):
+            if key in stored:
+                statistics = stored[key]
+            else:
+                statistics, portfolio, trades = run_backtest_with_artifacts(
+                    self.strategy_class,
+                    self.ticker,
+                    self.start_date,
+                    self.end_date,
+                    params,
+                    self.data_source,
+                    data=self.data,
+                    cost_model=self.cost_model,
+                )
+                new_results.append(
+                    make_row(
+                        key,
+                        self.strategy_class,
+                        self.ticker,
+                        self.start_date,
+                        self.end_date,
+                        params,
+                        data_version,
+                        statistics,
+                        portfolio,
+                        trades,
+                    )
+                )
+            rows.append({**params, **statistics})
+        self.results_store.insert_many(new_results)
+        return pd.DataFrame(rows)
+
+
+# sweep = ParameterSweep(TestStrategy1, "GLD", dt.date(2019, 1, 1), dt.date(2023, 2, 2), {"MA_period": range(5, 60, 5)})
+# print(sweep.run())
@@ -1,7 +1,12 @@
 import yfinance as yf
 import datetime as dt
+import numpy as np
 import pandas as pd
 import scipy.stats as st
+from Classes import IndicatorKernels as kernels
+from Classes.Instrumentation import timed
+from Classes.BarFrequency import get_periods_per_year
+
 # import plotly.graph_objects as go
 # 1465, 2019-02-30
 
@@ -13,11 +18,16 @@ import scipy.stats as st
 
 
 class PortfolioAnalysis:
-    def __init__(self, portfolio):
+    # periods_per_year annualises the returns of each bar, by default it is worked out
+    # from the spacing of the dates (252 for daily bars, see BarFrequency.get_periods_per_year).
+    def __init__(self, portfolio, periods_per_year=None):
         self.timeseries = portfolio
         self.start_date = self.timeseries.index[0]
         self.end_date = self.timeseries.index[-1]
         self.risk_free_rate = 4
+        if periods_per_year is None:
+            periods_per_year = get_periods_per_year(self.timeseries.index)
+        self.periods_per_year = periods_per_year
 
     def get_time_period(self):
         return (self.end_date - self.start_date).days
@@ -47,17 +57,17 @@ class PortfolioAnalysis:
         return get_net_profit_percentage
 
     def get_annual_return(self):
-        time_period_days = (self.end_date - self.start_date).days
+        # Fractions of a day count too, for intraday bars.
+        time_period_years = (self.end_date - self.start_date) / dt.timedelta(days=365)
         one_plus_performance = 1 + (self.get_net_profit_percentage() * 0.01)
         annualised_return = round(
-            100 * ((one_plus_performance ** (1 / (time_period_days / 365))) - 1), 2
+            100 * ((one_plus_performance ** (1 / time_period_years)) - 1), 2
         )
         return annualised_return
 
     def get_annual_risk(self):
-        df = self.timeseries
-        df["PercentageChange"] = 100 * df["Portfolio Value"].pct_change()
-        annual_risk = round(df["PercentageChange"].std() * (252**0.5), 2)
+        percentage_change = 100 * self.timeseries["Portfolio Value"].pct_change()
+        annual_risk = round(percentage_change.std() * (self.periods_per_year**0.5), 2)
         return annual_risk
 
     def get_sharpe_ratio(self):
@@ -67,12 +77,12 @@ class PortfolioAnalysis:
         return sharpe_ratio
 
     def get_annual_downside_deviation(self):
-        df = self.timeseries
-        df["PercentageChange"] = df["Portfolio Value"].pct_change()
-        df['NegativePercentageChange'] = df['PercentageChange'].where(df['PercentageChange']<0)
-        df = df.dropna(axis=0)
-        annualised_downside_deviation = 100*df['NegativePercentageChange'].std() * (252**0.5)
-        return round(annualised_downside_deviation,2)
+        percentage_change = self.timeseries["Portfolio Value"].pct_change()
+        negative_percentage_change = percentage_change[percentage_change < 0]
+        annualised_downside_deviation = (
+            100 * negative_percentage_change.std() * (self.periods_per_year**0.5)
+        )
+        return round(annualised_downside_deviation, 2)
 
     def get_sortino_ratio(self):
         sortino_ratio = round(
@@ -88,6 +98,227 @@ class PortfolioAnalysis:
         var95 = round(-1 * Z * self.get_annual_risk() + self.get_annual_return(), 2)
         return var95
 
+    def get_statistics(self):
+        """Returns the statistics shown by print_statistics as a dict"""
+        return self.compute_all()
+
+    @timed()
+    def compute_all(self, tables=False, rolling_window=63):
+        """
+        Returns the same dict as the get_ methods would give, plus the drawdown and tail
+        risk statistics, but computes the returns once and every statistic from them,
+        without adding columns to the timeseries.
+
+        With tables=True the dict also holds the underwater curve, the rolling Sharpe
+        and volatility over rolling_window bars, and the monthly and yearly returns.
+        """
+        metrics = self.compute_metrics(
+            self.timeseries["Portfolio Value"].to_numpy(dtype=np.float64),
+            self.timeseries.index,
+            self.risk_free_rate,
+            rolling_window,
+            tables,
+            self.periods_per_year,
+        )
+        statistics = {
+            name: values[0]
+            for name, values in metrics.items()
+            if name not in self.table_names
+        }
+        if tables:
+            index = self.timeseries.index
+            for name in ["Underwater", "Rolling Sharpe", "Rolling Volatility"]:
+                statistics[name] = pd.Series(metrics[name][0], index=index, name=name)
+            months = metrics["Months"]
+            statistics["Monthly Returns"] = (
+                pd.Series(metrics["Monthly Returns"][0], index=months)
+                .groupby([months.year, months.month])
+                .first()
+                .unstack()
+                .rename_axis(index="Year", columns="Month")
+            )
+            statistics["Yearly Returns"] = pd.Series(
+                metrics["Yearly Returns"][0],
+                index=pd.Index(metrics["Years"].year, name="Year"),
+                name="Yearly Returns",
+            )
+        return statistics
+
+    # Entries of compute_metrics(tables=True) that are not one value per curve.
+    table_names = [
+        "Underwater",
+        "Rolling Sharpe",
+        "Rolling Volatility",
+        "Monthly Returns",
+        "Months",
+        "Yearly Returns",
+        "Years",
+    ]
+
+    @classmethod
+    @timed()
+    def compute_batch(cls, equity, risk_free_rate=4, periods_per_year=None):
+        """
+        Returns a table of statistics with one row per column of equity, a date x curve
+        dataframe of portfolio values (e.g. every point of a parameter sweep).
+        """
+        metrics = cls.compute_metrics(
+            equity.to_numpy(dtype=np.float64),
+            equity.index,
+            risk_free_rate,
+            periods_per_year=periods_per_year,
+        )
+        return pd.DataFrame(metrics, index=equity.columns)
+
+    @staticmethod
+    @timed()
+    def compute_metrics(
+        equity,
+        dates,
+        risk_free_rate=4,
+        rolling_window=63,
+        tables=False,
+        periods_per_year=None,
+    ):
+        """
+        Returns a dict of arrays with one value per curve for a (date x curve) array of
+        portfolio values (or a single curve). The rounding of the get_ methods is kept,
+        e.g. the annual return is worked out from the rounded Net Profits%, so the
+        numbers are the same as theirs.
+
+        Returns are annualised with periods_per_year, inferred from the dates when not
+        given. Drawdowns are in % below the running peak and durations in days from the
+        peak. Historical VaR(95) is the 5th percentile of the returns per bar in % and
+        CVaR(95) the mean of the returns at or below it. With tables=True the (curve x date)
+        underwater, rolling Sharpe and rolling volatility arrays and the (curve x period)
+        monthly and yearly returns are added, with their periods in "Months" and "Years".
+        """
+        equity = np.asarray(equity, dtype=np.float64)
+        if equity.ndim == 1:
+            equity = equity[:, np.newaxis]
+        # One contiguous row per curve, so sums over time add up in the same order as pandas.
+        curves = np.ascontiguousarray(equity.T)
+        number_of_curves = len(curves)
+        dates = pd.DatetimeIndex(dates)
+        time_period = (dates[-1] - dates[0]).days
+        time_period_years = (dates[-1] - dates[0]) / dt.timedelta(days=365)
+        if periods_per_year is None:
+            periods_per_year = get_periods_per_year(dates)
+
+        initial_capital = np.round(curves[:, 0], 2)
+        ending_capital = np.round(curves[:, -1], 2)
+        net_profit = ending_capital - initial_capital
+        net_profit_percentage = np.round(100 * (net_profit / initial_capital), 2)
+        one_plus_performance = 1 + (net_profit_percentage * 0.01)
+        annual_return = np.round(
+            100 * ((one_plus_performance ** (1 / time_period_years)) - 1), 2
+        )
+
+        # Returns are computed once. Missing values are padded forward first, like pct_change.
+        filled = pd.DataFrame(equity).ffill().to_numpy().T
+        percentage_change = filled[:, 1:] / filled[:, :-1] - 1
+        negative_percentage_change = np.where(
+            percentage_change < 0, percentage_change, np.nan
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            annual_risk = np.round(
+                PortfolioAnalysis.get_standard_deviation(100 * percentage_change)
+                * (periods_per_year**0.5),
+                2,
+            )
+            downside_deviation = np.round(
+                100
+                * PortfolioAnalysis.get_standard_deviation(negative_percentage_change)
+                * (periods_per_year**0.5),
+                2,
+            )
+            excess_return = annual_return - risk_free_rate
+            sharpe_ratio = np.round(excess_return / annual_risk, 2)
+            sortino_ratio = np.round(excess_return / downside_deviation, 2)
+        var95 = np.round(-1 * st.norm.ppf(0.95) * annual_risk + annual_return, 2)
+
+        # Drawdowns from the running peak, the bar of the last peak gives the duration.
+        running_peak = np.maximum.accumulate(filled, axis=1)
+        underwater = filled / running_peak - 1
+        bars = np.arange(filled.shape[1])
+        peak_bars = np.maximum.accumulate(
+            np.where(filled >= running_peak, bars, 0), axis=1
+        )
+        days = (dates - dates[0]).days.to_numpy()
+        max_drawdown = np.round(-100 * np.nanmin(underwater, axis=1), 2)
+        max_drawdown_duration = (days - days[peak_bars]).max(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            calmar_ratio = np.round(annual_return / max_drawdown, 2)
+
+        # Historical tail risk of the returns per bar.
+        var = np.nanpercentile(percentage_change, 5, axis=1)
+        in_tail = percentage_change <= var[:, np.newaxis]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cvar = (np.where(in_tail, percentage_change, 0.0).sum(axis=1)) / (
+                in_tail.sum(axis=1)
+            )
+
+        metrics = {
+            "Start Date": [dates[0].date()] * number_of_curves,
+            "End Date": [dates[-1].date()] * number_of_curves,
+            "Time Period": [time_period] * number_of_curves,
+            "Initial Capital": initial_capital,
+            "Peak Equity": np.round(np.nanmax(curves, axis=1), 1),
+            "Trough Equity": np.round(np.nanmin(curves, axis=1), 1),
+            "Ending Capital": ending_capital,
+            "Net Profits": net_profit,
+            "Net Profits%": net_profit_percentage,
+            "Annual Returns": annual_return,
+            "Annual Risk": annual_risk,
+            "Downside Deviation": downside_deviation,
+            "Var(95)": var95,
+            "Sharpe Ratio": sharpe_ratio,
+            "Sortino Ratio": sortino_ratio,
+            "Max Drawdown": max_drawdown,
+            "Max Drawdown Duration": max_drawdown_duration,
+            "Calmar Ratio": calmar_ratio,
+            "Historical VaR(95)": np.round(100 * var, 2),
+            "CVaR(95)": np.round(100 * cvar, 2),
+        }
+        if not tables:
+            return metrics
+
+        # Rolling windows over the returns per bar with the running sum kernels,
+        # annualised like the Sharpe Ratio and Annual Risk.
+        returns = percentage_change.T
+        rolling_volatility = (
+            100 * kernels.rolling_std(returns, rolling_window) * (periods_per_year**0.5)
+        )
+        rolling_return = 100 * periods_per_year * kernels.sma(returns, rolling_window)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rolling_sharpe = (rolling_return - risk_free_rate) / rolling_volatility
+        no_return = np.full((1, number_of_curves), np.nan)
+        metrics["Underwater"] = 100 * underwater
+        metrics["Rolling Sharpe"] = np.concatenate([no_return, rolling_sharpe]).T
+        metrics["Rolling Volatility"] = np.concatenate(
+            [no_return, rolling_volatility]
+        ).T
+
+        # Period returns from the last value of each month and year.
+        for name, frequency in [("Monthly Returns", "M"), ("Yearly Returns", "Y")]:
+            periods = dates.to_period(frequency)
+            last_bars = np.flatnonzero(np.append(periods[1:] != periods[:-1], True))
+            end_values = filled[:, last_bars]
+            start_values = np.concatenate([filled[:, :1], end_values[:, :-1]], axis=1)
+            metrics[name] = 100 * (end_values / start_values - 1)
+            metrics["Months" if frequency == "M" else "Years"] = periods[last_bars]
+        return metrics
+
+    @staticmethod
+    def get_standard_deviation(values):
+        """Returns the sample standard deviation of every row ignoring NaNs, as pandas .std()"""
+        valid = ~np.isnan(values)
+        counts = valid.sum(axis=1)
+        values = np.where(valid, values, 0.0)
+        mean = values.sum(axis=1) / counts
+        squares = np.where(valid, (mean[:, np.newaxis] - values) ** 2, 0.0)
+        return np.sqrt(squares.sum(axis=1) / (counts - 1))
+
     def display_row(self, column_one, column_two):
         column_one, column_two = str(column_one), str(column_two)
         while len(column_one) != 30:
@@ -101,30 +332,36 @@ class PortfolioAnalysis:
         print(self.timeseries)
 
     def print_statistics(self):
+        statistics = self.compute_all()
         self.display_row("", "Portfolio")
         print("-----------------------------------------")
         self.display_row("Overview", "")
-        self.display_row("Start Date", self.start_date.date())
-        self.display_row("End Date", self.end_date.date())
-        self.display_row("Time Period", f'{self.get_time_period()} Days')
-        self.display_row("Initial Capital", f"${self.get_inital_capital()}")
-        self.display_row("Peak Equity", f"${self.get_peak_equity()}")
-        self.display_row("Trough Equity", f"${self.get_trough_equity()}")
-        self.display_row("Ending Capital", f"${self.get_ending_capital()}")
-        self.display_row("Net Profits", f"${self.get_net_profit()}")
-        self.display_row("Net Profits%", f"{self.get_net_profit_percentage()}%")
-        self.display_row("Annual Returns", f"{self.get_annual_return()}%")
+        self.display_row("Start Date", statistics["Start Date"])
+        self.display_row("End Date", statistics["End Date"])
+        self.display_row("Time Period", f'{statistics["Time Period"]} Days')
+        self.display_row("Initial Capital", f"${statistics['Initial Capital']}")
+        self.display_row("Peak Equity", f"${statistics['Peak Equity']}")
+        self.display_row("Trough Equity", f"${statistics['Trough Equity']}")
+        self.display_row("Ending Capital", f"${statistics['Ending Capital']}")
+        self.display_row("Net Profits", f"${statistics['Net Profits']}")
+        self.display_row("Net Profits%", f"{statistics['Net Profits%']}%")
+        self.display_row("Annual Returns", f"{statistics['Annual Returns']}%")
         print("-----------------------------------------")
         self.display_row("Risk", "")
-        self.display_row("Annual Risk", f"{self.get_annual_risk()}%")
+        self.display_row("Annual Risk", f"{statistics['Annual Risk']}%")
+        self.display_row("Downside Deviation", f"{statistics['Downside Deviation']}%")
+        self.display_row("Var(95)", f"{statistics['Var(95)']}%")
+        self.display_row("Historical VaR(95)", f"{statistics['Historical VaR(95)']}%")
+        self.display_row("CVaR(95)", f"{statistics['CVaR(95)']}%")
+        self.display_row("Max Drawdown", f"{statistics['Max Drawdown']}%")
         self.display_row(
-            "Downside Deviation", f"{self.get_annual_downside_deviation()}%"
+            "Max Drawdown Duration", f"{statistics['Max Drawdown Duration']} Days"
         )
-        self.display_row("Var(95)", f"{self.get_var95()}%")
         print("-----------------------------------------")
         self.display_row("Risk Adjusted Return", "")
-        self.display_row("Sharpe Ratio", self.get_sharpe_ratio())
-        self.display_row("Sortino Ratio", self.get_sortino_ratio())
+        self.display_row("Sharpe Ratio", statistics["Sharpe Ratio"])
+        self.display_row("Sortino Ratio", statistics["Sortino Ratio"])
+        self.display_row("Calmar Ratio", statistics["Calmar Ratio"])
         print("-----------------------------------------")
 
     def show_equity_graph(self):
@@ -7,48 +7,205 @@
 # Output will be dataframe of:
 # Date:  Value:
 
-import yfinance as yf
+import numpy as np
 import pandas as pd
 import datetime as dt
-import warnings
+from Classes.MarketDataSource import YahooDataSource
+from Classes.TradeTable import TradeTable
+from Classes.Instrumentation import timed
+from Classes.TradingCalendar import TradingCalendar
 
-# Removes data slicing warnings
-warnings.filterwarnings("ignore")
+YEAR = pd.Timedelta(days=365).value
 
 
 class PortfolioConstructor:
-    def __init__(self, trades):
+    # engine="sweep" turns trades into dated position and cash deltas and builds the
+    # portfolio in one cumulative sum pass. engine="loop" is the original per-trade
+    # slice-writing construction, kept for checking the two give the same numbers.
+    # Each trade holds quantity x leverage shares. A CostModel (Classes/CostModel.py)
+    # adds commissions, slippage and financing, with the sweep engine only. The
+    # portfolio starts with initial_cash. For target weights instead of trades see
+    # Classes/TargetWeightConstructor.py.
+    @timed()
+    def __init__(
+        self,
+        trades,
+        data_source=None,
+        engine="sweep",
+        cost_model=None,
+        initial_cash=18000,
+    ):
         super().__init__()
-        self.cash_value = 18000
+        self.cash_value = initial_cash
+        self.data_source = data_source if data_source is not None else YahooDataSource()
+        self.cost_model = cost_model
         # self.portfolio_value = 10_000
 
-        self.tickers = self.get_tickers(trades)
-        # Define the columns for the df
-        columns = list(self.tickers)
-        columns.extend(["value", "cash"])
+        self.trades = TradeTable.from_list(trades)
+        self.tickers = self.get_tickers(self.trades)
 
         # Get portfolio start and end dates
-        start_date, end_date = self.get_start_end_dates(trades)
-        pandas_start_date, pandas_end_date = str(start_date).replace("-", ""), str(
-            end_date
-        ).replace("-", "")
+        start_date, end_date = self.get_start_end_dates(self.trades)
+
+        # The portfolio has a row for every bar of price data (days, hours, minutes...).
+        data = self.get_price_data(self.tickers, start_date, end_date)
+        date_range = data.index.rename(None)
+
+        # Add dataframe as an object attribute.
+        if engine == "sweep":
+            self.df = self.construct_sweep(date_range, data)
+        elif engine == "loop":
+            if cost_model is not None:
+                raise ValueError("The loop engine doesn't apply a cost model")
+            self.df = self.construct_loop(date_range, data)
+        else:
+            raise ValueError(f"Unknown portfolio engine: {engine}")
+        # Cash is counted in cents. Rounding also keeps a flat book exactly flat: the
+        # engines add the trades up in different orders, and leftovers of 1e-12 would
+        # otherwise count as gains and losses on bars without a position.
+        self.df[["value", "cash"]] = self.df[["value", "cash"]].round(2)
+
+    @timed()
+    def construct_sweep(self, date_range, data):
+        """
+        Builds holdings, cash and value from dated deltas in one pass.
+
+        Every trade adds +qty to its ticker on the buy bar and -qty after the sell
+        bar, pays for the shares on the buy bar and receives the proceeds on the bar
+        after the sell bar. A cumulative sum of the deltas gives the holdings and
+        cash on every bar, so the cost is O(trades + bars) rather than O(trades x bars).
+        Overlapping trades in the same ticker add up. Costs are worked out for all
+        trades at once and only change the cash paid and received.
+        """
+        trades = self.trades
+        dates = date_range.asi8
+        number_of_days = len(dates)
+        quantity = trades.quantity * trades.leverage.astype(np.float64)
+
+        # Bars and columns of every trade, located once on the int64 nanosecond axis.
+        closes = data["Adj Close"]
+        buy_rows, sell_rows, columns = self.get_trade_locations(closes, trades)
+        closes_array = closes.to_numpy(dtype=np.float64)
+        buy_prices = closes_array[buy_rows, columns]
+        sell_prices = closes_array[sell_rows, columns]
+
+        # Cash: pay on the buy bar, receive the sale proceeds from the bar after the
+        # sell bar.
+        if self.cost_model is None:
+            paid, received = quantity * buy_prices, quantity * sell_prices
+        else:
+            paid, received = self.get_trade_cash(
+                data, buy_rows, sell_rows, columns, quantity, buy_prices, sell_prices
+            )
+        cash_deltas = np.zeros(number_of_days + 1)
+        np.add.at(cash_deltas, buy_rows, -paid)
+        np.add.at(cash_deltas, sell_rows + 1, received)
+        cash = self.cash_value + np.cumsum(cash_deltas[:-1])
+        if self.cost_model is not None:
+            annual_costs = self.cost_model.get_financing_costs(
+                buy_prices, quantity, trades.leverage
+            )
+            cash -= self.get_financing(dates, buy_rows, sell_rows, annual_costs)
+
+        df = pd.DataFrame(index=date_range)
+        value = cash.copy()
+        for ticker in self.tickers:
+            column = closes.columns.get_loc(ticker)
+            in_ticker = columns == column
+            # Holdings: held from the buy date up to and including the sell date.
+            deltas = np.zeros(number_of_days + 1)
+            np.add.at(deltas, buy_rows[in_ticker], quantity[in_ticker])
+            np.add.at(deltas, sell_rows[in_ticker] + 1, -quantity[in_ticker])
+            df[ticker] = np.cumsum(deltas[:-1]) * closes_array[:, column]
+            value += df[ticker].to_numpy()
+
+        df["value"] = value
+        df["cash"] = cash
+        return df
 
-        # Choose date range for backtesting with periods being how many days ahead.
-        date_range = pd.bdate_range(start=pandas_start_date, end=pandas_end_date)
+    def get_trade_locations(self, closes, trades):
+        """
+        Returns the rows of the buy and sell dates and the column of every trade in the
+        date x ticker closes, raising KeyError for dates without a price
+        """
+        tickers, inverse = np.unique(trades.tickers, return_inverse=True)
+        columns = closes.columns.get_indexer(tickers)[inverse]
+        calendar = TradingCalendar(closes.index)
+        locations = []
+        for dates in [trades.buy_dates, trades.sell_dates]:
+            rows = calendar.get_positions(dates, "exact")
+            missing = (rows == -1) | (columns == -1)
+            if missing.any():
+                first = np.flatnonzero(missing)[0]
+                raise KeyError(
+                    f"No price for {trades.tickers[first]} on {pd.Timestamp(dates[first])}"
+                )
+            locations.append(rows)
+        return locations[0], locations[1], columns
+
+    def get_trade_cash(
+        self, data, buy_rows, sell_rows, columns, quantity, buy_prices, sell_prices
+    ):
+        """
+        Returns the cash every trade pays on entry and receives on exit, after slippage
+        and commissions
+        """
+        cost_model = self.cost_model
+        # Volumes are only read when the model has a participation term.
+        if cost_model.impact and "Volume" in data.columns.get_level_values(0):
+            volumes = (
+                data["Volume"]
+                .reindex(columns=data["Adj Close"].columns)
+                .to_numpy(dtype=np.float64)
+            )
+            buy_volumes = volumes[buy_rows, columns]
+            sell_volumes = volumes[sell_rows, columns]
+        else:
+            buy_volumes = sell_volumes = np.full(len(quantity), np.nan)
+        # A long buys on entry and sells on exit, a short (negative quantity) the other
+        # way round.
+        buy_fills = cost_model.get_fill_prices(buy_prices, quantity, buy_volumes)
+        sell_fills = cost_model.get_fill_prices(sell_prices, -quantity, sell_volumes)
+        buy_commissions = cost_model.get_commissions(buy_fills, quantity)
+        sell_commissions = cost_model.get_commissions(sell_fills, quantity)
+        paid = quantity * buy_fills + buy_commissions
+        received = quantity * sell_fills - sell_commissions
+        return paid, received
+
+    @staticmethod
+    def get_financing(dates, buy_rows, sell_rows, annual_costs):
+        """
+        Returns the financing paid up to every bar, with each trade's annual cost
+        accrued over the calendar time from its buy bar to its sell bar
+        """
+        # Cost per year of the trades open over each bar, from dated deltas like the
+        # holdings.
+        deltas = np.zeros(len(dates) + 1)
+        np.add.at(deltas, buy_rows + 1, annual_costs)
+        np.add.at(deltas, sell_rows + 1, -annual_costs)
+        years = np.diff(dates, prepend=dates[:1]) / YEAR
+        return np.cumsum(np.cumsum(deltas[:-1]) * years)
+
+    @timed()
+    def construct_loop(self, date_range, data):
+        """Builds the portfolio by writing every trade into slices of the dataframe"""
+        # Define the columns for the df
+        columns = list(self.tickers)
+        columns.extend(["value", "cash"])
         # Create dataframe with index as date fill in values as 0.
         df = pd.DataFrame(index=date_range, columns=columns).fillna(0)
         # Set cash column to inital portfolio cash value
         df["cash"] = self.cash_value
-        data = self.get_yf_data(self.tickers, start_date, end_date)
 
         # Set each value in the dataframe with the quantity of stock bought.
         # BUY
-        for trade in trades:
+        for trade in self.trades:
             utid, ticker, qty, leverage, buy_date, sell_date = trade
-            df[ticker].loc[buy_date:sell_date] = qty  # *leverage
+            qty *= leverage
+            df.loc[buy_date:sell_date, ticker] = qty
 
             # Subtract the value of the trade from cash every buy
-            df["cash"].loc[buy_date:] -= qty * data["Adj Close"][ticker][str(buy_date)]
+            df.loc[buy_date:, "cash"] -= qty * data["Adj Close"][ticker].loc[buy_date]
 
         # Use price of each stock from the yfinance data and use vectorisation to multiply
         # this by the quantity of the stock we have for each time series.
@@ -56,11 +213,14 @@ class PortfolioConstructor:
             df[ticker] *= data["Adj Close"][ticker]
 
         # SELL
-        for trade in trades:
+        for trade in self.trades:
             utid, ticker, qty, leverage, buy_date, sell_date = trade
-            # Add the value of the stock to cash on the sell date. Will appear in cash on day after.
-            df["cash"].loc[sell_date + dt.timedelta(days=1) :] += (
-                qty * data["Adj Close"][ticker][str(sell_date)]
+            qty *= leverage
+            # Add the value of the stock to cash on the sell date. Will appear in cash
+            # on the bar after.
+            next_bar = df.index.searchsorted(sell_date, "right")
+            df.iloc[next_bar:, df.columns.get_loc("cash")] += (
+                qty * data["Adj Close"][ticker].loc[sell_date]
             )
 
         # Add up each column to get total value column for each time series.
@@ -68,29 +228,25 @@ class PortfolioConstructor:
             df["value"] += df[ticker]
 
         df["value"] += df["cash"]
-
-        # Add dataframe as an object attribute.
-        self.df = df
+        return df
 
     def get_tickers(self, trades):
         """Returns a list of tickers for all tickers traded in trades"""
-        tickers = set([trade[1] for trade in trades])
-        return tickers
-
-    def get_yf_data(self, tickers, start_date, end_date):
-        """Returns a dataframe of tickers for the date range provided"""
-        tickers = list(tickers)
-
-        # Append an empty string to handle bug of only one ticker being passed
-        tickers.append("AAPL")
+        return TradeTable.from_list(trades).get_tickers()
 
-        return yf.download(tickers, start_date, end_date, progress=False)
+    @timed()
+    def get_price_data(self, tickers, start_date, end_date):
+        """
+        Returns a dataframe of tickers for the date range provided, with (field, ticker)
+        columns
+        """
+        return self.data_source.get_panel(sorted(tickers), start_date, end_date)
 
     def get_start_end_dates(self, trades):
         """Returns the start and end dates for the given trades"""
-        start_date, end_date = min([trade[4] for trade in trades]), max(
-            [trade[5] for trade in trades]
-        )
+        trades = TradeTable.from_list(trades)
+        start_date = pd.Timestamp(trades.buy_dates.min())
+        end_date = pd.Timestamp(trades.sell_dates.max())
         # print(end_date)
         return start_date, end_date + dt.timedelta(days=1)
 
@@ -98,6 +254,7 @@ class PortfolioConstructor:
         print(self.df)
         print("min cash", min(self.df["cash"]))
 
+    @timed()
     def get_portfolio(self):
         self.df = self.df.rename({'value':'Portfolio Value'}, axis=1).dropna(axis=0)        
         return self.df
@@ -0,0 +1,330 @@
+# Local database of backtest results, so sweeps can be queried and not re-run.
+#
+# Layout:
+#     <root>/results.sqlite             one row per run: its configuration, the headline
+#                                       statistics as indexed columns, and every statistic
+#                                       as JSON
+#     <root>/artifacts/<ab>/<key>.npz   the run's equity curve and trade table
+#
+# A run is keyed by a hash of the strategy, its params, the ticker, the date range, a
+# hash of the prices it ran on (the data version) and the cost model, so changed prices
+# or costs never hit an old result. SQLite runs in WAL mode: readers don't block the
+# writer and worker processes can each insert their batches into the same database
+# (writers wait for each other for up to `timeout` seconds).
+#
+#     store = ResultsStore("results")
+#     store.get_top("Sharpe Ratio", 10, max_drawdown=20)
+
+import datetime as dt
+import hashlib
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+from Classes.IndicatorCache import get_data_version
+from Classes.TradeTable import TradeTable
+
+# Statistics stored as their own indexed columns, the rest are only in the JSON.
+METRIC_COLUMNS = {
+    "Trades": "trades",
+    "Net Profits%": "net_profit_percentage",
+    "Annual Returns": "annual_return",
+    "Annual Risk": "annual_risk",
+    "Sharpe Ratio": "sharpe_ratio",
+    "Sortino Ratio": "sortino_ratio",
+    "Max Drawdown": "max_drawdown",
+    "Calmar Ratio": "calmar_ratio",
+    "Win Rate": "win_rate",
+}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    key TEXT PRIMARY KEY,
+    strategy TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    params TEXT NOT NULL,
+    data_version TEXT NOT NULL,
+    created TEXT NOT NULL,
+    {", ".join(f"{column} REAL" for column in METRIC_COLUMNS.values())},
+    statistics TEXT NOT NULL,
+    artifact TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_strategy_ticker ON runs (strategy, ticker);
+CREATE INDEX IF NOT EXISTS runs_sharpe_ratio ON runs (sharpe_ratio);
+CREATE INDEX IF NOT EXISTS runs_max_drawdown ON runs (max_drawdown, sharpe_ratio);
+CREATE INDEX IF NOT EXISTS runs_annual_return ON runs (annual_return);
+"""
+
+
+def to_json_value(value):
+    """json.dumps default for numpy scalars, dates and anything else"""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def get_key(
+    strategy_class, params, ticker, start_date, end_date, data_version, cost_model=None
+):
+    """Returns the hash identifying one backtest configuration"""
+    configuration = {
+        "strategy": f"{strategy_class.__module__}.{strategy_class.__qualname__}",
+        "params": params,
+        "ticker": ticker,
+        "start_date": pd.Timestamp(start_date).isoformat(),
+        "end_date": pd.Timestamp(end_date).isoformat(),
+        "data_version": data_version,
+        "costs": None if cost_model is None else vars(cost_model),
+    }
+    text = json.dumps(configuration, sort_keys=True, default=to_json_value)
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def get_history_version(data_source, ticker, start_date, end_date):
+    """Returns the data version of the prices a backtest of ticker over the range runs on"""
+    # Positions still open are sold on the end date, so its price is used too.
+    history = data_source.get_history(
+        ticker, start_date, pd.Timestamp(end_date) + dt.timedelta(days=1)
+    )
+    return get_data_version(history)
+
+
+def make_row(
+    key,
+    strategy_class,
+    ticker,
+    start_date,
+    end_date,
+    params,
+    data_version,
+    statistics,
+    portfolio=None,
+    trades=None,
+):
+    """Returns the row ResultsStore.insert_many expects for one backtest"""
+    return {
+        "key": key,
+        "strategy": strategy_class.__name__,
+        "ticker": ticker,
+        "start_date": start_date,
+        "end_date": end_date,
+        "params": params,
+        "data_version": data_version,
+        "statistics": statistics,
+        "equity": portfolio,
+        "trades": trades,
+    }
+
+
+class ResultsStore:
+    def __init__(self, root, timeout=60):
+        self.root = root
+        self.timeout = timeout
+        os.makedirs(os.path.join(root, "artifacts"), exist_ok=True)
+        # Opened on first use, so a store can be handed to worker processes by root.
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(
+                os.path.join(self.root, "results.sqlite"), timeout=self.timeout
+            )
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(SCHEMA)
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __getstate__(self):
+        return {"root": self.root, "timeout": self.timeout, "connection": None}
+
+    def get_artifact_path(self, key):
+        return os.path.join(self.root, "artifacts", key[:2], key + ".npz")
+
+    def write_artifact(self, key, equity=None, trades=None):
+        """Writes the equity curve (a Series or "Portfolio Value" dataframe) and trades of a run"""
+        arrays = {}
+        if equity is not None:
+            if isinstance(equity, pd.DataFrame):
+                equity = equity["Portfolio Value"]
+            arrays["dates"] = pd.DatetimeIndex(equity.index).as_unit("ns").asi8
+            arrays["equity"] = equity.to_numpy(dtype=np.float64)
+        if trades is not None:
+            trades = TradeTable.from_list(trades)
+            arrays["utid"] = trades.utids.astype(np.int64)
+            arrays["ticker"] = trades.tickers
+            arrays["quantity"] = trades.quantity.astype(np.float64)
+            arrays["leverage"] = trades.leverage.astype(np.float64)
+            arrays["buy_date"] = trades.buy_dates.view(np.int64)
+            arrays["sell_date"] = trades.sell_dates.view(np.int64)
+        if not arrays:
+            return None
+        path = self.get_artifact_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(path + ".tmp", path)
+        return os.path.relpath(path, self.root)
+
+    def insert(self, row):
+        self.insert_many([row])
+
+    def insert_many(self, rows):
+        """
+        Stores many runs in one transaction. Every row is a dict with key, strategy,
+        ticker, start_date, end_date, params, data_version and statistics, and optionally
+        the equity curve and trades to keep as artifacts. A run already stored is replaced.
+        """
+        created = dt.datetime.now().isoformat(timespec="seconds")
+        records = []
+        for row in rows:
+            statistics = row["statistics"]
+            artifact = self.write_artifact(
+                row["key"], row.get("equity"), row.get("trades")
+            )
+            records.append(
+                (
+                    row["key"],
+                    row["strategy"],
+                    str(row["ticker"]),
+                    pd.Timestamp(row["start_date"]).isoformat(),
+                    pd.Timestamp(row["end_date"]).isoformat(),
+                    json.dumps(row["params"], sort_keys=True, default=to_json_value),
+                    row["data_version"],
+                    created,
+                    *[self.to_real(statistics.get(name)) for name in METRIC_COLUMNS],
+                    json.dumps(statistics, default=to_json_value),
+                    artifact,
+                )
+            )
+        columns = [
+            "key",
+            "strategy",
+            "ticker",
+            "start_date",
+            "end_date",
+            "params",
+            "data_version",
+            "created",
+            *METRIC_COLUMNS.values(),
+            "statistics",
+            "artifact",
+        ]
+        connection = self.connect()
+        with connection:
+            connection.executemany(
+                f"INSERT OR REPLACE INTO runs ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                records,
+            )
+
+    @staticmethod
+    def to_real(value):
+        """Returns a statistic as a float for SQLite, None when missing or not a number"""
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return None
+        return value if np.isfinite(value) else None
+
+    def get_many(self, keys):
+        """Returns {key: statistics} for the keys already stored"""
+        keys = list(keys)
+        statistics = {}
+        connection = self.connect()
+        # SQLite limits the number of parameters in one statement.
+        for first in range(0, len(keys), 500):
+            batch = keys[first : first + 500]
+            cursor = connection.execute(
+                f"SELECT key, statistics FROM runs WHERE key IN ({', '.join('?' * len(batch))})",
+                batch,
+            )
+            for key, text in cursor:
+                statistics[key] = json.loads(text)
+        return statistics
+
+    def get(self, key):
+        """Returns the statistics of a stored run or None"""
+        return self.get_many([key]).get(key)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def query(self, where=None, parameters=(), order_by=None, limit=None):
+        """
+        Returns the runs matching an SQL condition on the runs columns as a dataframe,
+        with the params expanded into their own columns, e.g.
+        query("max_drawdown < ? AND ticker = ?", (20, "GLD"), "sharpe_ratio DESC", 10)
+        """
+        sql = "SELECT * FROM runs"
+        if where:
+            sql += f" WHERE {where}"
+        if order_by:
+            sql += f" ORDER BY {order_by}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        df = pd.read_sql_query(sql, self.connect(), params=list(parameters))
+        params = pd.DataFrame(
+            [json.loads(text) for text in df["params"]], index=df.index
+        )
+        df = pd.concat([df.drop(columns=["params", "statistics"]), params], axis=1)
+        return df.rename(
+            columns={column: name for name, column in METRIC_COLUMNS.items()}
+        )
+
+    def get_top(
+        self,
+        metric="Sharpe Ratio",
+        limit=10,
+        max_drawdown=None,
+        strategy=None,
+        ticker=None,
+    ):
+        """Returns the best runs by metric, e.g. the top Sharpe Ratios with Max Drawdown under 20%"""
+        conditions, parameters = [f"{METRIC_COLUMNS[metric]} IS NOT NULL"], []
+        if max_drawdown is not None:
+            conditions.append("max_drawdown < ?")
+            parameters.append(max_drawdown)
+        if strategy is not None:
+            conditions.append("strategy = ?")
+            parameters.append(strategy)
+        if ticker is not None:
+            conditions.append("ticker = ?")
+            parameters.append(ticker)
+        return self.query(
+            " AND ".join(conditions),
+            parameters,
+            f"{METRIC_COLUMNS[metric]} DESC",
+            limit,
+        )
+
+    def load_artifact(self, key):
+        """Returns the equity curve (a Series) and the trades (a TradeTable) of a run, None for any not kept"""
+        path = self.get_artifact_path(key)
+        if not os.path.exists(path):
+            return None, None
+        with np.load(path) as arrays:
+            equity = trades = None
+            if "equity" in arrays:
+                dates = pd.DatetimeIndex(arrays["dates"].view("datetime64[ns]"))
+                equity = pd.Series(
+                    arrays["equity"], index=dates, name="Portfolio Value"
+                )
+            if "utid" in arrays:
+                trades = TradeTable.from_arrays(
+                    arrays["ticker"],
+                    arrays["buy_date"].view("datetime64[ns]"),
+                    arrays["sell_date"].view("datetime64[ns]"),
+                    arrays["quantity"],
+                    arrays["leverage"],
+                    arrays["utid"],
+                )
+        return equity, trades
@@ -0,0 +1,216 @@
+# Monte Carlo robustness of a backtest: how the final return, max drawdown and Sharpe
+# ratio vary when its returns are resampled, rather than the single values of
+# PortfolioAnalysis and TradeAnalysis.
+#
+# The returns are either the return of every bar of the portfolio (from_portfolio) or
+# the return of every trade (from_trades, TradeAnalysis.get_return_list), compounded
+# one after the other. Synthetic paths are drawn with:
+#     "iid"        returns drawn with replacement
+#     "block"      circular blocks of block_length consecutive returns drawn with
+#                  replacement, keeping the autocorrelation within a block
+#     "reshuffle"  every return used once in a random order. The final return is the
+#                  same on every path, only the drawdowns and their order change
+#
+# Paths are generated as a (path x return) array, chunk_size paths at a time, so the
+# memory stays bounded however many paths are drawn.
+#
+#     analysis = MonteCarloAnalysis.from_portfolio(portfolio, method="block", seed=0)
+#     analysis.get_summary()
+
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+from Classes.BarFrequency import get_periods_per_year
+from Classes.Instrumentation import timed
+from Classes.TradeAnalysis import TradeAnalysis
+
+METHODS = ["iid", "block", "reshuffle"]
+
+# Values in one chunk of paths when chunk_size isn't given, 32 MB of float64 returns.
+CHUNK_VALUES = 4_000_000
+
+
+def get_iid_samples(rng, observations, paths, length):
+    """Returns (path x length) rows of return numbers drawn with replacement"""
+    return rng.integers(0, observations, size=(paths, length))
+
+
+def get_block_samples(rng, observations, paths, length, block_length):
+    """Returns (path x length) rows of circular blocks of consecutive return numbers"""
+    blocks = -(-length // block_length)
+    starts = rng.integers(0, observations, size=(paths, blocks, 1))
+    samples = (starts + np.arange(block_length)) % observations
+    return samples.reshape(paths, blocks * block_length)[:, :length]
+
+
+def get_reshuffle_samples(rng, observations, paths):
+    """Returns (path x observations) rows holding every return number once in a random order"""
+    return rng.permuted(
+        np.broadcast_to(np.arange(observations), (paths, observations)), axis=1
+    )
+
+
+def get_path_statistics(returns, periods_per_year, risk_free_rate=4):
+    """
+    Returns the final return %, annual return %, max drawdown % and Sharpe ratio of
+    every row of (path x return) returns, defined as in PortfolioAnalysis but unrounded
+    and annualised over returns / periods_per_year years
+    """
+    growth = np.cumprod(1 + returns, axis=1)
+    final_return = 100 * (growth[:, -1] - 1)
+    years = returns.shape[1] / periods_per_year
+    with np.errstate(invalid="ignore", divide="ignore"):
+        annual_return = 100 * (growth[:, -1] ** (1 / years) - 1)
+
+    # Paths start at 1, so a first return below zero is already a drawdown.
+    running_peak = np.maximum(np.maximum.accumulate(growth, axis=1), 1)
+    max_drawdown = -100 * np.min(growth / running_peak - 1, axis=1)
+    max_drawdown = np.maximum(max_drawdown, 0)
+
+    annual_risk = 100 * np.std(returns, axis=1, ddof=1) * periods_per_year**0.5
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sharpe_ratio = (annual_return - risk_free_rate) / annual_risk
+    return {
+        "Final Return%": final_return,
+        "Annual Returns": annual_return,
+        "Max Drawdown": max_drawdown,
+        "Sharpe Ratio": sharpe_ratio,
+    }
+
+
+class MonteCarloAnalysis:
+    """
+    returns           returns as fractions, e.g. 0.01 = 1%, in the order they happened
+    periods_per_year  returns in a year, to annualise (bars, or trades for trade returns)
+    method            "iid", "block" or "reshuffle"
+    paths             number of synthetic paths
+    length            returns per path (default: as many as there are returns)
+    block_length      returns per block of the block bootstrap
+    chunk_size        paths generated at a time (default: CHUNK_VALUES returns a chunk)
+    seed              seed of the random generator, the same seed and chunk size give
+                      the same paths
+    """
+
+    def __init__(
+        self,
+        returns,
+        periods_per_year,
+        method="iid",
+        paths=10000,
+        length=None,
+        block_length=20,
+        chunk_size=None,
+        seed=None,
+        risk_free_rate=4,
+    ):
+        if method not in METHODS:
+            raise ValueError(f"Unknown method: {method}, expected one of {METHODS}")
+        returns = np.asarray(returns, dtype=np.float64)
+        self.returns = returns[~np.isnan(returns)]
+        if len(self.returns) < 2:
+            raise ValueError("At least two returns are needed to resample")
+        if method == "reshuffle" and length not in (None, len(self.returns)):
+            raise ValueError(
+                "Reshuffled paths use every return once, length can't be changed"
+            )
+        self.periods_per_year = periods_per_year
+        self.method = method
+        self.paths = paths
+        self.length = length or len(self.returns)
+        self.block_length = min(block_length, len(self.returns))
+        self.chunk_size = chunk_size or max(1, CHUNK_VALUES // self.length)
+        self.seed = seed
+        self.risk_free_rate = risk_free_rate
+
+    @classmethod
+    def from_portfolio(cls, portfolio, periods_per_year=None, **kwargs):
+        """Resamples the returns of every bar of a "Portfolio Value" dataframe or series"""
+        if isinstance(portfolio, pd.DataFrame):
+            portfolio = portfolio["Portfolio Value"]
+        if periods_per_year is None:
+            periods_per_year = get_periods_per_year(portfolio.index)
+        returns = portfolio.ffill().pct_change().to_numpy()[1:]
+        return cls(returns, periods_per_year, **kwargs)
+
+    @classmethod
+    def from_trades(cls, trades, data_source=None, prices=None, **kwargs):
+        """
+        Resamples the return of every trade, compounded trade after trade. Returns are
+        annualised with the number of trades a year between the first buy and last sell.
+        """
+        analysis = TradeAnalysis(trades, data_source, prices=prices)
+        trades = analysis.trades
+        years = (
+            pd.Timestamp(trades.sell_dates.max()) - pd.Timestamp(trades.buy_dates.min())
+        ) / dt.timedelta(days=365)
+        returns = analysis.return_list / 100
+        return cls(returns, len(returns) / years, **kwargs)
+
+    def get_samples(self, rng, paths):
+        """Returns (path x length) rows of return numbers for one chunk of paths"""
+        observations = len(self.returns)
+        if self.method == "iid":
+            return get_iid_samples(rng, observations, paths, self.length)
+        if self.method == "block":
+            return get_block_samples(
+                rng, observations, paths, self.length, self.block_length
+            )
+        return get_reshuffle_samples(rng, observations, paths)
+
+    def generate_paths(self):
+        """Yields the (path x return) returns of every chunk of paths"""
+        rng = np.random.default_rng(self.seed)
+        for first in range(0, self.paths, self.chunk_size):
+            paths = min(self.chunk_size, self.paths - first)
+            yield self.returns[self.get_samples(rng, paths)]
+
+    def get_equity_paths(self, initial_capital=1.0):
+        """Returns the (path x return) equity of every path, for plots of a few thousand paths"""
+        return initial_capital * np.vstack(
+            [np.cumprod(1 + returns, axis=1) for returns in self.generate_paths()]
+        )
+
+    @timed()
+    def get_distributions(self):
+        """Returns a dict of arrays with the value of every statistic on every path"""
+        distributions = {}
+        first = 0
+        for returns in self.generate_paths():
+            statistics = get_path_statistics(
+                returns, self.periods_per_year, self.risk_free_rate
+            )
+            for name, values in statistics.items():
+                if name not in distributions:
+                    distributions[name] = np.empty(self.paths)
+                distributions[name][first : first + len(returns)] = values
+            first += len(returns)
+        return distributions
+
+    def get_observed(self):
+        """Returns the statistics of the returns in their original order"""
+        statistics = get_path_statistics(
+            self.returns[np.newaxis, :], self.periods_per_year, self.risk_free_rate
+        )
+        return {name: float(values[0]) for name, values in statistics.items()}
+
+    def get_summary(self, percentiles=(5, 25, 50, 75, 95), distributions=None):
+        """
+        Returns a dataframe with a row per statistic: its observed value, the mean and
+        percentiles over the paths, and the % of paths below the observed value
+        """
+        if distributions is None:
+            distributions = self.get_distributions()
+        observed = self.get_observed()
+        rows = {}
+        for name, values in distributions.items():
+            row = {"Observed": observed[name], "Mean": np.nanmean(values)}
+            for percentile, value in zip(
+                percentiles, np.nanpercentile(values, percentiles)
+            ):
+                row[f"{percentile}%"] = value
+            # Reshuffled paths only differ from the observed value by rounding errors.
+            below = (values < observed[name]) & ~np.isclose(values, observed[name])
+            row["% Below Observed"] = 100 * np.mean(below)
+            rows[name] = row
+        return pd.DataFrame.from_dict(rows, orient="index").round(2)
@@ -0,0 +1,243 @@
+# Combines many strategies into one book, from a (date x strategy) matrix of their returns.
+#
+# The covariance and correlation of the whole history are computed once, and every scheme
+# works from them:
+#     "equal"               the same weight for every strategy
+#     "inverse_volatility"  weights proportional to 1 / volatility
+#     "risk_parity"         every strategy adds the same amount to the book's variance
+#     "mean_variance"       the maximum Sharpe ratio weights, covariance^-1 x mean
+#                           returns, solved with every weight >= 0 unless
+#                           long_only=False
+# Strategies whose returns never move get no weight.
+#
+# With a window the weights are re-estimated every step bars from the window of returns up
+# to that bar. The window's sums and sums of products are updated with the bars entering
+# and leaving it, rather than the covariance being recomputed from the whole window. They
+# are recomputed from the window every RECOMPUTE_STEPS estimates, so rounding errors
+# don't build up over long histories.
+#
+# A book holds the strategies like TargetWeightConstructor holds tickers, with the growth
+# of every strategy as its price, so the weights drift between rebalances. get_books
+# returns a (date x scheme) dataframe of book values for PortfolioAnalysis.compute_batch.
+#
+#     allocator = StrategyAllocator.from_equity(equity_curves)
+#     PortfolioAnalysis.compute_batch(allocator.get_books(window=252, step=21))
+
+import numpy as np
+import pandas as pd
+import scipy.linalg as linalg
+import scipy.optimize as optimize
+from Classes.Instrumentation import timed
+from Classes.TargetWeightConstructor import TargetWeightConstructor
+
+SCHEMES = ["equal", "inverse_volatility", "risk_parity", "mean_variance"]
+RECOMPUTE_STEPS = 50
+
+
+def get_active(covariance):
+    """Returns which strategies have returns that move"""
+    return np.diag(covariance) > 0
+
+
+def get_equal_weights(covariance):
+    active = get_active(covariance)
+    return active / max(active.sum(), 1)
+
+
+def get_inverse_volatility_weights(covariance):
+    variance = np.diag(covariance)
+    with np.errstate(divide="ignore"):
+        weights = np.where(variance > 0, 1 / np.sqrt(variance), 0.0)
+    return weights / weights.sum() if weights.any() else weights
+
+
+def get_risk_parity_weights(covariance, start=None, iterations=50, tolerance=1e-10):
+    """
+    Returns the weights with equal risk contributions, by Newton's method on
+    min x'Cx / 2 - sum(log x) / N, whose solution scaled to sum to 1 is the answer.
+    start is a guess at the weights, e.g. the last rebalance's.
+    """
+    weights = np.zeros(len(covariance))
+    active = get_active(covariance)
+    if not active.any():
+        return weights
+    covariance = covariance[np.ix_(active, active)]
+    budget = 1 / len(covariance)
+    if start is not None and (start[active] > 0).all():
+        x = start[active].copy()
+    else:
+        x = 1 / np.sqrt(np.diag(covariance))
+    x /= np.sqrt(x @ covariance @ x)
+    for _ in range(iterations):
+        gradient = covariance @ x - budget / x
+        hessian = covariance + np.diag(budget / x**2)
+        step = np.linalg.solve(hessian, gradient)
+        # Shorter steps keep every weight positive.
+        scale = 1.0
+        while np.any(x - scale * step <= 0):
+            scale /= 2
+        x -= scale * step
+        if np.max(np.abs(step)) <= tolerance * np.max(x):
+            break
+    weights[active] = x / x.sum()
+    return weights
+
+
+def get_mean_variance_weights(covariance, mean, long_only=True, ridge=1e-8):
+    """
+    Returns the weights maximising the Sharpe ratio, scaled to a gross weight of 1.
+    Unconstrained they are covariance^-1 x mean. Long only they minimise
+    w'Cw / 2 - mean'w with w >= 0, which is the non-negative least squares problem
+    |L'w - L^-1 mean| for the Cholesky factor C = LL'.
+    """
+    weights = np.zeros(len(covariance))
+    active = get_active(covariance)
+    if not active.any():
+        return weights
+    covariance = covariance[np.ix_(active, active)]
+    # A little ridge keeps nearly identical strategies (e.g. neighbouring params) solvable.
+    ridge = ridge * np.trace(covariance) / len(covariance)
+    covariance = covariance + ridge * np.eye(len(covariance))
+    if long_only:
+        factor = linalg.cholesky(covariance, lower=True)
+        target = linalg.solve_triangular(factor, mean[active], lower=True)
+        weights[active] = optimize.nnls(factor.T, target)[0]
+    else:
+        weights[active] = np.linalg.solve(covariance, mean[active])
+    gross = np.abs(weights).sum()
+    # Nothing to go long of: fall back to equal weights.
+    return weights / gross if gross > 0 else active / active.sum()
+
+
+def get_weights(scheme, covariance, mean, long_only=True, start=None):
+    """Returns the weight of every strategy under a scheme"""
+    if scheme == "equal":
+        return get_equal_weights(covariance)
+    if scheme == "inverse_volatility":
+        return get_inverse_volatility_weights(covariance)
+    if scheme == "risk_parity":
+        return get_risk_parity_weights(covariance, start)
+    if scheme == "mean_variance":
+        return get_mean_variance_weights(covariance, mean, long_only)
+    raise ValueError(f"Unknown scheme: {scheme}, expected one of {SCHEMES}")
+
+
+class StrategyAllocator:
+    """
+    returns    date x strategy dataframe of returns per bar as fractions, missing returns
+               (e.g. a strategy not started yet) count as 0
+    long_only  solve the mean-variance scheme without shorting any strategy
+    """
+
+    def __init__(self, returns, long_only=True):
+        self.dates = returns.index
+        self.strategies = list(returns.columns)
+        self.returns = np.nan_to_num(returns.to_numpy(dtype=np.float64))
+        self.long_only = long_only
+        self.mean = self.returns.mean(axis=0)
+        self.covariance = np.atleast_2d(np.cov(self.returns, rowvar=False))
+        volatility = np.sqrt(np.diag(self.covariance))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.correlation = self.covariance / np.outer(volatility, volatility)
+
+    @classmethod
+    def from_equity(cls, equity, **kwargs):
+        """Returns the allocator of a date x strategy dataframe of portfolio values"""
+        return cls(equity.ffill().pct_change().iloc[1:], **kwargs)
+
+    def get_correlation(self):
+        return pd.DataFrame(
+            self.correlation, index=self.strategies, columns=self.strategies
+        )
+
+    def get_weights(self, scheme):
+        """Returns the weights of a scheme from the covariance of the whole history"""
+        weights = get_weights(scheme, self.covariance, self.mean, self.long_only)
+        return pd.Series(weights, index=self.strategies, name=scheme)
+
+    def generate_rolling_estimates(self, window, step=21):
+        """Yields the bar, mean and covariance of the window up to every step-th bar"""
+        first = last = 0
+        rows = range(window - 1, len(self.returns), step)
+        for count, row in enumerate(rows):
+            start, end = row + 1 - window, row + 1
+            if count % RECOMPUTE_STEPS == 0 or step >= window:
+                returns = self.returns[start:end]
+                sums = returns.sum(axis=0)
+                products = returns.T @ returns
+            else:
+                # Add the bars entering the window and remove the ones leaving it.
+                entering, leaving = self.returns[last:end], self.returns[first:start]
+                sums += entering.sum(axis=0) - leaving.sum(axis=0)
+                products += entering.T @ entering - leaving.T @ leaving
+            first, last = start, end
+
+            mean = sums / window
+            yield row, mean, (products - np.outer(sums, mean)) / (window - 1)
+
+    @timed()
+    def get_rolling_weights(self, window, step=21, schemes=SCHEMES):
+        """
+        Returns {scheme: (date x strategy) dataframe} of the weights of every scheme
+        estimated every step bars from the window bars up to and including that bar
+        """
+        rows = []
+        weights = {scheme: [] for scheme in schemes}
+        for row, mean, covariance in self.generate_rolling_estimates(window, step):
+            rows.append(row)
+            for scheme in schemes:
+                last = weights[scheme][-1] if weights[scheme] else None
+                weights[scheme].append(
+                    get_weights(scheme, covariance, mean, self.long_only, last)
+                )
+        return {
+            scheme: pd.DataFrame(
+                np.reshape(values, (len(rows), len(self.strategies))),
+                index=self.dates[rows],
+                columns=self.strategies,
+            )
+            for scheme, values in weights.items()
+        }
+
+    def get_growth(self):
+        """Returns the growth of $1 in every strategy, the prices its book holds"""
+        return pd.DataFrame(
+            np.cumprod(1 + self.returns, axis=0),
+            index=self.dates,
+            columns=self.strategies,
+        )
+
+    @timed()
+    def get_books(
+        self,
+        schemes=SCHEMES,
+        window=None,
+        step=21,
+        initial_cash=18000,
+        cost_model=None,
+    ):
+        """
+        Returns a (date x scheme) dataframe of the value of every scheme's book, rebalanced
+        every step bars (None = every bar). Without a window the weights come from the whole
+        history, so the book knows the future; with one, books start once the first window
+        is full.
+        """
+        growth = self.get_growth()
+        if window is not None:
+            rolling_weights = self.get_rolling_weights(window, step or 1, schemes)
+        books = {}
+        for scheme in schemes:
+            if window is None:
+                weights = self.get_weights(scheme).to_frame().T
+                weights.index = self.dates[:1]
+            else:
+                weights = rolling_weights[scheme]
+            constructor = TargetWeightConstructor(
+                weights,
+                rebalance=step,
+                initial_cash=initial_cash,
+                cost_model=cost_model,
+                prices=growth,
+            )
+            books[scheme] = constructor.df["value"]
+        return pd.DataFrame(books)
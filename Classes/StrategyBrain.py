@@ -1,66 +1,290 @@
-import yfinance as yf
 import numpy as np
 import pandas as pd
 import datetime as dt
 import matplotlib.pyplot as plt
+from Classes.MarketDataSource import YahooDataSource
+from Classes.TradeTable import TradeTable
+from Classes.IndicatorCache import default_indicator_cache, get_data_version
+from Classes import IndicatorKernels as kernels
+from Classes.StreamingIndicators import StreamingIndicators
+from Classes.Instrumentation import instrumentation, timed
+from Classes.TradingCalendar import TradingCalendar
 
 
 class StrategyBrain:
-    def __init__(self, ticker, start_date, end_date):
+    # Compact mode (compact=True) is for large universes where memory limits the number
+    # of workers. Prices and indicators are stored as float32 (indicators are still
+    # computed in float64 and rounded once), positions as int8, the trades as a compact
+    # TradeTable of int32 bar numbers, and get_indicators only adds the columns listed in
+    # required_indicators. Against float64 (see benchmarks/compact_memory.py):
+    #     prices, Volume, VWAP           relative error <= 6e-8 (one float32 rounding)
+    #     SMA, EMA, RSI, MFI             relative error <= 1.2e-7 (inputs and result rounded)
+    #     MACD, Bollinger Bands          absolute error <= 2e-7 x the price level
+    # Positions only differ where a comparison is closer than that, e.g. a close within
+    # 1e-7 of its MA. On 500 synthetic tickers x 5040 days none did, and self.data took
+    # half the memory (60% less with required_indicators = ["MA"]).
+
+    # get_indicators columns the strategy reads, e.g. ["MA"]. None adds all of them.
+    # Only used in compact mode, so the full frame is unchanged otherwise.
+    required_indicators = None
+
+    def __init__(
+        self,
+        ticker,
+        start_date,
+        end_date,
+        data_source=None,
+        data=None,
+        indicator_cache=None,
+        compact=False,
+    ):
         # super().__init__()
+        self.ticker = ticker
         self.backtest_start_date = start_date
         self.backtest_end_date = end_date
+        self.data_source = data_source if data_source is not None else YahooDataSource()
+
+        # Universe mode: a list of tickers is held as one panel with (field, ticker) columns,
+        # so self.data["Adj Close"] is a date x ticker frame and every indicator is computed
+        # for all tickers in one pass. Strategies then return date x ticker position matrices.
+        self.is_universe = not isinstance(ticker, str)
+        self.compact = compact
+        self.dtype = np.float32 if compact else np.float64
 
         # Columns - Open, High, Low, Close, Adj Close, Volume
-        self.data = yf.download(ticker, start_date, end_date, progress=False)
+        # Data already loaded (e.g. by ParameterSweep) can be passed in and is copied, not re-downloaded.
+        with instrumentation.timer("StrategyBrain.load_data"):
+            if data is not None:
+                self.data = data.copy()
+            elif self.is_universe:
+                self.data = self.data_source.get_panel(
+                    list(ticker), start_date, end_date
+                )
+            else:
+                self.data = self.data_source.get_history(ticker, start_date, end_date)
+            if compact:
+                self.data = self.data.astype(np.float32)
+        self.tickers = (
+            list(self.data["Adj Close"].columns) if self.is_universe else [ticker]
+        )
+        # Bar positions of the dates in self.data, shared by every lookup of the run.
+        self.calendar = TradingCalendar(self.data.index)
+
+        # Indicators are memoized by (ticker, field, indicator, params, data version), and the
+        # default cache is shared by every strategy in the process.
+        self.indicator_cache = (
+            indicator_cache if indicator_cache is not None else default_indicator_cache
+        )
+        self.data_versions = {}
 
     # Creates dataframe with columns for all indecators.
+    @timed()
     def get_indicators(self, MA_period):
         # self.data.drop(["Open", "High", "Low", "Close", "Volume"], axis=1, inplace=True)
-        self.data["MA"] = self.simple_moving_average(MA_period)
-        self.data["MACD"] = self.macd()
-        self.data["VWAP"] = self.vwap()
-        # TODO all indicators here...
+        if self.is_required("MA"):
+            self.set_field("MA", self.simple_moving_average(MA_period))
+        self.get_shared_indicators()
+        return self.data
+
+    # Adds the indicators that don't depend on strategy parameters. Columns already in
+    # the data (e.g. computed once by ParameterSweep) are kept rather than recomputed.
+    def get_shared_indicators(self):
+        if "MACD" not in self.data and self.is_required("MACD"):
+            self.set_field("MACD", self.macd())
+        if "VWAP" not in self.data and self.is_required("VWAP"):
+            self.set_field("VWAP", self.vwap())
         return self.data
 
-    # Gets list of tuples of alternating buy and sell signals, e.g [(Buy, date), (Sell, date), (Buy...)]
+    def is_required(self, indicator):
+        """Returns whether get_indicators adds the indicator column"""
+        if not self.compact or self.required_indicators is None:
+            return True
+        return indicator in self.required_indicators
+
+    # Returns StreamingIndicators for the get_indicators columns, already fed every bar in
+    # self.data, so new bars can be added one at a time with update(bar).
+    def get_streaming_indicators(self, MA_period):
+        streaming_indicators = StreamingIndicators(MA_period)
+        streaming_indicators.update_many(self.data)
+        return streaming_indicators
+
+    # Adds an indicator (or position) column to self.data, one column per ticker in universe mode.
+    def set_field(self, name, values):
+        self.data = self.add_field(self.data, name, values)
+
+    def add_field(self, df, name, values):
+        if not self.is_universe:
+            df[name] = values
+            return df
+        values = pd.DataFrame(np.asarray(values), index=df.index, columns=self.tickers)
+        if name in df:
+            df = df.drop(columns=name, level=0)
+        return pd.concat([df, pd.concat({name: values}, axis=1)], axis=1)
+
+    def get_panel_array(self, fields=None):
+        """Returns self.data as a (date x ticker x field) array, fields default to OHLCV"""
+        fields = fields if fields is not None else self.data_source.fields
+        if not self.is_universe:
+            return self.data[fields].to_numpy(dtype=np.float64)[:, np.newaxis, :]
+        return np.stack(
+            [
+                self.data[field][self.tickers].to_numpy(dtype=np.float64)
+                for field in fields
+            ],
+            axis=2,
+        )
+
+    # Returns an int8 position vector for each row of the dataframe, 1 = long and 0 = flat.
+    # Strategies override this with column-wise expressions, e.g. (df["Adj Close"] > df["MA"]),
+    # which in universe mode give a date x ticker position matrix.
+    # The default adapts a per-row get_signals(row) returning "BUY"/"SELL" (single ticker only).
+    def get_positions(self, indicators_df):
+        signals = indicators_df.apply(self.get_signals, axis=1)
+        return (signals == "BUY").to_numpy(dtype=np.int8)
+
+    # Adds the Position (int8) and Signal ("BUY"/"SELL") columns to the dataframe.
+    # In universe mode only the Position columns are added, one per ticker.
+    @timed()
+    def add_signals(self, indicators_df):
+        # Timed under the strategy's own name, e.g. TestStrategy1.get_positions.
+        with instrumentation.timer(f"{type(self).__name__}.get_positions"):
+            positions = np.asarray(self.get_positions(indicators_df), dtype=np.int8)
+        if self.is_universe:
+            df = self.add_field(indicators_df, "Position", positions)
+            if indicators_df is self.data:
+                self.data = df
+            return df
+        indicators_df["Position"] = positions
+        # The string column takes more memory than all the others, compact mode leaves it out.
+        if not self.compact:
+            indicators_df["Signal"] = np.where(positions == 1, "BUY", "SELL")
+        return indicators_df
+
+    # Returns (entry dates, exit dates) arrays found from the switches in the Position column.
+    # The first action is always an entry, and a position still open is sold on the backtest end date.
+    # In universe mode the position column of each trade is returned as a third array.
+    # In compact mode the dates are int32 bar numbers into get_date_axis().
+    @timed()
     def get_entry_exit_dates(self, indicators_and_signals_df):
-        entry_exit_dates = []
-        signal_list = list(indicators_and_signals_df["Signal"])
-        dates_list = list(indicators_and_signals_df.index)
-        # Loops through signals and records date at which there is a switch in signal.
-        for i, date in enumerate(dates_list):
-            # Make sure first action is a BUY.
-            if not entry_exit_dates:
-                if signal_list[i] == "BUY":
-                    entry_exit_dates.append([signal_list[i], date])
-            # On first occurence of a buy or sell (after the first buy), execute that signal.
-            elif signal_list[i] != signal_list[i - 1]:
-                entry_exit_dates.append([signal_list[i], date])
-        # Sell assets on last day if last signal was BUY.
-        if entry_exit_dates[-1][0] == "BUY":
-            entry_exit_dates.append(("SELL", pd.Timestamp(self.backtest_end_date,tz=None)))
-        return entry_exit_dates
-
-    # Creates 2d list of trades in format [UTID, Ticker, Quantity, Leverage, Buy Date, Sell Date]
-    # for Portfolio Constructor Class
+        if "Position" in indicators_and_signals_df:
+            positions = indicators_and_signals_df["Position"].to_numpy()
+        else:
+            positions = (indicators_and_signals_df["Signal"] == "BUY").to_numpy()
+        if self.compact:
+            dates = np.arange(len(indicators_and_signals_df) + 1, dtype=np.int32)
+        else:
+            dates = self.get_date_axis(indicators_and_signals_df)
+        if positions.ndim == 1:
+            entries, exits = self.get_entry_exit_indices(positions)
+            return dates[entries], dates[exits]
+
+        columns, entries, exits = self.get_entry_exit_indices(positions)
+        # Order the trades by buy date, then by ticker.
+        order = np.lexsort((columns, entries))
+        return dates[entries[order]], dates[exits[order]], columns[order]
+
+    def get_date_axis(self, df=None):
+        """Returns the dates of df (self.data by default) and the backtest end date after them"""
+        df = self.data if df is None else df
+        # The extra date is used for positions still open on the last row.
+        return np.append(
+            df.index.to_numpy(dtype="datetime64[ns]"),
+            pd.Timestamp(self.backtest_end_date, tz=None)
+            .to_datetime64()
+            .astype("datetime64[ns]"),
+        )
+
+    @staticmethod
+    def get_entry_exit_indices(positions):
+        """
+        Returns the row indices where positions are opened and closed. An exit index equal
+        to the number of rows means the position is still open at the end. For a 2d
+        (date x ticker) array, the column of each trade is returned first.
+        """
+        held = (np.asarray(positions) != 0).astype(np.int8)
+        if held.ndim == 1:
+            change = np.diff(held, prepend=0, append=0)
+            return np.flatnonzero(change == 1), np.flatnonzero(change == -1)
+
+        flat = np.zeros((1, held.shape[1]), dtype=np.int8)
+        change = np.diff(held, axis=0, prepend=flat, append=flat)
+        # Transposed so the trades come out grouped by column, entries and exits pair up in order.
+        columns, entries = np.nonzero(change.T == 1)
+        _, exits = np.nonzero(change.T == -1)
+        return columns, entries, exits
+
+    # Creates the table of trades [UTID, Ticker, Quantity, Leverage, Buy Date, Sell Date]
+    # for Portfolio Constructor Class. Use .to_list() on it for the 2d list.
+    @timed()
     def construct_trades_list(self, entry_exit_dates, ticker):
-        trades_list = []
-        number_of_trades = len(entry_exit_dates)
-        # Step = 2 as the list of entry_exit_dates alternates between buy and sell.
-        for i in range(0, number_of_trades, 2):
-            # [UTID, Ticker, Quantity, Leverage, Buy Date, Sell Date]
-            trades_list.append(
-                [
-                    i // 2,
-                    ticker,
-                    100,
-                    1,
-                    entry_exit_dates[i][1],
-                    entry_exit_dates[i + 1][1],
-                ]
+        entry_dates, exit_dates = entry_exit_dates[0], entry_exit_dates[1]
+        if len(entry_exit_dates) == 3:
+            # Universe mode: the ticker of each trade comes from its position column.
+            ticker = np.asarray(self.tickers)[entry_exit_dates[2]]
+        if self.compact:
+            return TradeTable.from_bars(
+                ticker, entry_dates, exit_dates, self.get_date_axis(), 100, 1
             )
-        return trades_list
+        return TradeTable.from_arrays(ticker, entry_dates, exit_dates, 100, 1)
+
+    # Hooks for the event-driven engine (Classes/EventEngine.py). on_start is called once
+    # before the first bar and on_bar after every close, orders placed there fill from the
+    # next bar. By default the Position column added by add_signals is followed with 100
+    # shares per position, so existing strategies run unchanged. Override on_bar to size
+    # from engine.get_equity(), place stops or limits, etc.
+    def on_start(self, engine):
+        positions = self.data["Position"]
+        if self.is_universe:
+            positions = positions[self.tickers]
+        self.target_quantities = 100 * positions.to_numpy(dtype=np.int64).reshape(
+            len(self.data), -1
+        )
+        changes = np.diff(self.target_quantities, axis=0, prepend=0)
+        self.target_change_bars = set(np.flatnonzero(np.any(changes != 0, axis=1)))
+
+    def on_bar(self, engine, bar):
+        if bar not in self.target_change_bars:
+            return
+        for ticker, quantity in zip(self.tickers, self.target_quantities[bar]):
+            engine.order_target(ticker, quantity)
+
+    def cached(self, indicator, fields, params, compute):
+        """Returns compute() memoized in the indicator cache, treat the result as read-only"""
+        key = (
+            str(self.ticker),
+            fields,
+            indicator,
+            params,
+            tuple(self.get_data_version(field) for field in fields),
+            np.dtype(self.dtype).name,
+        )
+        return self.indicator_cache.get(key, compute)
+
+    def get_data_version(self, field):
+        """
+        Returns the hash of a price field used in indicator cache keys. It is computed once,
+        call reset_data_versions() after changing prices in self.data in place.
+        """
+        if field not in self.data_versions:
+            self.data_versions[field] = get_data_version(self.data[field])
+        return self.data_versions[field]
+
+    def reset_data_versions(self):
+        self.data_versions = {}
+
+    def get_field_array(self, field):
+        """Returns one field as a float64 array, date x ticker in universe mode"""
+        if self.is_universe:
+            return self.data[field][self.tickers].to_numpy(dtype=np.float64)
+        return self.data[field].to_numpy(dtype=np.float64)
+
+    def to_indicator(self, values):
+        """Wraps an array from the indicator kernels with the dates (and tickers) of self.data"""
+        # Kernels work in float64, compact strategies store float32.
+        values = values.astype(self.dtype, copy=False)
+        if values.ndim == 2:
+            return pd.DataFrame(values, index=self.data.index, columns=self.tickers)
+        return pd.Series(values, index=self.data.index)
 
     def simple_moving_average(self, period):
         """
@@ -68,7 +292,14 @@ class StrategyBrain:
 
         [https://en.wikipedia.org/wiki/Moving_average#Simple_moving_average]
         """
-        return self.data.rolling(window=period).mean()["Adj Close"]
+        return self.cached(
+            "SMA",
+            ("Adj Close",),
+            (period,),
+            lambda: self.to_indicator(
+                kernels.sma(self.get_field_array("Adj Close"), period)
+            ),
+        )
 
     def exponential_moving_average(self, period):
         """
@@ -76,7 +307,14 @@ class StrategyBrain:
 
         [https://en.wikipedia.org/wiki/Moving_average#Exponential_moving_average]
         """
-        return self.data.ewm(span=period).mean()["Adj Close"]
+        return self.cached(
+            "EMA",
+            ("Adj Close",),
+            (period,),
+            lambda: self.to_indicator(
+                kernels.ema(self.get_field_array("Adj Close"), period)
+            ),
+        )
 
     def macd(self):
         """
@@ -84,7 +322,13 @@ class StrategyBrain:
 
         [https://en.wikipedia.org/wiki/MACD]
         """
-        return self.exponential_moving_average(12) - self.exponential_moving_average(26)
+        return self.cached(
+            "MACD",
+            ("Adj Close",),
+            (12, 26),
+            lambda: self.exponential_moving_average(12)
+            - self.exponential_moving_average(26),
+        )
 
     def macd_signal_line(self):
         """Returns the signal line for the MACD which is an EMA of period 9"""
@@ -92,7 +336,12 @@ class StrategyBrain:
 
     def macd_histogram(self):
         """Returns the histogram for MACD"""
-        return self.macd() - self.macd_signal_line()
+        return self.cached(
+            "MACD Histogram",
+            ("Adj Close",),
+            (12, 26, 9),
+            lambda: self.macd() - self.macd_signal_line(),
+        )
 
     def bollinger_bands(self, period, numsd):
         """
@@ -100,13 +349,25 @@ class StrategyBrain:
 
         [https://en.wikipedia.org/wiki/Bollinger_Bands]
         """
-        df = pd.DataFrame()
-        df["Average"] = self.data.rolling(window=period)["Adj Close"].mean()
-        standard_deviation = self.data.rolling(window=period)["Adj Close"].std()
-        df["Upper Band"] = df["Average"] + (standard_deviation * numsd)
-        df["Lower Band"] = df["Average"] - (standard_deviation * numsd)
-
-        return df
+        return self.cached(
+            "Bollinger Bands",
+            ("Adj Close",),
+            (period, numsd),
+            lambda: self.compute_bollinger_bands(period, numsd),
+        )
+
+    def compute_bollinger_bands(self, period, numsd):
+        close = self.get_field_array("Adj Close")
+        average = self.to_indicator(kernels.sma(close, period))
+        standard_deviation = self.to_indicator(kernels.rolling_std(close, period))
+        upper_band = average + (standard_deviation * numsd)
+        lower_band = average - (standard_deviation * numsd)
+
+        # In universe mode each band has one column per ticker.
+        return pd.concat(
+            {"Average": average, "Upper Band": upper_band, "Lower Band": lower_band},
+            axis=1,
+        )
 
     def get_max_high_price(self):
         """Returns the max high price"""
@@ -131,14 +392,28 @@ class StrategyBrain:
         [https://en.wikipedia.org/wiki/Volume-weighted_average_price]
 
         """
-        df = pd.DataFrame()
-        # Calculate Typical Price
-        df["TP"] = (self.data["Low"] + self.data["High"] + self.data["Close"]) / 3
-        df["VWAP"] = (df["TP"] * self.data["Volume"]).cumsum() / self.data[
-            "Volume"
-        ].cumsum()
+        return self.cached(
+            "VWAP", ("Low", "High", "Close", "Volume"), (), self.compute_vwap
+        )
 
-        return df["VWAP"]
+    def compute_vwap(self):
+        # Calculate Typical Price
+        typical_price = (
+            self.get_field_array("Low")
+            + self.get_field_array("High")
+            + self.get_field_array("Close")
+        ) / 3
+        volume = self.get_field_array("Volume")
+        # Running sums skip missing bars, which stay missing, like pandas cumsum.
+        traded_value = typical_price * volume
+        cumulative_value = np.where(
+            np.isnan(traded_value), np.nan, np.nancumsum(traded_value, axis=0)
+        )
+        cumulative_volume = np.where(
+            np.isnan(volume), np.nan, np.nancumsum(volume, axis=0)
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.to_indicator(cumulative_value / cumulative_volume)
 
     def rsi(self, period=14):
         """
@@ -147,25 +422,28 @@ class StrategyBrain:
         [https://en.wikipedia.org/wiki/Relative_strength_index]
 
         """
-        df = pd.DataFrame()
-        change = self.data["Adj Close"].diff()
+        return self.cached(
+            "RSI", ("Adj Close",), (period,), lambda: self.compute_rsi(period)
+        )
+
+    def compute_rsi(self, period):
+        close = self.get_field_array("Adj Close")
+        change = np.full_like(close, np.nan)
+        change[1:] = close[1:] - close[:-1]
 
         # Clip for days with positive price change
-        up = change.clip(lower=0)
+        up = np.clip(change, 0, None)
 
         # Clip for days with negative price change (* -1 to make it all positive for division purposes)
-        down = -change.clip(upper=0)
+        down = -np.clip(change, None, 0)
 
         # Get moving averages for up and down data
-        df["ma_up"] = up.ewm(span=period - 1, adjust=True, min_periods=period).mean()
-        df["ma_down"] = down.ewm(
-            span=period - 1, adjust=True, min_periods=period
-        ).mean()
+        ma_up = kernels.ema(up, period - 1, min_periods=period)
+        ma_down = kernels.ema(down, period - 1, min_periods=period)
 
-        rsi = df["ma_up"] / df["ma_down"]
-        df["RSI"] = 100 - (100 / (1 + rsi))
-
-        return df["RSI"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rsi = ma_up / ma_down
+            return self.to_indicator(100 - (100 / (1 + rsi)))
 
     def mfi(self, period=14):
         """
@@ -180,28 +458,41 @@ class StrategyBrain:
             positive money flow = added money flow of all days where typical price (TP) is higher than previous day's TP
             negative money flow = added money flow of all days where typical price (TP) is lower than previous day's TP
         """
-        df = pd.DataFrame()
+        return self.cached(
+            "MFI",
+            ("Low", "High", "Close", "Volume"),
+            (period,),
+            lambda: self.compute_mfi(period),
+        )
+
+    def compute_mfi(self, period):
         # Calculate Typical Price
-        df["TP"] = (self.data["Low"] + self.data["High"] + self.data["Close"]) / 3
+        typical_price = (
+            self.get_field_array("Low")
+            + self.get_field_array("High")
+            + self.get_field_array("Close")
+        ) / 3
         # Calculate Raw Money Flow
-        df["RMF"] = df["TP"] * self.data["Volume"]
+        raw_money_flow = typical_price * self.get_field_array("Volume")
         # Calculate Money Flow Ratio where PMF = Positive Money Flow, NMF = Negative Money Flow
 
         # Calculate the change in typical price from the previous day
-        df["change"] = df["TP"].diff()
+        change = np.full_like(typical_price, np.nan)
+        change[1:] = typical_price[1:] - typical_price[:-1]
 
         # Calculate the number of days that have a positive and negative change
-        df["1PMF"] = df["RMF"].where(df["change"] >= 0).fillna(0)
-        df["1NMF"] = df["RMF"].where(df["change"] < 0).fillna(0)
+        has_flow = ~np.isnan(raw_money_flow)
+        positive_money_flow = np.where(has_flow & (change >= 0), raw_money_flow, 0.0)
+        negative_money_flow = np.where(has_flow & (change < 0), raw_money_flow, 0.0)
 
-        df["14PMF"] = df["1PMF"].rolling(window=period).sum()
-        df["14NMF"] = df["1NMF"].rolling(window=period).sum()
+        period_positive_money_flow = kernels.rolling_sum(positive_money_flow, period)
+        period_negative_money_flow = kernels.rolling_sum(negative_money_flow, period)
 
-        df["Money Ratio"] = df["14PMF"] / df["14NMF"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            money_ratio = period_positive_money_flow / period_negative_money_flow
 
-        # Calculate MFI
-        df["MFI"] = 100 - (100 / (1 + df["Money Ratio"]))
-        return df["MFI"]
+            # Calculate MFI
+            return self.to_indicator(100 - (100 / (1 + money_ratio)))
 
     def up_days(self):
         """
@@ -214,8 +505,12 @@ class StrategyBrain:
         """
         Returns if the specified day had a positive change
         """
-        change = self.data["Close"].diff()
-        return change.loc[str(date)] > 0
+        # Looked up by timestamp so intraday bars match a single bar, not a whole day.
+        position = self.calendar.get_position(date)
+        closes = self.data["Close"]
+        # The first bar has no previous close, so it isn't an up day.
+        change = closes.iloc[position] - closes.iloc[max(position - 1, 0)]
+        return change > 0
 
 
 # if __name__ == '__main__':
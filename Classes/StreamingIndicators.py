@@ -0,0 +1,342 @@
+# Incremental versions of the StrategyBrain indicators for bar-by-bar updates.
+#
+# Each indicator keeps the state it needs (running sums, a ring buffer of the last
+# `period` values or EMA recursions) so a new bar costs O(1) instead of recomputing
+# the full history. The results match the batch methods in StrategyBrain, NaNs
+# included, so a paper-trading loop sees the same values as a backtest.
+#
+# update(bar) takes one bar, a dict or row with the OHLCV fields, and returns the new
+# value. update_many(bars) takes a dataframe of bars and returns the values for every
+# row. A field may hold one value per ticker (e.g. a universe panel row), in which case
+# every ticker is updated at once and one value per ticker is returned.
+
+import numpy as np
+import pandas as pd
+
+
+class RollingWindow:
+    """
+    The last `period` values with running sums, the streaming counterpart of the
+    IndicatorKernels rolling kernels.
+
+    Sums are kept of values shifted by the mean of the window at the last refresh,
+    and the window is summed again from the buffer every `period` updates. That
+    costs O(1) per update on average and stops rounding error building up over a
+    long stream.
+    """
+
+    def __init__(self, period):
+        self.period = period
+        # Allocated on the first value so the shape follows the bars (one value per ticker).
+        self.values = None
+        self.position = 0
+        self.length = 0
+        self.updates = 0
+
+    def push(self, value):
+        value = np.asarray(value, dtype=np.float64)
+        valid = ~np.isnan(value)
+        if self.values is None:
+            self.values = np.zeros((self.period,) + value.shape)
+            self.shift = np.where(valid, value, 0.0)
+            self.total = np.zeros(value.shape)
+            self.total_squares = np.zeros(value.shape)
+            self.missing = np.zeros(value.shape, dtype=np.int64)
+
+        if self.length == self.period:
+            leaving = self.values[self.position]
+            leaving_valid = ~np.isnan(leaving)
+            difference = np.where(leaving_valid, leaving - self.shift, 0.0)
+            self.total -= difference
+            self.total_squares -= difference * difference
+            self.missing -= ~leaving_valid
+        else:
+            self.length += 1
+
+        self.values[self.position] = value
+        self.position = (self.position + 1) % self.period
+        difference = np.where(valid, value - self.shift, 0.0)
+        self.total += difference
+        self.total_squares += difference * difference
+        self.missing += ~valid
+
+        self.updates += 1
+        if self.updates == self.period:
+            self.refresh()
+
+    def refresh(self):
+        """Sums the window again from the buffer, shifted by its current mean"""
+        window = self.values[: self.length]
+        valid = ~np.isnan(window)
+        counts = valid.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(valid, window, 0.0).sum(axis=0) / counts
+        self.shift = np.where(counts > 0, mean, self.shift)
+        difference = np.where(valid, window - self.shift, 0.0)
+        self.total = difference.sum(axis=0)
+        self.total_squares = (difference * difference).sum(axis=0)
+        self.updates = 0
+
+    def is_full(self):
+        """True once the window holds `period` values and none of them are NaN"""
+        return (self.length == self.period) & (self.missing == 0)
+
+    def sum(self):
+        return np.where(self.is_full(), self.total + self.period * self.shift, np.nan)
+
+    def mean(self):
+        return np.where(self.is_full(), self.total / self.period + self.shift, np.nan)
+
+    def std(self, ddof=1):
+        variance = (self.total_squares - self.total * self.total / self.period) / (
+            self.period - ddof
+        )
+        return np.where(self.is_full(), np.sqrt(np.maximum(variance, 0.0)), np.nan)
+
+
+class ExponentialAverage:
+    """
+    The pandas ewm(span=span, adjust=True) average as the running recursions
+        numerator(t)   = x(t) + (1 - alpha) * numerator(t - 1)
+        denominator(t) = 1    + (1 - alpha) * denominator(t - 1)
+    NaNs add nothing to either sum but still decay them, as in IndicatorKernels.ema.
+    """
+
+    def __init__(self, span, min_periods=0):
+        self.decay = 1 - 2 / (span + 1)
+        self.min_periods = max(min_periods, 1)
+        self.numerator = 0.0
+        self.denominator = 0.0
+        self.count = 0
+
+    def push(self, value):
+        value = np.asarray(value, dtype=np.float64)
+        valid = ~np.isnan(value)
+        self.numerator = self.decay * self.numerator + np.where(valid, value, 0.0)
+        self.denominator = self.decay * self.denominator + valid
+        self.count = self.count + valid
+        with np.errstate(invalid="ignore", divide="ignore"):
+            average = self.numerator / self.denominator
+        return np.where(self.count >= self.min_periods, average, np.nan)
+
+
+class StreamingIndicator:
+    """
+    Base class of the streaming indicators. Subclasses list the bar fields they read
+    in `fields`, the names of their results in `outputs` and implement push() taking
+    one value per field.
+    """
+
+    fields = ["Adj Close"]
+    outputs = ["Value"]
+
+    def push(self, *values):
+        raise NotImplementedError
+
+    def update(self, bar):
+        """Adds one bar and returns the new value (a tuple for several outputs)"""
+        results = self.push(*(np.asarray(bar[field]) for field in self.fields))
+        if len(self.outputs) == 1:
+            return results[()]
+        return tuple(result[()] for result in results)
+
+    def update_many(self, bars):
+        """
+        Adds every row of a dataframe of bars and returns the values with its index.
+        With a universe panel ((field, ticker) columns) there is one column per ticker.
+        """
+        columns = None
+        if isinstance(bars.columns, pd.MultiIndex):
+            columns = list(bars[self.fields[0]].columns)
+            arrays = [
+                bars[field][columns].to_numpy(np.float64) for field in self.fields
+            ]
+        else:
+            arrays = [bars[field].to_numpy(np.float64) for field in self.fields]
+
+        results = [np.empty(arrays[0].shape) for _ in self.outputs]
+        for row, values in enumerate(zip(*arrays)):
+            pushed = self.push(*values)
+            if len(self.outputs) == 1:
+                pushed = (pushed,)
+            for result, value in zip(results, pushed):
+                result[row] = value
+
+        if columns is None:
+            series = {
+                name: pd.Series(result, index=bars.index)
+                for name, result in zip(self.outputs, results)
+            }
+        else:
+            series = {
+                name: pd.DataFrame(result, index=bars.index, columns=columns)
+                for name, result in zip(self.outputs, results)
+            }
+        if len(self.outputs) == 1:
+            return series[self.outputs[0]]
+        # Same layout as the batch methods, e.g. StrategyBrain.bollinger_bands.
+        return pd.concat(series, axis=1)
+
+
+class StreamingSMA(StreamingIndicator):
+    """Streaming StrategyBrain.simple_moving_average"""
+
+    def __init__(self, period):
+        self.window = RollingWindow(period)
+
+    def push(self, close):
+        self.window.push(close)
+        return self.window.mean()
+
+
+class StreamingEMA(StreamingIndicator):
+    """Streaming StrategyBrain.exponential_moving_average"""
+
+    def __init__(self, period):
+        self.average = ExponentialAverage(period)
+
+    def push(self, close):
+        return self.average.push(close)
+
+
+class StreamingMACD(StreamingIndicator):
+    """
+    Streaming StrategyBrain.macd, macd_signal_line and macd_histogram. As in the batch
+    methods the signal line is the 9 period EMA of the price.
+    """
+
+    outputs = ["MACD", "Signal Line", "MACD Histogram"]
+
+    def __init__(self):
+        self.fast = ExponentialAverage(12)
+        self.slow = ExponentialAverage(26)
+        self.signal = ExponentialAverage(9)
+
+    def push(self, close):
+        macd = self.fast.push(close) - self.slow.push(close)
+        signal_line = self.signal.push(close)
+        return macd, signal_line, macd - signal_line
+
+
+class StreamingBollingerBands(StreamingIndicator):
+    """Streaming StrategyBrain.bollinger_bands"""
+
+    outputs = ["Average", "Upper Band", "Lower Band"]
+
+    def __init__(self, period, numsd):
+        self.window = RollingWindow(period)
+        self.numsd = numsd
+
+    def push(self, close):
+        self.window.push(close)
+        average = self.window.mean()
+        standard_deviation = self.window.std()
+        return (
+            average,
+            average + (standard_deviation * self.numsd),
+            average - (standard_deviation * self.numsd),
+        )
+
+
+class StreamingVWAP(StreamingIndicator):
+    """Streaming StrategyBrain.vwap, the cumulative sums carried from bar to bar"""
+
+    fields = ["Low", "High", "Close", "Volume"]
+
+    def __init__(self):
+        self.price_volume = 0.0
+        self.volume = 0.0
+
+    def push(self, low, high, close, volume):
+        typical_price = (low + high + close) / 3
+        price_volume = typical_price * volume
+        # Like pandas cumsum, a NaN is skipped by the sum but gives NaN on its own row.
+        self.price_volume = self.price_volume + np.nan_to_num(price_volume)
+        self.volume = self.volume + np.nan_to_num(volume)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            vwap = self.price_volume / self.volume
+        return np.where(np.isnan(price_volume) | np.isnan(volume), np.nan, vwap)
+
+
+class StreamingRSI(StreamingIndicator):
+    """Streaming StrategyBrain.rsi"""
+
+    def __init__(self, period=14):
+        self.previous_close = np.nan
+        self.average_up = ExponentialAverage(period - 1, min_periods=period)
+        self.average_down = ExponentialAverage(period - 1, min_periods=period)
+
+    def push(self, close):
+        change = close - self.previous_close
+        self.previous_close = close
+        ma_up = self.average_up.push(np.clip(change, 0, None))
+        ma_down = self.average_down.push(-np.clip(change, None, 0))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rsi = ma_up / ma_down
+            return 100 - (100 / (1 + rsi))
+
+
+class StreamingMFI(StreamingIndicator):
+    """Streaming StrategyBrain.mfi"""
+
+    fields = ["Low", "High", "Close", "Volume"]
+
+    def __init__(self, period=14):
+        self.previous_typical_price = np.nan
+        self.positive_money_flow = RollingWindow(period)
+        self.negative_money_flow = RollingWindow(period)
+
+    def push(self, low, high, close, volume):
+        typical_price = (low + high + close) / 3
+        raw_money_flow = typical_price * volume
+        change = typical_price - self.previous_typical_price
+        self.previous_typical_price = typical_price
+
+        has_flow = ~np.isnan(raw_money_flow)
+        self.positive_money_flow.push(
+            np.where(has_flow & (change >= 0), raw_money_flow, 0.0)
+        )
+        self.negative_money_flow.push(
+            np.where(has_flow & (change < 0), raw_money_flow, 0.0)
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            money_ratio = (
+                self.positive_money_flow.sum() / self.negative_money_flow.sum()
+            )
+            return 100 - (100 / (1 + money_ratio))
+
+
+class StreamingIndicators:
+    """
+    Keeps the columns added by StrategyBrain.get_indicators ("MA", "MACD" and "VWAP")
+    up to date bar by bar, e.g. in a paper-trading loop feeding get_positions.
+    """
+
+    def __init__(self, MA_period):
+        self.indicators = {
+            "MA": StreamingSMA(MA_period),
+            "MACD": StreamingMACD(),
+            "VWAP": StreamingVWAP(),
+        }
+
+    def update(self, bar):
+        """Adds one bar and returns a dict of the new indicator values"""
+        values = {}
+        for name, indicator in self.indicators.items():
+            value = indicator.update(bar)
+            # get_indicators only keeps the MACD line itself.
+            values[name] = value[0] if isinstance(value, tuple) else value
+        return values
+
+    def update_many(self, bars):
+        """Adds every row of a dataframe of bars and returns bars with the indicator columns"""
+        df = bars.copy()
+        for name, indicator in self.indicators.items():
+            values = indicator.update_many(bars)
+            if isinstance(indicator, StreamingMACD):
+                values = values["MACD"]
+            if isinstance(df.columns, pd.MultiIndex):
+                df = pd.concat([df, pd.concat({name: values}, axis=1)], axis=1)
+            else:
+                df[name] = values
+        return df
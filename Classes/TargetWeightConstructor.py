@@ -0,0 +1,181 @@
+# Builds a portfolio from a (date x ticker) matrix of target weights rather than a list of
+# trades, for strategies that decide how much of the portfolio each ticker should be.
+#
+# A weight is the fraction of the portfolio value held in a ticker, negative for a short
+# (the short sale proceeds are kept as cash). Weights dated between bars take effect on
+# the next bar and hold until the next weights. On every rebalance bar the holdings are
+# set to the target weights at that bar's close, and between rebalances the share counts
+# are kept, so the weights drift with the prices.
+#
+# Nothing is looped over bars. Within a rebalance period the value is the value after the
+# last rebalance x the growth of the weights held, 1 + sum(weight x (price / rebalance
+# price - 1)), so the value after every rebalance is a cumulative product of the period
+# growths and (1 - costs). Costs are proportional to the turnover: the commission_rate
+# and half the spread of a CostModel on the value traded.
+#
+#     constructor = TargetWeightConstructor(weights, data_source, rebalance="M")
+#     PortfolioAnalysis(constructor.get_portfolio()).print_statistics()
+
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+from Classes.BarFrequency import get_bin_labels, get_bin_starts
+from Classes.Instrumentation import timed
+from Classes.MarketDataSource import YahooDataSource
+from Classes.TradingCalendar import TradingCalendar
+
+
+class TargetWeightConstructor:
+    """
+    weights       date x ticker target weights, e.g. 0.5 = half the portfolio value long
+                  and -0.2 = a short worth a fifth of it
+    data_source   where the Adj Close prices are read from, unless prices is given
+    rebalance     None to rebalance on every bar, a pandas frequency rule (e.g. "W", "M")
+                  for the first bar of every period, or a number of bars
+    initial_cash  value of the portfolio on the first bar
+    cost_model    CostModel whose commission_rate and spread are paid on the turnover
+    prices        date x ticker Adj Close (or a (field, ticker) panel) to use instead
+    """
+
+    @timed()
+    def __init__(
+        self,
+        weights,
+        data_source=None,
+        rebalance=None,
+        initial_cash=18000,
+        cost_model=None,
+        prices=None,
+    ):
+        if isinstance(rebalance, (int, np.integer)) and rebalance <= 0:
+            raise ValueError(
+                f"rebalance must be a positive number of bars, not {rebalance}"
+            )
+        self.data_source = data_source if data_source is not None else YahooDataSource()
+        self.initial_cash = initial_cash
+        self.cost_rate = self.get_cost_rate(cost_model)
+        self.tickers = sorted(weights.columns)
+
+        closes = self.get_prices(weights, prices)
+        self.calendar = TradingCalendar(closes.index)
+        targets = self.get_targets(weights)
+        rebalance_rows = self.get_rebalance_rows(rebalance)
+        self.df = self.construct(closes, targets, rebalance_rows)
+
+    @staticmethod
+    def get_cost_rate(cost_model):
+        """Returns the cost per $ traded of a CostModel"""
+        if cost_model is None:
+            return 0.0
+        if (
+            cost_model.commission_per_share
+            or cost_model.minimum_commission
+            or cost_model.impact
+            or cost_model.financing_rate
+            or cost_model.borrow_rate
+        ):
+            raise ValueError(
+                "Target weights only pay the proportional costs of a CostModel "
+                "(commission_rate and spread)"
+            )
+        return cost_model.commission_rate + cost_model.spread / 2
+
+    @timed()
+    def get_prices(self, weights, prices=None):
+        """Returns the date x ticker Adj Close over the dates of the weights"""
+        if prices is None:
+            start_date = pd.Timestamp(weights.index.min())
+            end_date = pd.Timestamp(weights.index.max()) + dt.timedelta(days=1)
+            prices = self.data_source.get_panel(self.tickers, start_date, end_date)
+        if isinstance(prices.columns, pd.MultiIndex):
+            prices = prices["Adj Close"]
+        prices = prices[self.tickers]
+        # The portfolio starts on the bar of the first weights.
+        first = prices.index.searchsorted(pd.Timestamp(weights.index.min()))
+        return prices.iloc[first:].rename_axis(None)
+
+    def get_targets(self, weights):
+        """Returns the (bar x ticker) target weights in force on every bar"""
+        rows = self.calendar.get_positions(weights.index, "next")
+        in_range = rows != -1
+        values = weights[self.tickers].to_numpy(dtype=np.float64)[in_range]
+        # Weights dated on the same bar: the last one counts.
+        rows, last = np.unique(rows[in_range][::-1], return_index=True)
+        targets = np.full((len(self.calendar), len(self.tickers)), np.nan)
+        targets[rows] = values[::-1][last]
+        targets = pd.DataFrame(targets).ffill().to_numpy()
+        return np.nan_to_num(targets)
+
+    def get_rebalance_rows(self, rebalance):
+        """Returns the bars the holdings are set back to the target weights on"""
+        bars = len(self.calendar)
+        if rebalance is None:
+            return np.arange(bars)
+        if isinstance(rebalance, (int, np.integer)):
+            return np.arange(0, bars, rebalance)
+        return get_bin_starts(get_bin_labels(self.calendar.nanoseconds, rebalance))
+
+    @timed()
+    def construct(self, closes, targets, rebalance_rows):
+        """
+        Returns the value of every ticker's holding, the cash and the total value on every
+        bar, and keeps the shares held (self.holdings), the turnover of every rebalance as a
+        fraction of the value (self.turnover) and the costs paid (self.costs)
+        """
+        prices = closes.ffill().to_numpy(dtype=np.float64)
+        # Tickers without a price yet can't be held.
+        targets = np.where(np.isnan(prices), 0.0, targets)
+        bars = len(prices)
+
+        # Period of every bar and the growth of the weights held since its rebalance.
+        periods = np.searchsorted(rebalance_rows, np.arange(bars), side="right") - 1
+        weights = targets[rebalance_rows]
+        rebalance_prices = prices[rebalance_rows]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            relative = np.nan_to_num(prices / rebalance_prices[periods], nan=1.0)
+        growth = 1 + np.sum(weights[periods] * (relative - 1), axis=1)
+
+        # Growth of every period up to the next rebalance bar, and the weights it drifted
+        # to there. The first rebalance starts from cash.
+        with np.errstate(invalid="ignore", divide="ignore"):
+            relative_to_next = np.nan_to_num(
+                prices[rebalance_rows[1:]] / rebalance_prices[:-1], nan=1.0
+            )
+        period_growth = 1 + np.sum(weights[:-1] * (relative_to_next - 1), axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            drifted = weights[:-1] * relative_to_next / period_growth[:, np.newaxis]
+        drifted = np.vstack([np.zeros((1, len(self.tickers))), drifted])
+        turnover = np.sum(np.abs(weights - drifted), axis=1)
+
+        # Value after every rebalance, before it is the value after the last one x its growth.
+        factors = np.append(1.0, period_growth) * (1 - self.cost_rate * turnover)
+        value_after = self.initial_cash * np.cumprod(factors)
+        value_before = np.append(self.initial_cash, value_after[:-1] * period_growth)
+
+        value = value_after[periods] * growth
+        with np.errstate(invalid="ignore", divide="ignore"):
+            shares = np.nan_to_num(
+                weights * value_after[:, np.newaxis] / rebalance_prices
+            )[periods]
+        holdings = shares * np.nan_to_num(prices)
+
+        date_range = closes.index
+        self.holdings = pd.DataFrame(shares, index=date_range, columns=self.tickers)
+        rebalance_dates = date_range[rebalance_rows]
+        self.turnover = pd.Series(turnover, index=rebalance_dates, name="Turnover")
+        self.costs = pd.Series(
+            self.cost_rate * turnover * value_before,
+            index=rebalance_dates,
+            name="Costs",
+        )
+
+        df = pd.DataFrame(holdings, index=date_range, columns=self.tickers)
+        df["value"] = value
+        df["cash"] = value - holdings.sum(axis=1)
+        return df
+
+    @timed()
+    def get_portfolio(self):
+        """Returns the dataframe with the total value as "Portfolio Value", as PortfolioConstructor does"""
+        return self.df.rename({"value": "Portfolio Value"}, axis=1).dropna(axis=0)
@@ -1,136 +1,188 @@
-import pandas as pd 
-import yfinance as yf 
-import datetime as dt 
+import pandas as pd
+import datetime as dt
 import numpy as np
 import random as rand
+from Classes.MarketDataSource import YahooDataSource
+from Classes.TradeTable import TradeTable
+from Classes.Instrumentation import timed
+from Classes.TradingCalendar import TradingCalendar
+
+# Trade statistics are worked out once from columnar arrays: the entry and exit bar of
+# every trade is looked up on the TradingCalendar of the prices (the first bar on or
+# after the buy date, the last bar on or before the sell date), and the returns and
+# lengths of all trades are computed together.
 
-#Get return list slowing down class
 
 class TradeAnalysis:
-	def __init__(self,trades):
-		self.trades = trades
-		self.main_df = self.construct_main_df()
-		self.return_list = self.get_return_list()
-		self.positive_return_list = [returns for returns in self.return_list if returns > 0]
-		self.negative_return_list = [returns for returns in self.return_list if returns <= 0]
-
-	def construct_main_df(self):
-		tickers = list(set([trade[1] for trade in self.trades]))
-		main_df = pd.DataFrame()
-		for ticker in tickers:
-			main_df[ticker] = yf.download(ticker,dt.date(1900,1,1),dt.date.today(),progress=False)['Adj Close']
-		return main_df
-
-	def get_data(self,ticker,start_date,end_date):
-		return self.main_df[ticker].loc[start_date:end_date]
-
-	def get_frequency_of_all_trades(self):
-		return len(self.trades)
-
-	def get_frequency_of_winning_trades(self):
-		return len(self.positive_return_list)
-
-	def get_frequency_of_losing_trades(self):
-		return len(self.negative_return_list)
-
-	def get_average_length(self):
-		length_list = []
-		for trade in self.trades:
-			length_list.append((trade[5] - trade[4]).days)
-		average_length = np.mean(length_list)
-		return round(average_length,2)
-
-	def get_average_winning_length(self):
-		length_list = []
-		for count, returns in enumerate(self.return_list):
-			if returns > 0:
-				days = (self.trades[count][5] - self.trades[count][4]).days
-				length_list.append(days)
-		average_length = np.mean(length_list)
-		return round(average_length,2)
-
-	def get_average_losing_length(self):
-		length_list = []
-		for count, returns in enumerate(self.return_list):
-			if returns <= 0:
-				days = (self.trades[count][5] - self.trades[count][4]).days
-				length_list.append(days)
-		average_length = np.mean(length_list)
-		return round(average_length,2)
-				
-	def get_return_list(self):
-		return_list = []
-		for trade in self.trades:
-			df = self.get_data(trade[1],trade[4],trade[5])
-			trade_return = 100*((df.iloc[-1]/df.iloc[0])-1)
-			return_list.append(trade_return)
-		return return_list
-
-	def get_average_returns(self):
-		average_returns = np.mean(self.return_list)
-		return round(average_returns,2)
-
-	def get_win_rate(self):
-		win_rate = 100*(len(self.positive_return_list)/len(self.return_list))
-		return round(win_rate,2)
-
-	def get_loss_rate(self):
-		loss_rate = 100 - self.get_win_rate()
-		return loss_rate
-
-	def get_average_win_returns(self):
-		average_win_returns = np.mean(self.positive_return_list)
-		return round(average_win_returns,2)
-
-	def get_average_loss_return(self):
-		average_loss_returns = np.mean(self.negative_return_list)
-		return round(average_loss_returns,2)
-
-	def format_column(self,input_one,input_two):
-		input_one, input_two = str(input_one), str(input_two)
-		while len(input_one) != 30:
-			input_one += ' '
-		while len(input_two) != 15:
-			input_two += ' '
-		print(input_one,input_two)
-
-	def show_trades(self):
-		for trade in self.trades:
-			print(trade)
-
-	def print_statistics(self):
-		self.format_column('All Trades','Portfolio')
-		print('-----------------------------------------')
-		self.format_column('Frequency',f'{self.get_frequency_of_all_trades()}')
-		self.format_column('Average Length',f'{self.get_average_length()} Days')
-		self.format_column('Average Returns',f'{self.get_average_returns()} %')
-		print('-----------------------------------------')
-		self.format_column('Winning Trades','')
-		self.format_column('Frequency',f'{self.get_frequency_of_winning_trades()}')
-		self.format_column('Average Length',f'{self.get_average_winning_length()} Days')
-		self.format_column('Win Rate',f'{self.get_win_rate()} %')
-		self.format_column("Average Win Return",f'{self.get_average_win_returns()} %')
-		print('-----------------------------------------')
-		self.format_column('Losing Trades','')
-		self.format_column('Frequency',f'{self.get_frequency_of_losing_trades()}')
-		self.format_column('Average Length',f'{self.get_average_losing_length()} Days')
-		self.format_column('Loss Rate',f'{self.get_loss_rate()} %')
-		self.format_column('Average Loss Return',f'{self.get_average_loss_return()} %')
-		print('-----------------------------------------')
-
-
-
-#Input in Start date, End date, Ticker, and moving average period 
+    # prices is an optional date x ticker dataframe of Adj Close (or a panel with (field, ticker)
+    # columns) already covering the trades, e.g. the data the strategy ran on. Without it only
+    # the backtest range is read from the data source.
+    @timed()
+    def __init__(self, trades, data_source=None, prices=None):
+        self.trades = TradeTable.from_list(trades)
+        self.data_source = data_source if data_source is not None else YahooDataSource()
+        self.main_df = self.construct_main_df(prices)
+        self.calendar = TradingCalendar(self.main_df.index)
+        self.return_list = self.get_return_list()
+        self.length_list = self.get_length_list()
+        self.winning = self.return_list > 0
+        self.positive_return_list = self.return_list[self.winning]
+        self.negative_return_list = self.return_list[~self.winning]
+
+    @timed()
+    def construct_main_df(self, prices=None):
+        if prices is not None:
+            if isinstance(prices.columns, pd.MultiIndex):
+                prices = prices["Adj Close"]
+            elif "Adj Close" in prices.columns:
+                # Single ticker OHLCV data, e.g. StrategyBrain.data.
+                prices = prices[["Adj Close"]].set_axis(
+                    self.trades.get_tickers()[:1], axis=1
+                )
+            return prices
+        # Only the backtest range is needed, the sell date is included.
+        tickers = self.trades.get_tickers()
+        start_date = pd.Timestamp(self.trades.buy_dates.min())
+        end_date = pd.Timestamp(self.trades.sell_dates.max()) + dt.timedelta(days=1)
+        return self.data_source.get_field(tickers, "Adj Close", start_date, end_date)
+
+    def get_data(self, ticker, start_date, end_date):
+        return self.main_df[ticker].iloc[self.calendar.get_slice(start_date, end_date)]
+
+    def get_frequency_of_all_trades(self):
+        return len(self.trades)
+
+    def get_frequency_of_winning_trades(self):
+        return len(self.positive_return_list)
+
+    def get_frequency_of_losing_trades(self):
+        return len(self.negative_return_list)
+
+    def get_average_length(self):
+        average_length = np.mean(self.length_list)
+        return round(average_length, 2)
+
+    def get_average_winning_length(self):
+        average_length = np.mean(self.length_list[self.winning])
+        return round(average_length, 2)
+
+    def get_average_losing_length(self):
+        average_length = np.mean(self.length_list[~self.winning])
+        return round(average_length, 2)
+
+    def get_length_list(self):
+        """Returns the length of every trade in days, with fractions of a day for intraday trades"""
+        lengths = self.trades.sell_dates - self.trades.buy_dates
+        return lengths / np.timedelta64(1, "D")
+
+    @timed()
+    def get_return_list(self):
+        """
+        Returns the % return of every trade, from the first price on or after its buy date
+        to the last price on or before its sell date
+        """
+        if len(self.trades) == 0:
+            return np.empty(0)
+        prices = self.main_df.to_numpy(dtype=np.float64)
+        columns = self.main_df.columns.get_indexer(self.trades.tickers)
+        if (columns == -1).any():
+            raise KeyError(f"No prices for {self.trades.tickers[columns == -1][0]}")
+        entries = self.calendar.get_positions(self.trades.buy_dates, "next")
+        exits = self.calendar.get_positions(self.trades.sell_dates, "previous")
+        missing = (entries == -1) | (entries > exits)
+        if missing.any():
+            first = np.flatnonzero(missing)[0]
+            raise KeyError(
+                f"No prices for {self.trades.tickers[first]} between {pd.Timestamp(self.trades.buy_dates[first])} and {pd.Timestamp(self.trades.sell_dates[first])}"
+            )
+        return 100 * ((prices[exits, columns] / prices[entries, columns]) - 1)
+
+    def get_average_returns(self):
+        average_returns = np.mean(self.return_list)
+        return round(average_returns, 2)
+
+    def get_win_rate(self):
+        win_rate = 100 * (len(self.positive_return_list) / len(self.return_list))
+        return round(win_rate, 2)
+
+    def get_loss_rate(self):
+        loss_rate = 100 - self.get_win_rate()
+        return loss_rate
+
+    def get_average_win_returns(self):
+        average_win_returns = np.mean(self.positive_return_list)
+        return round(average_win_returns, 2)
+
+    def get_average_loss_return(self):
+        average_loss_returns = np.mean(self.negative_return_list)
+        return round(average_loss_returns, 2)
+
+    def format_column(self, input_one, input_two):
+        input_one, input_two = str(input_one), str(input_two)
+        while len(input_one) != 30:
+            input_one += " "
+        while len(input_two) != 15:
+            input_two += " "
+        print(input_one, input_two)
+
+    def show_trades(self):
+        for trade in self.trades:
+            print(trade)
+
+    @timed()
+    def get_statistics(self):
+        """Returns every statistic in one pass over the return and length arrays"""
+        number_of_trades = len(self.return_list)
+        number_of_winners = int(self.winning.sum())
+        win_rate = round(100 * (number_of_winners / number_of_trades), 2)
+        return {
+            "Trades": number_of_trades,
+            "Average Length": round(np.mean(self.length_list), 2),
+            "Average Returns": round(np.mean(self.return_list), 2),
+            "Winning Trades": number_of_winners,
+            "Average Winning Length": round(np.mean(self.length_list[self.winning]), 2),
+            "Win Rate": win_rate,
+            "Average Win Return": round(np.mean(self.positive_return_list), 2),
+            "Losing Trades": number_of_trades - number_of_winners,
+            "Average Losing Length": round(np.mean(self.length_list[~self.winning]), 2),
+            "Loss Rate": 100 - win_rate,
+            "Average Loss Return": round(np.mean(self.negative_return_list), 2),
+        }
+
+    def print_statistics(self):
+        statistics = self.get_statistics()
+        self.format_column("All Trades", "Portfolio")
+        print("-----------------------------------------")
+        self.format_column("Frequency", f"{statistics['Trades']}")
+        self.format_column("Average Length", f"{statistics['Average Length']} Days")
+        self.format_column("Average Returns", f"{statistics['Average Returns']} %")
+        print("-----------------------------------------")
+        self.format_column("Winning Trades", "")
+        self.format_column("Frequency", f"{statistics['Winning Trades']}")
+        self.format_column(
+            "Average Length", f"{statistics['Average Winning Length']} Days"
+        )
+        self.format_column("Win Rate", f"{statistics['Win Rate']} %")
+        self.format_column(
+            "Average Win Return", f"{statistics['Average Win Return']} %"
+        )
+        print("-----------------------------------------")
+        self.format_column("Losing Trades", "")
+        self.format_column("Frequency", f"{statistics['Losing Trades']}")
+        self.format_column(
+            "Average Length", f"{statistics['Average Losing Length']} Days"
+        )
+        self.format_column("Loss Rate", f"{statistics['Loss Rate']} %")
+        self.format_column(
+            "Average Loss Return", f"{statistics['Average Loss Return']} %"
+        )
+        print("-----------------------------------------")
+
+
+# Input in Start date, End date, Ticker, and moving average period
 # st = SMA_StrategyConstructor(dt.date(2004,1,1),dt.date.today(),'GLD',20)
 # trades = st.get_trade_order_list()
 
-#Enter in trade analysis 
+# Enter in trade analysis
 # ta = TradeAnalysis(trades)
 # ta.show_statistics()
-
-
-
-
-
-
-
@@ -0,0 +1,209 @@
+# Columnar table of trades backed by a structured NumPy array.
+#
+# Each trade is stored with typed fields:
+# UTID:  Ticker:  Quantity:  Leverage:  Buy Date:  Sell Date:
+#
+# Iterating or indexing the table gives list rows in the same order, so code
+# written for the 2d trades list ([UTID, Ticker, Quantity, Leverage, Buy Date,
+# Sell Date]) keeps working. Vectorised consumers read the columns directly.
+#
+# Compact tables (made by from_bars, e.g. by a compact StrategyBrain) store int32
+# bar numbers into one shared date axis instead of a datetime64 per date, and
+# 32-bit UTIDs, quantities and leverages. buy_dates and sell_dates still return
+# datetime64 arrays, looked up from the axis when they are read.
+#
+# Quantities are floats so fractional quantities are kept, and the ticker field is
+# widened to the longest ticker given (e.g. option symbols), so nothing is truncated.
+
+import numpy as np
+import pandas as pd
+
+TRADE_DTYPE = np.dtype(
+    [
+        ("utid", np.int64),
+        ("ticker", "U16"),
+        ("quantity", np.float64),
+        ("leverage", np.float64),
+        ("buy_date", "datetime64[ns]"),
+        ("sell_date", "datetime64[ns]"),
+    ]
+)
+
+COMPACT_TRADE_DTYPE = np.dtype(
+    [
+        ("utid", np.int32),
+        ("ticker", "U16"),
+        ("quantity", np.float32),
+        ("leverage", np.float32),
+        ("buy_bar", np.int32),
+        ("sell_bar", np.int32),
+    ]
+)
+
+
+def get_trade_dtype(dtype, tickers):
+    """Returns dtype with the ticker field wide enough for every ticker"""
+    tickers = np.asarray(tickers, dtype=str)
+    width = max(dtype["ticker"].itemsize, tickers.dtype.itemsize)
+    if width == dtype["ticker"].itemsize:
+        return dtype
+    return np.dtype(
+        [
+            (name, np.dtype(("U", width // 4)) if name == "ticker" else dtype[name])
+            for name in dtype.names
+        ]
+    )
+
+
+class TradeTable:
+    def __init__(self, records=None, dates=None):
+        if records is None:
+            records = np.empty(0, dtype=TRADE_DTYPE)
+        self.records = records
+        # Date axis of a compact table, whose records hold bar numbers into it.
+        self.dates = dates
+
+    @classmethod
+    def from_arrays(
+        cls, tickers, buy_dates, sell_dates, quantity=100, leverage=1, utids=None
+    ):
+        """Returns a table from column arrays, scalars are broadcast to every trade"""
+        buy_dates = np.asarray(pd.to_datetime(buy_dates), dtype="datetime64[ns]")
+        records = np.empty(len(buy_dates), dtype=get_trade_dtype(TRADE_DTYPE, tickers))
+        records["utid"] = np.arange(len(buy_dates)) if utids is None else utids
+        records["ticker"] = tickers
+        records["quantity"] = quantity
+        records["leverage"] = leverage
+        records["buy_date"] = buy_dates
+        records["sell_date"] = np.asarray(
+            pd.to_datetime(sell_dates), dtype="datetime64[ns]"
+        )
+        return cls(records)
+
+    @classmethod
+    def from_bars(
+        cls, tickers, buy_bars, sell_bars, dates, quantity=100, leverage=1, utids=None
+    ):
+        """Returns a compact table of trades bought and sold on bar numbers of dates"""
+        records = np.empty(
+            len(buy_bars), dtype=get_trade_dtype(COMPACT_TRADE_DTYPE, tickers)
+        )
+        records["utid"] = np.arange(len(buy_bars)) if utids is None else utids
+        records["ticker"] = tickers
+        records["quantity"] = quantity
+        records["leverage"] = leverage
+        records["buy_bar"] = buy_bars
+        records["sell_bar"] = sell_bars
+        return cls(records, np.asarray(dates, dtype="datetime64[ns]"))
+
+    @classmethod
+    def from_list(cls, trades):
+        """Returns a table from a 2d trades list (or returns the table itself)"""
+        if isinstance(trades, TradeTable):
+            return trades
+        if len(trades) == 0:
+            return cls()
+        utids, tickers, quantity, leverage, buy_dates, sell_dates = zip(*trades)
+        return cls.from_arrays(
+            list(tickers),
+            [pd.Timestamp(date) for date in buy_dates],
+            [pd.Timestamp(date) for date in sell_dates],
+            quantity=list(quantity),
+            leverage=list(leverage),
+            utids=list(utids),
+        )
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.get_row(key)
+        return TradeTable(self.records[key], self.dates)
+
+    def __repr__(self):
+        return f"TradeTable({len(self)} trades)"
+
+    @property
+    def is_compact(self):
+        return self.dates is not None
+
+    def get_row(self, position):
+        """Returns one trade as [UTID, Ticker, Quantity, Leverage, Buy Date, Sell Date]"""
+        record = self.records[position]
+        if self.is_compact:
+            buy_date = self.dates[record["buy_bar"]]
+            sell_date = self.dates[record["sell_bar"]]
+        else:
+            buy_date, sell_date = record["buy_date"], record["sell_date"]
+        return [
+            int(record["utid"]),
+            str(record["ticker"]),
+            self.to_number(record["quantity"]),
+            self.to_number(record["leverage"]),
+            pd.Timestamp(buy_date),
+            pd.Timestamp(sell_date),
+        ]
+
+    @staticmethod
+    def to_number(value):
+        """Returns a quantity or leverage as an int when it is whole, as trades lists give it"""
+        value = value.item()
+        return int(value) if value.is_integer() else value
+
+    def to_list(self):
+        """Returns the 2d trades list"""
+        return [self.get_row(position) for position in range(len(self))]
+
+    def to_dataframe(self):
+        if not self.is_compact:
+            return pd.DataFrame(self.records)
+        return pd.DataFrame(
+            {
+                "utid": self.utids,
+                "ticker": self.tickers,
+                "quantity": self.quantity,
+                "leverage": self.leverage,
+                "buy_date": self.buy_dates,
+                "sell_date": self.sell_dates,
+            }
+        )
+
+    def get_memory_usage(self):
+        """Returns the bytes held by the records and the date axis"""
+        return self.records.nbytes + (self.dates.nbytes if self.is_compact else 0)
+
+    def get_tickers(self):
+        """Returns the sorted unique tickers traded"""
+        return list(np.unique(self.records["ticker"]))
+
+    @property
+    def utids(self):
+        return self.records["utid"]
+
+    @property
+    def tickers(self):
+        return self.records["ticker"]
+
+    @property
+    def quantity(self):
+        return self.records["quantity"]
+
+    @property
+    def leverage(self):
+        return self.records["leverage"]
+
+    @property
+    def buy_dates(self):
+        if self.is_compact:
+            return self.dates[self.records["buy_bar"]]
+        return self.records["buy_date"]
+
+    @property
+    def sell_dates(self):
+        if self.is_compact:
+            return self.dates[self.records["sell_bar"]]
+        return self.records["sell_date"]
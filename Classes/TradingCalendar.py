@@ -0,0 +1,119 @@
+# The bars a run trades on, mapping dates to integer bar positions.
+#
+# Built once from the index of the price data (or the union of several tickers' indexes)
+# so components look dates up as positions and index numpy arrays with them, rather than
+# label lookups on a dataframe. Dates are held as int64 nanoseconds, as in BarFrequency.
+#
+# A date that isn't a bar (a weekend, a holiday, a time between two bars) is snapped:
+#     "exact"     only bars match
+#     "previous"  the last bar on or before the date
+#     "next"      the first bar on or after the date
+# get_position raises KeyError when a date can't be snapped, get_positions returns -1
+# for those dates, like Index.get_indexer.
+#
+#     calendar = TradingCalendar(data.index)
+#     calendar.get_positions(trades.buy_dates, "next")
+
+import numpy as np
+import pandas as pd
+from Classes.BarFrequency import to_nanoseconds
+
+SNAP_RULES = ["exact", "previous", "next"]
+
+
+class TradingCalendar:
+    def __init__(self, dates):
+        nanoseconds = to_nanoseconds(dates)
+        if len(nanoseconds) > 1 and not (np.diff(nanoseconds) > 0).all():
+            nanoseconds = np.unique(nanoseconds)
+        self.nanoseconds = nanoseconds
+        self.dates = pd.DatetimeIndex(nanoseconds.view("datetime64[ns]"))
+        # Built on the first single date lookup, arrays of dates use searchsorted.
+        self.positions = None
+
+    @classmethod
+    def from_frames(cls, frames):
+        """Returns the calendar of every bar in any of the frames, e.g. one per ticker"""
+        frames = frames.values() if isinstance(frames, dict) else frames
+        nanoseconds = [to_nanoseconds(frame.index) for frame in frames]
+        return cls(np.unique(np.concatenate(nanoseconds)) if nanoseconds else [])
+
+    def __len__(self):
+        return len(self.nanoseconds)
+
+    def __contains__(self, date):
+        return self.get_position_or_none(date) is not None
+
+    def get_position_or_none(self, date):
+        if self.positions is None:
+            self.positions = dict(zip(self.nanoseconds.tolist(), range(len(self))))
+        date = pd.Timestamp(date)
+        if date.tz is not None:
+            date = date.tz_localize(None)
+        return self.positions.get(date.as_unit("ns").value)
+
+    def get_position(self, date, snap="exact"):
+        """Returns the bar position of a date, raising KeyError if it can't be snapped"""
+        if snap == "exact":
+            position = self.get_position_or_none(date)
+        else:
+            position = int(self.get_positions([date], snap)[0])
+        if position is None or position == -1:
+            raise KeyError(f"No bar for {pd.Timestamp(date)} (snap={snap})")
+        return position
+
+    def get_positions(self, dates, snap="exact"):
+        """Returns the bar position of every date, -1 for dates that can't be snapped"""
+        if snap not in SNAP_RULES:
+            raise ValueError(f"Unknown snap rule: {snap}, expected one of {SNAP_RULES}")
+        nanoseconds = to_nanoseconds(dates)
+        if snap == "previous":
+            return np.searchsorted(self.nanoseconds, nanoseconds, side="right") - 1
+        positions = np.searchsorted(self.nanoseconds, nanoseconds, side="left")
+        missing = positions == len(self)
+        if snap == "exact":
+            found = self.nanoseconds[np.minimum(positions, len(self) - 1)]
+            missing |= found != nanoseconds
+        return np.where(missing, -1, positions)
+
+    def get_slice(self, start_date=None, end_date=None):
+        """Returns the slice of bar positions from start_date to end_date, both included"""
+        first = 0 if start_date is None else self.get_positions([start_date], "next")[0]
+        last = (
+            len(self)
+            if end_date is None
+            else self.get_positions([end_date], "previous")[0] + 1
+        )
+        if first == -1:
+            first = len(self)
+        return slice(first, max(first, last))
+
+    def get_date(self, position):
+        return self.dates[position]
+
+    def align(self, df, method=None):
+        """
+        Returns df (e.g. one ticker's history) with a row for every bar of the calendar,
+        bars it doesn't have are NaN, or filled from the last bar with method="ffill"
+        """
+        positions = self.get_positions(df.index, "exact")
+        if (positions == -1).any():
+            raise KeyError(
+                f"{pd.Timestamp(df.index[np.argmax(positions == -1)])} is not in the calendar"
+            )
+        values = np.full((len(self), df.shape[1]), np.nan)
+        values[positions] = df.to_numpy(dtype=np.float64)
+        aligned = pd.DataFrame(values, index=self.dates, columns=df.columns)
+        aligned.index.name = df.index.name
+        return aligned.ffill() if method == "ffill" else aligned
+
+    def align_frames(self, frames, method=None):
+        """Returns a (field, ticker) panel of {ticker: history} frames aligned to the calendar"""
+        return (
+            pd.concat(
+                {ticker: self.align(df, method) for ticker, df in frames.items()},
+                axis=1,
+            )
+            .swaplevel(axis=1)
+            .sort_index(axis=1)
+        )
@@ -0,0 +1,207 @@
+# Walk-forward optimisation: the parameters of a strategy are chosen on a train window
+# and run on the test window that follows it, and the out-of-sample test windows are
+# stitched into one equity curve for PortfolioAnalysis.
+#
+# Windows are counted in bars. With anchored=False the train window rolls forward
+# with the test window, with anchored=True it always starts at the first bar.
+#
+# Nothing is recomputed per window. The history is loaded once and the shared
+# indicators computed once (as in ParameterSweep), then every parameter set is run
+# once over the whole range. The indicators only look back, so the positions on any
+# window are a slice of the full-history positions, and every window is scored from
+# slices of one per-bar profit and loss array per parameter set.
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from Classes.ParameterSweep import ParameterSweep
+from Classes.PortfolioAnalysis import PortfolioAnalysis
+
+
+def get_equity(profit_and_loss, initial_cash):
+    """Returns the equity of windows starting at initial_cash from their profit and loss per bar (last axis)"""
+    equity = np.full(np.shape(profit_and_loss), float(initial_cash))
+    equity[..., 1:] += np.cumsum(profit_and_loss[..., 1:], axis=-1)
+    return equity
+
+
+def get_objective(profit_and_loss, dates, initial_cash, objective):
+    """Returns the PortfolioAnalysis statistic `objective` of every (parameter set x bar) row"""
+    equity = get_equity(np.atleast_2d(profit_and_loss), initial_cash)
+    metrics = PortfolioAnalysis.compute_metrics(equity.T, dates)
+    return np.asarray(metrics[objective], dtype=np.float64)
+
+
+def choose_parameters(profit_and_loss, dates, initial_cash, objective):
+    """
+    Returns the row of the (parameter set x bar) profit and loss with the highest
+    objective on its window, and the objective of every row.
+    """
+    scores = get_objective(profit_and_loss, dates, initial_cash, objective)
+    # A window without trades has no risk and so no Sharpe, never choose it over one that has.
+    return int(np.argmax(np.nan_to_num(scores, nan=-np.inf))), scores
+
+
+class WalkForward:
+    """
+    train_bars   bars in each train window (the first train window when anchored)
+    test_bars    bars in each test window, and how far the windows move each step
+    anchored     grow the train window from the first bar instead of rolling it
+    objective    PortfolioAnalysis statistic maximised on the train windows
+    max_workers  processes scoring windows in parallel (0 = run in this process)
+    """
+
+    # Shares held per position, as in StrategyBrain.construct_trades_list.
+    quantity = 100
+
+    def __init__(
+        self,
+        strategy_class,
+        ticker,
+        start_date,
+        end_date,
+        param_grid,
+        train_bars,
+        test_bars,
+        anchored=False,
+        objective="Sharpe Ratio",
+        initial_cash=18000,
+        data_source=None,
+        max_workers=0,
+    ):
+        self.strategy_class = strategy_class
+        self.ticker = ticker
+        self.start_date = start_date
+        self.end_date = end_date
+        self.train_bars = train_bars
+        self.test_bars = test_bars
+        self.anchored = anchored
+        self.objective = objective
+        self.initial_cash = initial_cash
+        self.max_workers = max_workers
+
+        # Loads the history and computes the shared indicators once.
+        self.sweep = ParameterSweep(
+            strategy_class, ticker, start_date, end_date, param_grid, data_source
+        )
+        self.grid = self.sweep.get_grid()
+        self.dates = None
+        self.profit_and_loss = self.get_profit_and_loss()
+        self.portfolio = None
+
+    def get_profit_and_loss(self):
+        """
+        Returns a (parameter set x bar) array of the change in portfolio value on every
+        bar, from positions computed once over the full history for each parameter set.
+        Shares bought at a close earn the price changes until the close they are sold at.
+        """
+        rows = []
+        for params in self.grid:
+            strategy = self.strategy_class(
+                self.start_date,
+                self.end_date,
+                self.ticker,
+                **params,
+                data_source=self.sweep.data_source,
+                data=self.sweep.data,
+            )
+            positions = strategy.data["Position"].to_numpy(dtype=np.float64)
+            prices = strategy.data["Adj Close"].to_numpy(dtype=np.float64)
+            profit_and_loss = np.zeros(len(prices))
+            profit_and_loss[1:] = self.quantity * positions[:-1] * np.diff(prices)
+            rows.append(np.nan_to_num(profit_and_loss))
+            self.dates = strategy.data.index
+        return np.array(rows)
+
+    def get_windows(self):
+        """Returns (train start, test start, test end) bar numbers for every window"""
+        number_of_bars = self.profit_and_loss.shape[1]
+        windows = []
+        test_start = self.train_bars
+        while test_start < number_of_bars:
+            train_start = 0 if self.anchored else test_start - self.train_bars
+            test_end = min(test_start + self.test_bars, number_of_bars)
+            windows.append((train_start, test_start, test_end))
+            test_start += self.test_bars
+        return windows
+
+    def run(self):
+        """
+        Returns a dataframe with one row per window: its dates, the parameters chosen
+        on the train window and the objective on the train and test windows.
+        The stitched out-of-sample equity is kept in self.portfolio (see get_portfolio).
+        """
+        windows = self.get_windows()
+        if not windows:
+            raise ValueError("train_bars leaves no bars to test on")
+        tasks = [
+            (
+                self.profit_and_loss[:, train_start:test_start],
+                self.dates[train_start:test_start],
+                self.initial_cash,
+                self.objective,
+            )
+            for train_start, test_start, _ in windows
+        ]
+        # Every train window is scored independently of the others.
+        if self.max_workers == 0:
+            choices = [choose_parameters(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                choices = list(executor.map(choose_parameters, *zip(*tasks)))
+
+        rows = []
+        test_profit_and_loss = []
+        previous_best = None
+        for (train_start, test_start, test_end), (best, scores) in zip(
+            windows, choices
+        ):
+            test_values = self.profit_and_loss[best, test_start:test_end]
+            # The P&L into a test window's first bar is earned by the position held
+            # under the previous window's parameters, the first window starts flat.
+            stitched_values = test_values.copy()
+            stitched_values[0] = (
+                0
+                if previous_best is None
+                else self.profit_and_loss[previous_best, test_start]
+            )
+            test_profit_and_loss.append(stitched_values)
+            previous_best = best
+            rows.append(
+                {
+                    "Train Start": self.dates[train_start].date(),
+                    "Train End": self.dates[test_start - 1].date(),
+                    "Test Start": self.dates[test_start].date(),
+                    "Test End": self.dates[test_end - 1].date(),
+                    **self.grid[best],
+                    f"Train {self.objective}": scores[best],
+                    # Scored on its own, the window's equity starts at initial_cash
+                    # and a position open at the start earns from its first bar on.
+                    f"Test {self.objective}": get_objective(
+                        test_values,
+                        self.dates[test_start:test_end],
+                        self.initial_cash,
+                        self.objective,
+                    )[0],
+                }
+            )
+
+        profit_and_loss = np.concatenate(test_profit_and_loss)
+        first_test_bar = windows[0][1]
+        self.portfolio = pd.DataFrame(
+            {"Portfolio Value": self.initial_cash + np.cumsum(profit_and_loss)},
+            index=self.dates[first_test_bar : first_test_bar + len(profit_and_loss)],
+        )
+        return pd.DataFrame(rows)
+
+    def get_portfolio(self):
+        """Returns the stitched out-of-sample equity with a "Portfolio Value" column"""
+        if self.portfolio is None:
+            self.run()
+        return self.portfolio
+
+
+# walk_forward = WalkForward(TestStrategy1, "GLD", dt.date(2015, 1, 1), dt.date(2023, 2, 2), {"MA_period": range(5, 60, 5)}, train_bars=504, test_bars=126)
+# print(walk_forward.run())
+# PortfolioAnalysis(walk_forward.get_portfolio()).print_statistics()
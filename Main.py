@@ -2,19 +2,26 @@ from Strategies.TestStrategy1 import TestStrategy1
 from Classes.PortfolioConstructor import PortfolioConstructor
 from Classes.TradeAnalysis import TradeAnalysis
 from Classes.PortfolioAnalysis import PortfolioAnalysis
+from Classes.MarketDataSource import LocalDataStore, YahooDataSource
 import datetime as dt
 
 
 # Main pipeline:
 
+# 0. Every stage reads prices from the local store, which only downloads date ranges it doesn't hold yet.
+# Use CSVDataSource("path/to/fixtures") as the upstream to replay offline.
+# For intraday bars use e.g. YahooDataSource(interval="1h"), or ResampledDataSource to aggregate finer bars.
+data_source = LocalDataStore("market_data", upstream=YahooDataSource())
 # 1. Choose strategy with backtesting start and end dates.
-test_strategy_1 = TestStrategy1(dt.date(2019, 1, 1), dt.date(2023, 2, 2), "GLD", 20)
+test_strategy_1 = TestStrategy1(
+    dt.date(2019, 1, 1), dt.date(2023, 2, 2), "GLD", 20, data_source
+)
 # 2. Get the list of trades from the strategy.
 trades_list = test_strategy_1.get_trades()
 # 3. Create the portfolio with the list of trades from the strategy.
-strategy_portfolio = PortfolioConstructor(trades_list).get_portfolio()
+strategy_portfolio = PortfolioConstructor(trades_list, data_source).get_portfolio()
 # 4. Calculate trade statistics and print.
-trade_analysis = TradeAnalysis(trades_list)
+trade_analysis = TradeAnalysis(trades_list, data_source)
 trade_analysis.print_statistics()
 # 5. Calculate portfolio statistics and print.
 portfolio_analysis = PortfolioAnalysis(strategy_portfolio)
@@ -10,6 +10,7 @@
 import yfinance as yf 
 import datetime as dt 
 import pandas as pd 
+import numpy as np
 
 from PortfolioConstructor import PortfolioConstructor
 
@@ -27,7 +28,7 @@ class SMA_StrategyConstructor():
 		df = yf.download(self.ticker,self.start_date,self.end_date,progress=False)
 		df.drop(['Open','High','Low','Close','Volume'],axis=1,inplace=True)
 		df['MA'] = df['Adj Close'].rolling(window=self.period).mean()
-		df['Signal'] = df.apply(self.get_signals, axis=1)
+		df['Signal'] = np.where(df['Adj Close'] > df['MA'], "BUY", "SELL")
 		return df
 
 	def get_exit_entry_dates(self):
@@ -54,12 +55,6 @@ class SMA_StrategyConstructor():
 			trade_order_list.append([count,self.ticker,100,1,entry_date.date(),exit_date.date()])
 		return trade_order_list
 
-	def get_signals(self,df):
-		if df['Adj Close'] > df['MA']:
-			return "BUY"
-		else :
-			return "SELL"
-
 	def show_trades(self):
 		for trade in self.trade_order_list:
 			print(trade)
@@ -4,32 +4,31 @@ from Classes.PortfolioConstructor import PortfolioConstructor
 from Classes.TradeAnalysis import TradeAnalysis
 from Classes.PortfolioAnalysis import PortfolioAnalysis
 import pandas as pd
+import numpy as np
 
 pd.options.display.max_rows = None
 
 
 class TestStrategy1(StrategyBrain):
-    def __init__(self, start, end, ticker, MA_period):
+    def __init__(self, start, end, ticker, MA_period, data_source=None, data=None):
         # Instatiates super constructor (for StrategyBrain Class)
-        super().__init__(ticker, start, end)
+        super().__init__(ticker, start, end, data_source, data)
         # Creates dataframe with indicators from StrategyBrain Class and signals from this current strategy
         self.indicators_and_signals_df = self.get_indicators(MA_period)
-        self.indicators_and_signals_df["Signal"] = self.indicators_and_signals_df.apply(
-            self.get_signals, axis=1
+        self.indicators_and_signals_df = self.add_signals(
+            self.indicators_and_signals_df
         )
-        # Gets list of tuples of alternating buy and sell signals, e.g [(Buy, date), (Sell, date), (Buy...)]
+        # Gets arrays of entry and exit dates from the switches in the position vector
         self.entry_exit_dates = self.get_entry_exit_dates(
             self.indicators_and_signals_df
         )
-        # Creates 2d list of trades in format [UTID, Ticker, Quantity, Leverage, Buy Date, Sell Date]
+        # Creates table of trades in format [UTID, Ticker, Quantity, Leverage, Buy Date, Sell Date]
         # for Portfolio Constructor Class
         self.trades_list = self.construct_trades_list(self.entry_exit_dates, ticker)
 
-    def get_signals(self, df):
-        if df["Adj Close"] > df["MA"]:
-            return "BUY"
-        else:
-            return "SELL"
+    def get_positions(self, df):
+        # Long while the close is above its moving average.
+        return (df["Adj Close"] > df["MA"]).to_numpy(dtype=np.int8)
 
     def print_trades(self):
         for trade in self.trades_list:
@@ -0,0 +1,171 @@
+# Measures the memory of a universe strategy in float64 and in compact mode, and how far
+# the compact prices, indicators and positions are from the float64 ones.
+#
+# Prices come from a seeded SyntheticDataSource and are generated before anything is
+# measured. For each mode the strategy is built, its indicators, positions and trades
+# computed, and the tracemalloc peak of that run and the bytes held afterwards by
+# self.data and the trades table are recorded. The results are printed as JSON.
+#
+# Run from the repository root:
+#     python -m benchmarks.compact_memory --tickers 500 --bars 5040
+#     python -m benchmarks.compact_memory --tickers 50,500 --bars 5040 --output compact.json
+
+import argparse
+import json
+import platform
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from Classes.IndicatorCache import IndicatorCache
+from Classes.MarketDataSource import SyntheticDataSource
+from Classes.StrategyBrain import StrategyBrain
+
+
+class MovingAverageStrategy(StrategyBrain):
+    """Long while the close is above its moving average, for every ticker"""
+
+    def get_positions(self, df):
+        return (df["Adj Close"] > df["MA"]).to_numpy(dtype=np.int8)
+
+
+class LazyMovingAverageStrategy(MovingAverageStrategy):
+    required_indicators = ["MA"]
+
+
+def run_strategy(strategy_class, tickers, data, MA_period, compact):
+    """Returns the strategy and its trades after running every stage"""
+    strategy = strategy_class(
+        tickers,
+        data.index[0],
+        data.index[-1] + pd.Timedelta(days=1),
+        data=data,
+        indicator_cache=IndicatorCache(),
+        compact=compact,
+    )
+    signals = strategy.add_signals(strategy.get_indicators(MA_period))
+    trades = strategy.construct_trades_list(
+        strategy.get_entry_exit_dates(signals), None
+    )
+    return strategy, trades
+
+
+def measure(strategy_class, tickers, data, MA_period, compact):
+    """Returns the strategy, its trades and the memory they took"""
+    tracemalloc.start()
+    try:
+        strategy, trades = run_strategy(
+            strategy_class, tickers, data, MA_period, compact
+        )
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return (
+        strategy,
+        trades,
+        {
+            "peak_memory_bytes": peak,
+            "data_bytes": int(strategy.data.memory_usage(deep=True).sum()),
+            "trades_bytes": trades.get_memory_usage(),
+            "columns": sorted(set(strategy.data.columns.get_level_values(0))),
+        },
+    )
+
+
+def get_relative_error(compact, full):
+    """Returns the largest |compact - full| / |full| where both have a value"""
+    compact = compact.to_numpy(dtype=np.float64)
+    full = full.to_numpy(dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        error = np.abs(compact - full) / np.abs(full)
+    return float(np.nanmax(error[np.isfinite(error)]))
+
+
+def get_accuracy(compact, full, compact_trades, full_trades):
+    """Returns the errors of the compact strategy against the float64 one"""
+    accuracy = {
+        f"{field} relative error": get_relative_error(
+            compact.data[field], full.data[field]
+        )
+        for field in ["Adj Close", "Volume", "MA", "VWAP"]
+    }
+    # MACD crosses zero, so its error is measured against the price level instead.
+    accuracy["MACD error / price"] = float(
+        np.nanmax(
+            np.abs(
+                compact.data["MACD"].to_numpy(np.float64)
+                - full.data["MACD"].to_numpy(np.float64)
+            )
+            / full.data["Adj Close"].to_numpy(np.float64)
+        )
+    )
+    positions = compact.data["Position"].to_numpy() != full.data["Position"].to_numpy()
+    accuracy["positions changed"] = int(positions.sum())
+    accuracy["positions changed %"] = 100 * float(positions.mean())
+    accuracy["trades"] = [len(full_trades), len(compact_trades)]
+    same = len(full_trades) == len(compact_trades) and (
+        np.array_equal(full_trades.buy_dates, compact_trades.buy_dates)
+        and np.array_equal(full_trades.sell_dates, compact_trades.sell_dates)
+    )
+    accuracy["same trades"] = bool(same)
+    return accuracy
+
+
+def run_size(number_of_tickers, bars, MA_period, seed):
+    tickers = [f"SYN{number}" for number in range(number_of_tickers)]
+    data = SyntheticDataSource(bars, seed=seed).get_panel(
+        tickers, "1900-01-01", "2200-01-01"
+    )
+
+    results = {}
+    strategies = {}
+    for name, strategy_class, compact in [
+        ("float64", MovingAverageStrategy, False),
+        ("compact", MovingAverageStrategy, True),
+        ("compact, required_indicators", LazyMovingAverageStrategy, True),
+    ]:
+        strategy, trades, memory = measure(
+            strategy_class, tickers, data, MA_period, compact
+        )
+        results[name] = memory
+        strategies[name] = (strategy, trades)
+        del strategy, trades
+
+    full, full_trades = strategies["float64"]
+    compact, compact_trades = strategies["compact"]
+    return {
+        "tickers": number_of_tickers,
+        "bars": bars,
+        "MA_period": MA_period,
+        "memory": results,
+        "accuracy": get_accuracy(compact, full, compact_trades, full_trades),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", default="50,500")
+    parser.add_argument("--bars", type=int, default=5040)
+    parser.add_argument("--ma-period", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "results": [
+            run_size(int(tickers), args.bars, args.ma_period, args.seed)
+            for tickers in args.tickers.split(",")
+        ],
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
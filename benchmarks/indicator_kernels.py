@@ -0,0 +1,98 @@
+# Benchmarks the IndicatorKernels rewrite of the StrategyBrain indicators against the
+# previous implementations, which ran .rolling()/.ewm() over the whole self.data frame
+# (including Open/High/Low/Volume and indicator columns already added) and then picked
+# out "Adj Close".
+#
+# Run from the repository root:
+#     python -m benchmarks.indicator_kernels --bars 100000 --extra-columns 5
+
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+from Classes import IndicatorKernels as kernels
+
+
+def make_data(bars, extra_columns, seed=0):
+    """Returns a seeded random-walk OHLCV frame with extra indicator-like columns"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, bars)))
+    data = pd.DataFrame(
+        {
+            "Open": close * (1 + rng.normal(0, 0.002, bars)),
+            "High": close * 1.01,
+            "Low": close * 0.99,
+            "Close": close,
+            "Adj Close": close,
+            "Volume": rng.integers(1e5, 1e6, bars).astype(np.float64),
+        },
+        index=pd.bdate_range("1970-01-01", periods=bars) if bars < 60000 else None,
+    )
+    for i in range(extra_columns):
+        data[f"Indicator {i}"] = close
+    return data
+
+
+def previous_implementations(data, period):
+    close = data["Adj Close"]
+    return {
+        "SMA": lambda: data.rolling(window=period).mean()["Adj Close"],
+        "EMA": lambda: data.ewm(span=period).mean()["Adj Close"],
+        "Bollinger": lambda: (
+            data.rolling(window=period)["Adj Close"].mean(),
+            data.rolling(window=period)["Adj Close"].std(),
+        ),
+        "RSI": lambda: close.diff()
+        .clip(lower=0)
+        .ewm(span=period - 1, min_periods=period)
+        .mean(),
+        "MFI sums": lambda: (close * data["Volume"]).rolling(window=period).sum(),
+    }
+
+
+def kernel_implementations(data, period):
+    close = data["Adj Close"].to_numpy(dtype=np.float64)
+    volume = data["Volume"].to_numpy(dtype=np.float64)
+    return {
+        "SMA": lambda: kernels.sma(close, period),
+        "EMA": lambda: kernels.ema(close, period),
+        "Bollinger": lambda: (
+            kernels.sma(close, period),
+            kernels.rolling_std(close, period),
+        ),
+        "RSI": lambda: kernels.ema(
+            np.clip(np.diff(close, prepend=np.nan), 0, None), period - 1, period
+        ),
+        "MFI sums": lambda: kernels.rolling_sum(close * volume, period),
+    }
+
+
+def best_time(function, repeat):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bars", type=int, default=100_000)
+    parser.add_argument("--period", type=int, default=20)
+    parser.add_argument("--extra-columns", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = make_data(args.bars, args.extra_columns)
+    previous = previous_implementations(data, args.period)
+    new = kernel_implementations(data, args.period)
+    print(f"{args.bars} bars, {len(data.columns)} columns, period {args.period}")
+    print(f"{'Indicator':<12}{'Previous (ms)':>15}{'Kernel (ms)':>15}{'Speed-up':>10}")
+    for name in previous:
+        previous_time = best_time(previous[name], args.repeat)
+        new_time = best_time(new[name], args.repeat)
+        print(
+            f"{name:<12}{previous_time * 1000:>15.2f}{new_time * 1000:>15.2f}"
+            f"{previous_time / new_time:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
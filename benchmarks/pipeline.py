@@ -0,0 +1,245 @@
+# Times every stage of the Main.py pipeline on synthetic data, separately and end to end:
+# data load, StrategyBrain indicators, signals, entry/exit dates, trades list,
+# PortfolioConstructor (without and with a cost model), TradeAnalysis and PortfolioAnalysis.
+#
+# Prices come from a seeded SyntheticDataSource written once into a temporary
+# LocalDataStore, so no stage touches the network and every run sees the same bars.
+# The results are printed as JSON (one record per size) with the best time of each
+# stage over --repeat runs and, unless --no-memory is given, the peak memory the stage
+# allocated, traced with tracemalloc in an extra run (tracing slows everything down, so
+# that run isn't timed).
+#
+# Run from the repository root:
+#     python -m benchmarks.pipeline --sizes 1000,10000,100000 --output results.json
+#     python -m benchmarks.pipeline --sizes 10000000 --tickers 1 --repeat 1
+#
+# Daily bars can't go back more than ~200 years (pandas timestamps start in 1677), so
+# sizes over 50,000 bars use minute bars unless --frequency is given.
+
+import argparse
+import json
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from Classes.CostModel import CostModel
+from Classes.IndicatorCache import IndicatorCache
+from Classes.MarketDataSource import LocalDataStore, SyntheticDataSource
+from Classes.PortfolioAnalysis import PortfolioAnalysis
+from Classes.PortfolioConstructor import PortfolioConstructor
+from Classes.StrategyBrain import StrategyBrain
+from Classes.TradeAnalysis import TradeAnalysis
+
+STAGES = [
+    "Load data",
+    "Indicators",
+    "Signals",
+    "Entry/exit dates",
+    "Trades list",
+    "PortfolioConstructor",
+    "PortfolioConstructor with costs",
+    "TradeAnalysis",
+    "PortfolioAnalysis",
+]
+
+# Every kind of cost, so the costed construction does all of its work.
+COST_MODEL = CostModel(
+    commission_per_share=0.005,
+    commission_rate=0.0005,
+    minimum_commission=1,
+    spread=0.0002,
+    impact=0.1,
+    financing_rate=0.05,
+    borrow_rate=0.01,
+)
+
+
+class MovingAverageStrategy(StrategyBrain):
+    """TestStrategy1 without the work in __init__, so each stage can be timed on its own"""
+
+    def get_positions(self, df):
+        return (df["Adj Close"] > df["MA"]).to_numpy(dtype=np.int8)
+
+
+def get_frequency(bars, frequency=None):
+    if frequency is not None:
+        return frequency
+    return "B" if bars <= 50_000 else "min"
+
+
+def make_store(root, bars, tickers, frequency, seed):
+    """Returns a LocalDataStore holding the synthetic history and its (start, end) dates"""
+    # Ends in the past so the store doesn't clamp the range to today.
+    dates = pd.date_range(end="2019-12-31", periods=bars, freq=frequency)
+    upstream = SyntheticDataSource(bars, frequency, dates[0], seed)
+    store = LocalDataStore(root, upstream=upstream)
+    start_date, end_date = dates[0], dates[-1]
+    for ticker in tickers:
+        store.get_history(ticker, start_date, end_date + pd.Timedelta(days=1))
+    # Reads go through the store only.
+    store.upstream = None
+    store.arrays = {}
+    return store, start_date, end_date
+
+
+def run_pipeline(store, tickers, start_date, end_date, MA_period, measure):
+    """Runs every stage once, calling measure(stage, function) to run and measure each"""
+    ticker = tickers[0] if len(tickers) == 1 else tickers
+    # The last bar is the backtest end date, on which open positions are sold.
+    if len(tickers) == 1:
+        load = lambda: store.get_history(ticker, start_date, end_date)
+    else:
+        load = lambda: store.get_panel(tickers, start_date, end_date)
+    data = measure("Load data", load)
+
+    strategy = MovingAverageStrategy(
+        ticker,
+        start_date,
+        end_date,
+        data_source=store,
+        data=data,
+        indicator_cache=IndicatorCache(),
+    )
+    indicators = measure("Indicators", lambda: strategy.get_indicators(MA_period))
+    signals = measure("Signals", lambda: strategy.add_signals(indicators))
+    entry_exit_dates = measure(
+        "Entry/exit dates", lambda: strategy.get_entry_exit_dates(signals)
+    )
+    trades = measure(
+        "Trades list",
+        lambda: strategy.construct_trades_list(entry_exit_dates, ticker),
+    )
+    portfolio = measure(
+        "PortfolioConstructor",
+        lambda: PortfolioConstructor(trades, store).get_portfolio(),
+    )
+    measure(
+        "PortfolioConstructor with costs",
+        lambda: PortfolioConstructor(
+            trades, store, cost_model=COST_MODEL
+        ).get_portfolio(),
+    )
+    measure(
+        "TradeAnalysis",
+        lambda: TradeAnalysis(trades, store, prices=data).get_statistics(),
+    )
+    measure("PortfolioAnalysis", lambda: PortfolioAnalysis(portfolio).compute_all())
+    return len(trades)
+
+
+def time_pipeline(store, tickers, start_date, end_date, MA_period, repeat):
+    """Returns the best time of every stage and end to end, and the number of trades"""
+    best = {}
+    for _ in range(repeat):
+        times = {}
+
+        def measure(stage, function):
+            start = time.perf_counter()
+            result = function()
+            times[stage] = time.perf_counter() - start
+            return result
+
+        start = time.perf_counter()
+        trades = run_pipeline(store, tickers, start_date, end_date, MA_period, measure)
+        times["End to end"] = time.perf_counter() - start
+        for stage, seconds in times.items():
+            best[stage] = min(best.get(stage, seconds), seconds)
+    return best, trades
+
+
+def trace_pipeline(store, tickers, start_date, end_date, MA_period):
+    """
+    Returns the tracemalloc peak of every stage in bytes, counted from what was already
+    allocated when the stage started, and the overall peak as "End to end"
+    """
+    peaks = {"End to end": 0}
+
+    def measure(stage, function):
+        allocated = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = function()
+        peak = tracemalloc.get_traced_memory()[1]
+        peaks[stage] = peak - allocated
+        peaks["End to end"] = max(peaks["End to end"], peak)
+        return result
+
+    tracemalloc.start()
+    try:
+        run_pipeline(store, tickers, start_date, end_date, MA_period, measure)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def run_size(bars, number_of_tickers, frequency, MA_period, repeat, memory, seed):
+    tickers = [f"SYN{number}" for number in range(number_of_tickers)]
+    root = tempfile.mkdtemp(prefix="benchmark_store_")
+    try:
+        store, start_date, end_date = make_store(root, bars, tickers, frequency, seed)
+        times, trades = time_pipeline(
+            store, tickers, start_date, end_date, MA_period, repeat
+        )
+        peaks = (
+            trace_pipeline(store, tickers, start_date, end_date, MA_period)
+            if memory
+            else {}
+        )
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "bars": bars,
+        "tickers": number_of_tickers,
+        "frequency": frequency,
+        "MA_period": MA_period,
+        "trades": trades,
+        "repeat": repeat,
+        "stages": {
+            stage: {"seconds": times[stage], "peak_memory_bytes": peaks.get(stage)}
+            for stage in STAGES + ["End to end"]
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--tickers", type=int, default=1)
+    parser.add_argument("--frequency", default=None)
+    parser.add_argument("--ma-period", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "results": [
+            run_size(
+                int(size),
+                args.tickers,
+                get_frequency(int(size), args.frequency),
+                args.ma_period,
+                args.repeat,
+                not args.no_memory,
+                args.seed,
+            )
+            for size in args.sizes.split(",")
+        ],
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
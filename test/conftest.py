@@ -0,0 +1,50 @@
+# Shared fixtures: a few tickers of seeded business-day bars served from memory, so the
+# tests run without the network.
+#
+# Run from the repository root:
+#     python -m pytest -q test
+
+import numpy as np
+import pandas as pd
+import pytest
+from Classes.MarketDataSource import InMemoryDataSource
+
+START_DATE = "2020-01-01"
+BARS = 120
+
+
+def make_frame(dates, seed):
+    """Returns seeded random-walk OHLCV bars on the dates"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(dates))))
+    return pd.DataFrame(
+        {
+            "Open": close,
+            "High": close * 1.01,
+            "Low": close * 0.99,
+            "Close": close,
+            "Adj Close": close,
+            "Volume": rng.integers(1e5, 1e6, len(dates)).astype(np.float64),
+        },
+        index=pd.DatetimeIndex(dates, name="Date"),
+    )
+
+
+@pytest.fixture
+def dates():
+    return pd.bdate_range(START_DATE, periods=BARS)
+
+
+@pytest.fixture
+def frames(dates):
+    """{ticker: history}, LATE is only listed from the 40th bar"""
+    return {
+        "AAA": make_frame(dates, 1),
+        "BBB": make_frame(dates, 2),
+        "LATE": make_frame(dates[40:], 3),
+    }
+
+
+@pytest.fixture
+def data_source(frames):
+    return InMemoryDataSource(frames)
@@ -0,0 +1,25 @@
+import os
+
+from Classes import BacktestExecutor as backtest_executor
+from Classes.BacktestExecutor import BacktestExecutor
+from Strategies.TestStrategy1 import TestStrategy1 as MovingAverageStrategy
+
+
+def test_close_releases_the_in_process_store(dates, data_source):
+    executor = BacktestExecutor(data_source, max_workers=0)
+    jobs = BacktestExecutor.make_jobs(
+        MovingAverageStrategy,
+        ["AAA", "BBB"],
+        {"MA_period": [5, 10]},
+        dates[0],
+        dates[-1],
+    )
+    results = executor.run(jobs)
+    assert len(results) == 4
+    assert "Error" not in results or results["Error"].isna().all()
+
+    key = (executor.store.root, executor.store.interval)
+    assert key in backtest_executor.worker_stores
+    executor.close()
+    assert key not in backtest_executor.worker_stores
+    assert not os.path.exists(key[0])
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+from Classes.CostModel import CostModel
+from Classes.PortfolioConstructor import PortfolioConstructor
+from Classes.TargetWeightConstructor import TargetWeightConstructor
+
+
+def get_trades(dates):
+    # UTID:  Ticker:  Quantity:  Leverage: Buy Date:  Sell Date:
+    return [
+        [1, "AAA", 10, 1, dates[2], dates[20]],
+        [2, "BBB", 5, 3, dates[5], dates[50]],
+        [3, "AAA", -8, 1, dates[10], dates[30]],
+        [4, "LATE", 4, 2, dates[45], dates[90]],
+    ]
+
+
+def test_zero_cost_model_is_cost_free(dates, data_source):
+    trades = get_trades(dates)
+    cost_free = PortfolioConstructor(trades, data_source).df
+    zero_cost = PortfolioConstructor(trades, data_source, cost_model=CostModel()).df
+    pd.testing.assert_frame_equal(zero_cost, cost_free, check_exact=False, rtol=1e-12)
+
+    weights = pd.DataFrame(
+        {"AAA": 0.6, "BBB": -0.2, "LATE": 0.3}, index=dates[[0, 30, 60, -1]]
+    )
+    cost_free = TargetWeightConstructor(weights, data_source, rebalance=5).df
+    zero_cost = TargetWeightConstructor(
+        weights, data_source, rebalance=5, cost_model=CostModel()
+    ).df
+    pd.testing.assert_frame_equal(zero_cost, cost_free)
+
+
+def test_commissions_and_spread_are_paid_on_every_fill(dates, data_source, frames):
+    trades = get_trades(dates)
+    cost_model = CostModel(commission_rate=0.001, spread=0.002)
+    cost_free = PortfolioConstructor(trades, data_source).df
+    costed = PortfolioConstructor(trades, data_source, cost_model=cost_model).df
+
+    # Every fill loses half the spread, 0.001 of the price, and pays 0.001 of the value
+    # traded at the fill price. A long buys on entry, a short sells. The cash is
+    # compared on bar 51, once BBB's sale proceeds are in and LATE is still held.
+    costs = 0.0
+    for utid, ticker, quantity, leverage, buy_date, sell_date in trades[:-1]:
+        prices = frames[ticker]["Adj Close"]
+        shares, side = abs(quantity * leverage), np.sign(quantity)
+        for price, fill_side in [(prices[buy_date], side), (prices[sell_date], -side)]:
+            fill_price = price * (1 + 0.001 * fill_side)
+            costs += shares * (0.001 * price + 0.001 * fill_price)
+    # Only LATE's entry has been paid for by then.
+    late_price = frames["LATE"]["Adj Close"][dates[45]]
+    costs += 8 * (0.001 * late_price + 0.001 * late_price * 1.001)
+    # Both cash columns are rounded to cents.
+    np.testing.assert_allclose(
+        cost_free["cash"][dates[51]] - costed["cash"][dates[51]], costs, atol=0.01
+    )
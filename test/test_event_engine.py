@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+import pytest
+from Classes.EventEngine import LIMIT, MARKET, STOP, EventEngine
+from Classes.MarketDataSource import InMemoryDataSource
+from Classes.StrategyBrain import StrategyBrain
+
+INITIAL_CASH = 10000
+
+# Open, High, Low, Close. Bar 3 gaps down, bar 4 rallies through its range.
+BARS = np.array(
+    [
+        [100, 101, 99, 100],
+        [102, 104, 101, 103],
+        [103, 106, 100, 105],
+        [99, 100, 95, 96],
+        [97, 110, 96, 108],
+        [108, 109, 107, 108],
+    ],
+    dtype=np.float64,
+)
+DATES = pd.bdate_range("2020-01-06", periods=len(BARS))
+
+
+def make_frame(bars, dates):
+    return pd.DataFrame(
+        {
+            "Open": bars[:, 0],
+            "High": bars[:, 1],
+            "Low": bars[:, 2],
+            "Close": bars[:, 3],
+            "Adj Close": bars[:, 3],
+            "Volume": 1e5,
+        },
+        index=pd.DatetimeIndex(dates, name="Date"),
+    )
+
+
+class ScriptedStrategy(StrategyBrain):
+    """Submits {bar: [(ticker, quantity, order_type, price)]} and records the equity"""
+
+    def __init__(self, ticker, data_source, orders):
+        super().__init__(
+            ticker, DATES[0], DATES[-1] + pd.Timedelta(days=1), data_source
+        )
+        self.orders = orders
+
+    def on_start(self, engine):
+        self.equity = []
+
+    def on_bar(self, engine, bar):
+        for order in self.orders.get(bar, []):
+            engine.submit_order(*order)
+        self.equity.append(engine.get_equity())
+
+
+def run(orders, ticker="AAA", frames=None):
+    frames = frames if frames is not None else {"AAA": make_frame(BARS, DATES)}
+    strategy = ScriptedStrategy(ticker, InMemoryDataSource(frames), orders)
+    engine = EventEngine(strategy, initial_cash=INITIAL_CASH)
+    portfolio = engine.run()
+    return engine, strategy, portfolio
+
+
+def test_market_order_fills_at_the_next_open():
+    engine, strategy, portfolio = run({0: [("AAA", 10, MARKET, None)]})
+    fills = engine.get_fills()
+    assert len(fills) == 1
+    assert fills["Date"][0] == DATES[1]
+    assert fills["Price"][0] == 102
+
+    # Nothing is held at the close of the bar the order was placed on.
+    assert strategy.equity[0] == INITIAL_CASH
+    expected = INITIAL_CASH - 10 * 102 + 10 * BARS[1:, 3]
+    np.testing.assert_allclose(strategy.equity[1:], expected)
+    np.testing.assert_allclose(portfolio["Portfolio Value"], strategy.equity)
+
+
+@pytest.mark.parametrize(
+    "placed, quantity, order_type, price, fill_bar, fill_price",
+    [
+        # Buy limits: inside the bar's range, then already below the limit at the open.
+        (0, 10, LIMIT, 101, 1, 101),
+        (1, 10, LIMIT, 98, 3, 98),
+        (2, 10, LIMIT, 100, 3, 99),
+        # Sell limits.
+        (3, -10, LIMIT, 109, 4, 109),
+        (4, -10, LIMIT, 107, 5, 108),
+        # Sell stops: inside the bar's range, then gapped through at the open.
+        (1, -10, STOP, 101, 2, 101),
+        (2, -10, STOP, 100, 3, 99),
+        # Buy stops.
+        (3, 10, STOP, 107, 4, 107),
+        (3, 10, STOP, 96, 4, 97),
+    ],
+)
+def test_limit_and_stop_orders_trigger(
+    placed, quantity, order_type, price, fill_bar, fill_price
+):
+    engine, strategy, portfolio = run({placed: [("AAA", quantity, order_type, price)]})
+    fills = engine.get_fills()
+    assert len(fills) == 1
+    assert fills["Date"][0] == DATES[fill_bar]
+    assert fills["Price"][0] == fill_price
+    assert engine.get_position("AAA") == quantity
+    assert not engine.orders
+    cash = np.full(len(BARS), float(INITIAL_CASH))
+    cash[fill_bar:] -= quantity * fill_price
+    np.testing.assert_allclose(portfolio["cash"], cash)
+
+
+def test_untriggered_orders_keep_working():
+    engine, strategy, portfolio = run(
+        {0: [("AAA", 10, LIMIT, 90), ("AAA", -10, LIMIT, 120), ("AAA", 10, STOP, 111)]}
+    )
+    assert engine.get_fills().empty
+    assert len(engine.orders) == 3
+    assert (portfolio["Portfolio Value"] == INITIAL_CASH).all()
+
+
+def test_missing_close_is_valued_at_the_last_close():
+    # GAP has no bar 3, so its position is valued at bar 2's close there, not at 0.
+    frames = {
+        "AAA": make_frame(BARS, DATES),
+        "GAP": make_frame(BARS[[0, 1, 2, 4, 5]], DATES[[0, 1, 2, 4, 5]]),
+    }
+    engine, strategy, portfolio = run(
+        {0: [("GAP", 10, MARKET, None)]}, ["AAA", "GAP"], frames
+    )
+    closes = BARS[:, 3].copy()
+    closes[3] = closes[2]
+    expected = INITIAL_CASH - 10 * 102 + 10 * closes[1:]
+    np.testing.assert_allclose(strategy.equity[1:], expected)
+    np.testing.assert_allclose(portfolio["Portfolio Value"], strategy.equity)
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+import pytest
+from Classes import IndicatorKernels as kernels
+from Classes.MarketDataSource import InMemoryDataSource
+from Classes.StrategyBrain import StrategyBrain
+from conftest import make_frame
+
+# Longer than IndicatorKernels.BLOCK_SIZE, so windows cross the blocks the running
+# sums restart at.
+BARS = 2600
+
+
+# The pandas versions of the StrategyBrain indicators before the kernels.
+def old_sma(data, period):
+    return data.rolling(window=period).mean()["Adj Close"]
+
+
+def old_ema(data, period):
+    return data.ewm(span=period).mean()["Adj Close"]
+
+
+def old_bollinger_bands(data, period, numsd):
+    df = pd.DataFrame()
+    df["Average"] = data.rolling(window=period)["Adj Close"].mean()
+    standard_deviation = data.rolling(window=period)["Adj Close"].std()
+    df["Upper Band"] = df["Average"] + (standard_deviation * numsd)
+    df["Lower Band"] = df["Average"] - (standard_deviation * numsd)
+    return df
+
+
+def old_vwap(data):
+    typical_price = (data["Low"] + data["High"] + data["Close"]) / 3
+    return (typical_price * data["Volume"]).cumsum() / data["Volume"].cumsum()
+
+
+def old_rsi(data, period):
+    change = data["Adj Close"].diff()
+    up = change.clip(lower=0)
+    down = -change.clip(upper=0)
+    ma_up = up.ewm(span=period - 1, adjust=True, min_periods=period).mean()
+    ma_down = down.ewm(span=period - 1, adjust=True, min_periods=period).mean()
+    return 100 - (100 / (1 + ma_up / ma_down))
+
+
+def old_mfi(data, period):
+    typical_price = (data["Low"] + data["High"] + data["Close"]) / 3
+    raw_money_flow = typical_price * data["Volume"]
+    change = typical_price.diff()
+    positive = raw_money_flow.where(change >= 0).fillna(0)
+    negative = raw_money_flow.where(change < 0).fillna(0)
+    money_ratio = (
+        positive.rolling(window=period).sum() / negative.rolling(window=period).sum()
+    )
+    return 100 - (100 / (1 + money_ratio))
+
+
+def exact_rolling_std(values, window):
+    """Returns the rolling standard deviation of every full window, in long double"""
+    values = np.asarray(values, dtype=np.longdouble)
+    result = np.full(values.shape, np.nan)
+    for row in range(window - 1, len(values)):
+        result[row] = np.std(values[row + 1 - window : row + 1], axis=0, ddof=1)
+    return result
+
+
+def assert_matches(new, old, atol=0.0):
+    new, old = np.asarray(new, dtype=np.float64), np.asarray(old, dtype=np.float64)
+    # The same warm-up bars are NaN.
+    np.testing.assert_array_equal(np.isnan(new), np.isnan(old))
+    np.testing.assert_allclose(new, old, rtol=1e-9, atol=atol, equal_nan=True)
+
+
+@pytest.fixture
+def strategy():
+    dates = pd.bdate_range("2000-01-03", periods=BARS)
+    frame = make_frame(dates, 7)
+    # A high price level with small moves is the hard case for the rolling variance.
+    frame[["Open", "High", "Low", "Close", "Adj Close"]] += 5000
+    source = InMemoryDataSource({"AAA": frame})
+    return StrategyBrain("AAA", dates[0], dates[-1] + pd.Timedelta(days=1), source)
+
+
+@pytest.mark.parametrize("period", [2, 14, 20, 200])
+def test_moving_averages_match_pandas(strategy, period):
+    data = strategy.data.copy()
+    assert_matches(strategy.simple_moving_average(period), old_sma(data, period))
+    assert_matches(strategy.exponential_moving_average(period), old_ema(data, period))
+    bands = strategy.bollinger_bands(period, 2)
+    old_bands = old_bollinger_bands(data, period, 2)
+    for column in ["Average", "Upper Band", "Lower Band"]:
+        # pandas' rolling std loses up to 1e-5 to cancellation at this price level, the
+        # kernel stays within 1e-7 of the exact value.
+        assert_matches(bands[column], old_bands[column], atol=2e-5)
+    standard_deviation = exact_rolling_std(data["Adj Close"], period)
+    assert_matches(bands["Upper Band"] - bands["Average"], 2 * standard_deviation, 2e-7)
+
+
+def test_macd_matches_pandas(strategy):
+    data = strategy.data.copy()
+    # The MACD crosses 0, so it is compared to the price level rather than itself.
+    assert_matches(strategy.macd(), old_ema(data, 12) - old_ema(data, 26), 1e-9)
+
+
+@pytest.mark.parametrize("period", [3, 14, 30])
+def test_oscillators_match_pandas(strategy, period):
+    data = strategy.data.copy()
+    assert_matches(strategy.rsi(period), old_rsi(data, period))
+    assert_matches(strategy.mfi(period), old_mfi(data, period))
+
+
+def test_vwap_matches_pandas(strategy):
+    assert_matches(strategy.vwap(), old_vwap(strategy.data.copy()))
+
+
+@pytest.mark.parametrize("window", [3, 20, 1500])
+def test_kernels_with_gaps_match_pandas(window):
+    rng = np.random.default_rng(0)
+    values = 100 + np.cumsum(rng.normal(0, 1, (BARS, 3)), axis=0)
+    # Missing bars, e.g. a ticker not listed yet or not trading for a while.
+    values[:40, 1] = np.nan
+    values[1200:1210, 2] = np.nan
+    values[rng.integers(0, BARS, 30), 0] = np.nan
+    df = pd.DataFrame(values)
+
+    assert_matches(kernels.rolling_sum(values, window), df.rolling(window).sum())
+    assert_matches(kernels.sma(values, window), df.rolling(window).mean())
+    assert_matches(
+        kernels.rolling_std(values, window), exact_rolling_std(values, window), 1e-9
+    )
+    assert_matches(kernels.ema(values, window), df.ewm(span=window).mean())
+    assert_matches(
+        kernels.ema(values, window, min_periods=window),
+        df.ewm(span=window, min_periods=window).mean(),
+    )
+    # One ticker on its own.
+    assert_matches(
+        kernels.rolling_std(values[:, 2], window),
+        exact_rolling_std(values[:, 2], window),
+        1e-9,
+    )
@@ -0,0 +1,53 @@
+import pandas as pd
+from Classes.MarketDataSource import InMemoryDataSource, LocalDataStore
+
+
+class FlakyDataSource(InMemoryDataSource):
+    """Returns an empty frame, as yfinance does for a failed download, while failing"""
+
+    def __init__(self, frames):
+        super().__init__(frames)
+        self.failing = False
+        self.requests = []
+
+    def get_history(self, ticker, start_date, end_date):
+        self.requests.append((start_date, end_date))
+        if self.failing:
+            return self.frames[ticker].iloc[:0].copy()
+        return super().get_history(ticker, start_date, end_date)
+
+
+def test_failed_download_is_fetched_again(frames, dates, tmp_path):
+    upstream = FlakyDataSource(frames)
+    store = LocalDataStore(tmp_path, upstream)
+
+    upstream.failing = True
+    assert len(store.get_history("AAA", dates[0], dates[50])) == 0
+    assert store.get_coverage("AAA") is None
+
+    upstream.failing = False
+    history = store.get_history("AAA", dates[0], dates[50])
+    pd.testing.assert_frame_equal(history, frames["AAA"].iloc[:50], check_freq=False)
+
+    # Failing after the coverage leaves the coverage where it was.
+    upstream.failing = True
+    assert len(store.get_history("AAA", dates[0], dates[80])) == 50
+    assert store.get_coverage("AAA")[1] == dates[50]
+    upstream.failing = False
+    history = store.get_history("AAA", dates[0], dates[80])
+    pd.testing.assert_frame_equal(history, frames["AAA"].iloc[:80], check_freq=False)
+
+
+def test_weekend_without_bars_is_covered(frames, dates, tmp_path):
+    upstream = FlakyDataSource(frames)
+    store = LocalDataStore(tmp_path, upstream)
+    friday = dates[dates.weekday == 4][2]
+    saturday, monday = friday + pd.Timedelta(days=1), friday + pd.Timedelta(days=3)
+    store.get_history("AAA", dates[0], saturday)
+
+    # Nothing is published over the weekend, so it is only asked for once.
+    for _ in range(2):
+        history = store.get_history("AAA", dates[0], monday)
+        assert len(history) == dates.get_loc(friday) + 1
+    assert upstream.requests[1:] == [(saturday, monday)]
+    assert store.get_coverage("AAA")[1] == monday
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from Classes.CostModel import CostModel
+from Classes.PortfolioConstructor import PortfolioConstructor
+
+
+def get_trades(dates):
+    # UTID:  Ticker:  Quantity:  Leverage: Buy Date:  Sell Date:
+    return [
+        [1, "AAA", 10, 1, dates[2], dates[10]],
+        [2, "BBB", 5, 2, dates[5], dates[30]],
+        [3, "AAA", 7, 1, dates[11], dates[25]],
+        [4, "BBB", -8, 1, dates[40], dates[60]],
+        [5, "LATE", 3, 1, dates[45], dates[70]],
+    ]
+
+
+def build_both(trades, data_source):
+    return [
+        PortfolioConstructor(trades, data_source, engine=engine).df
+        for engine in ["sweep", "loop"]
+    ]
+
+
+def test_engines_match(dates, data_source):
+    sweep, loop = build_both(get_trades(dates), data_source)
+    assert sweep.index.equals(loop.index)
+    # The value is NaN until LATE is listed, in both engines.
+    assert sweep["value"].iloc[40:].notna().all()
+    for column in ["value", "cash"]:
+        np.testing.assert_allclose(sweep[column], loop[column], rtol=1e-12)
+
+
+def test_overlapping_trades_in_one_ticker(dates, data_source, frames):
+    # The sweep engine adds up overlapping trades in the same ticker, the loop engine
+    # writes each trade's quantity over the last one's. Both pay for and are paid for
+    # every trade, so only the value of the overwritten shares differs: the loop's
+    # portfolio is short of the first trade's 10 AAA shares from bar 8 to 15, and of
+    # the second trade's 4 on bar 20, where the third trade buys as the second sells.
+    trades = [
+        [1, "AAA", 10, 1, dates[3], dates[15]],
+        [2, "AAA", 4, 1, dates[8], dates[20]],
+        [3, "AAA", 6, 1, dates[20], dates[30]],
+    ]
+    sweep, loop = build_both(trades, data_source)
+    np.testing.assert_allclose(sweep["cash"], loop["cash"], rtol=1e-12)
+
+    overwritten = np.zeros(len(sweep))
+    overwritten[8 - 3 : 15 - 3 + 1] = 10
+    overwritten[20 - 3] = 4
+    prices = frames["AAA"]["Adj Close"].loc[sweep.index]
+    np.testing.assert_allclose(
+        sweep["value"] - loop["value"], overwritten * prices, atol=0.01
+    )
+
+
+def test_flat_book_stays_flat(dates, data_source):
+    # Buying at the close doesn't change the value, but paying the cash and adding the
+    # shares leave rounding leftovers, which must not show up as gains and losses.
+    trades = [
+        [utid, "AAA", 37, 1, dates[bar], dates[bar + 2]]
+        for utid, bar in enumerate(range(0, 110, 5))
+    ]
+    for df in build_both(trades, data_source):
+        was_flat = (df["AAA"] == 0).to_numpy()[:-1]
+        changes = np.diff(df["value"].to_numpy())
+        assert (changes[was_flat] == 0).all()
+
+
+def test_loop_engine_has_no_cost_model(dates, data_source):
+    with pytest.raises(ValueError):
+        PortfolioConstructor(
+            get_trades(dates), data_source, engine="loop", cost_model=CostModel()
+        )
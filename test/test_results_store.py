@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+from Classes import ParameterSweep as parameter_sweep
+from Classes.ParameterSweep import ParameterSweep
+from Classes.PortfolioConstructor import PortfolioConstructor
+from Classes.ResultsStore import ResultsStore
+from Classes.TradeTable import TradeTable
+from Strategies.TestStrategy1 import TestStrategy1 as MovingAverageStrategy
+
+PARAM_GRID = {"MA_period": [5, 10, 20]}
+
+
+def run_sweep(dates, data_source, store):
+    return ParameterSweep(
+        MovingAverageStrategy,
+        "AAA",
+        dates[0],
+        dates[-1],
+        PARAM_GRID,
+        data_source,
+        results_store=store,
+    ).run()
+
+
+def test_repeated_sweep_reads_the_store(dates, data_source, tmp_path, monkeypatch):
+    store = ResultsStore(tmp_path)
+    first = run_sweep(dates, data_source, store)
+    assert len(store.query()) == 3
+
+    def run_backtest_with_artifacts(*args, **kwargs):
+        raise AssertionError("a stored grid point was run again")
+
+    monkeypatch.setattr(
+        parameter_sweep, "run_backtest_with_artifacts", run_backtest_with_artifacts
+    )
+    second = run_sweep(dates, data_source, store)
+    assert len(store.query()) == 3
+    # Stored dates come back as strings.
+    numbers = first.select_dtypes("number").columns
+    pd.testing.assert_frame_equal(second[numbers], first[numbers], check_dtype=False)
+
+
+def test_sweep_artifacts_round_trip(dates, data_source, tmp_path):
+    store = ResultsStore(tmp_path)
+    run_sweep(dates, data_source, store)
+    for key, MA_period in store.query()[["key", "MA_period"]].itertuples(index=False):
+        strategy = MovingAverageStrategy(
+            dates[0], dates[-1], "AAA", MA_period, data_source=data_source
+        )
+        portfolio = PortfolioConstructor(
+            strategy.trades_list, data_source
+        ).get_portfolio()
+
+        equity, trades = store.load_artifact(key)
+        pd.testing.assert_series_equal(
+            equity, portfolio["Portfolio Value"], check_names=False, check_freq=False
+        )
+        assert len(trades) > 0
+        assert trades.to_list() == strategy.trades_list.to_list()
+
+
+def test_artifact_keeps_long_tickers_and_fractional_quantities(tmp_path):
+    store = ResultsStore(tmp_path)
+    dates = pd.bdate_range("2020-01-01", periods=4)
+    trades = TradeTable.from_list(
+        [
+            [1, "A_VERY_LONG_TICKER_NAME", 0.25, 1, dates[0], dates[1]],
+            [2, "BBB", -12.5, 2, dates[1], dates[3]],
+        ]
+    )
+    equity = pd.Series([100.0, 101.5, 99.25, 102.0], index=dates)
+    store.write_artifact("ab12", equity, trades)
+
+    loaded_equity, loaded_trades = store.load_artifact("ab12")
+    np.testing.assert_array_equal(loaded_equity.to_numpy(), equity.to_numpy())
+    assert loaded_equity.index.equals(dates)
+    assert loaded_trades.to_list() == trades.to_list()
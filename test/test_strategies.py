@@ -0,0 +1,19 @@
+import numpy as np
+from Strategies.BuyOnUpSellOnDown import BuyOnUpSellOnDown
+
+
+def test_buy_on_up_sell_on_down_matches_the_daily_loop(dates, data_source):
+    strategy = BuyOnUpSellOnDown(dates[0], dates[-1], "AAA", 20, data_source)
+    df = strategy.indicators_and_signals_df
+
+    # The strategy used to ask is_up_day for the signal of every row.
+    signals = ["BUY" if strategy.is_up_day(date) else "SELL" for date in df.index]
+    np.testing.assert_array_equal(df["Signal"], signals)
+    np.testing.assert_array_equal(df["Position"], np.equal(signals, "BUY"))
+
+    # Every trade buys on an up day after a down day and sells on the next down day.
+    for _, _, _, _, buy_date, sell_date in strategy.get_trade_order_list():
+        buy, sell = df.index.get_loc(buy_date), df.index.get_loc(sell_date)
+        assert df["Signal"].iloc[buy - 1] == "SELL"
+        assert (df["Signal"].iloc[buy:sell] == "BUY").all()
+        assert df["Signal"].iloc[sell] == "SELL"
@@ -0,0 +1,94 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+from Classes.StrategyAllocator import (
+    StrategyAllocator,
+    get_mean_variance_weights,
+    get_risk_parity_weights,
+)
+
+STRATEGIES = ["A", "B", "C", "D", "E"]
+
+
+def make_returns(bars, seed=0):
+    """Returns correlated daily returns, two of the strategies losing on average"""
+    rng = np.random.default_rng(seed)
+    mixing = rng.normal(0, 0.01, (len(STRATEGIES), len(STRATEGIES)))
+    drift = np.array([0.0008, 0.0004, -0.0003, 0.0006, -0.0001])
+    returns = drift + rng.normal(size=(bars, len(STRATEGIES))) @ mixing
+    index = pd.bdate_range("2000-01-03", periods=bars)
+    return pd.DataFrame(returns, index=index, columns=STRATEGIES)
+
+
+def get_sharpe(weights, covariance, mean):
+    return weights @ mean / np.sqrt(weights @ covariance @ weights)
+
+
+def test_risk_parity_contributions_are_equal():
+    allocator = StrategyAllocator(make_returns(500))
+    covariance = allocator.covariance
+    weights = get_risk_parity_weights(covariance)
+    assert np.isclose(weights.sum(), 1) and (weights > 0).all()
+    contributions = weights * (covariance @ weights)
+    np.testing.assert_allclose(contributions, contributions.mean(), rtol=1e-8)
+
+
+def test_long_only_mean_variance_matches_brute_force():
+    allocator = StrategyAllocator(make_returns(500))
+    covariance, mean = allocator.covariance, allocator.mean
+    weights = get_mean_variance_weights(covariance, mean)
+
+    # The best Sharpe ratio over every set of strategies held, each solved
+    # unconstrained and kept only if no weight comes out negative.
+    best, best_sharpe = None, -np.inf
+    for size in range(1, len(STRATEGIES) + 1):
+        for held in itertools.combinations(range(len(STRATEGIES)), size):
+            held = list(held)
+            candidate = np.zeros(len(STRATEGIES))
+            candidate[held] = np.linalg.solve(
+                covariance[np.ix_(held, held)], mean[held]
+            )
+            if (candidate < 0).any() or candidate.sum() <= 0:
+                continue
+            candidate /= candidate.sum()
+            sharpe = get_sharpe(candidate, covariance, mean)
+            if sharpe > best_sharpe:
+                best, best_sharpe = candidate, sharpe
+
+    assert (weights >= 0).all() and (weights == 0).any()
+    np.testing.assert_allclose(weights, best, atol=1e-6)
+    np.testing.assert_allclose(get_sharpe(weights, covariance, mean), best_sharpe)
+
+
+@pytest.mark.parametrize("window, step", [(60, 1), (60, 7), (40, 40), (30, 45)])
+def test_rolling_covariance_matches_each_window(window, step):
+    returns = make_returns(3000)
+    # A strategy that hasn't started yet counts as 0.
+    returns.iloc[:100, 0] = np.nan
+    allocator = StrategyAllocator(returns)
+    values = np.nan_to_num(returns.to_numpy())
+
+    rows = []
+    for row, mean, covariance in allocator.generate_rolling_estimates(window, step):
+        window_returns = values[row + 1 - window : row + 1]
+        np.testing.assert_allclose(mean, window_returns.mean(axis=0), atol=1e-15)
+        np.testing.assert_allclose(
+            covariance, np.cov(window_returns, rowvar=False), rtol=1e-9, atol=1e-15
+        )
+        rows.append(row)
+    assert rows == list(range(window - 1, len(values), step))
+
+
+def test_rolling_sums_dont_drift():
+    # Returns far from 0 make the running sums lose precision fastest. Updated without
+    # ever being recomputed, they drift about 20 times further from np.cov by the end.
+    returns = make_returns(20000) * 50 + 100
+    allocator = StrategyAllocator(returns)
+    values = returns.to_numpy()
+    errors = []
+    for row, mean, covariance in allocator.generate_rolling_estimates(20, 1):
+        expected = np.cov(values[row - 19 : row + 1], rowvar=False)
+        errors.append(np.max(np.abs(covariance - expected)) / np.max(expected))
+    assert max(errors) < 5e-11
@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+import pytest
+from Classes.CostModel import CostModel
+from Classes.TargetWeightConstructor import TargetWeightConstructor
+
+TICKERS = ["AAA", "BBB", "LATE"]
+INITIAL_CASH = 10000
+COST_MODEL = CostModel(commission_rate=0.001, spread=0.0004)
+COST_RATE = 0.001 + 0.0004 / 2
+
+
+def get_weights(dates):
+    """Returns sparse long/short weights, one dated on a weekend, up to the last bar"""
+    rng = np.random.default_rng(0)
+    weight_dates = dates[::7].union(dates[-1:])
+    weights = pd.DataFrame(
+        rng.uniform(-0.5, 0.8, (len(weight_dates), len(TICKERS))),
+        index=weight_dates,
+        columns=TICKERS,
+    )
+    # Takes effect on the Monday after.
+    weekend = dates[50] + pd.Timedelta(days=(5 - dates[50].weekday()) % 7)
+    weights.loc[weekend] = [0.9, -0.3, 0.2]
+    return weights.sort_index()
+
+
+def get_rebalance_rows(dates, rebalance):
+    """Returns the rebalance bars without going through BarFrequency"""
+    if rebalance is None:
+        return np.arange(len(dates))
+    if isinstance(rebalance, int):
+        return np.arange(0, len(dates), rebalance)
+    periods = dates.to_period(rebalance)
+    return np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+
+
+def run_reference(prices, targets, rebalance_rows, cost_rate):
+    """
+    Trades the targets bar by bar: on every rebalance bar the shares are set to the
+    target weights of the value after costs, which are paid on the value traded at the
+    pre-cost targets. Returns the value on every bar, and the turnover and costs of
+    every rebalance.
+    """
+    shares = np.zeros(prices.shape[1])
+    cash = INITIAL_CASH
+    values, turnovers, costs = [], [], []
+    for bar, bar_prices in enumerate(prices):
+        held_prices = np.nan_to_num(bar_prices)
+        if bar in rebalance_rows:
+            value = cash + shares @ held_prices
+            listed = ~np.isnan(bar_prices)
+            target = np.where(listed, targets[bar], 0.0)
+            new = np.zeros_like(shares)
+            new[listed] = target[listed] * value / bar_prices[listed]
+            traded = np.abs(new - shares) @ held_prices
+            cost = cost_rate * traded
+            new[listed] = target[listed] * (value - cost) / bar_prices[listed]
+            cash = value - cost - new @ held_prices
+            shares = new
+            turnovers.append(traded / value)
+            costs.append(cost)
+        values.append(cash + shares @ held_prices)
+    return np.array(values), np.array(turnovers), np.array(costs)
+
+
+@pytest.mark.parametrize("rebalance", [None, 5, "W", "M"])
+@pytest.mark.parametrize("cost_model", [None, COST_MODEL])
+def test_matches_bar_by_bar_reference(
+    frames, data_source, dates, rebalance, cost_model
+):
+    weights = get_weights(dates)
+    constructor = TargetWeightConstructor(
+        weights,
+        data_source,
+        rebalance=rebalance,
+        initial_cash=INITIAL_CASH,
+        cost_model=cost_model,
+    )
+    prices = pd.DataFrame({ticker: frames[ticker]["Adj Close"] for ticker in TICKERS})
+    prices = prices.reindex(dates).ffill()
+    assert constructor.df.index.equals(dates)
+
+    targets = weights.reindex(dates, method="ffill").to_numpy()
+    rebalance_rows = get_rebalance_rows(dates, rebalance)
+    cost_rate = COST_RATE if cost_model is not None else 0.0
+    values, turnovers, costs = run_reference(
+        prices.to_numpy(), targets, rebalance_rows, cost_rate
+    )
+
+    df = constructor.df
+    np.testing.assert_allclose(df["value"], values, rtol=1e-10)
+    np.testing.assert_allclose(constructor.turnover, turnovers, rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(constructor.costs, costs, rtol=1e-10, atol=1e-12)
+    # Nothing is held in LATE before it's listed.
+    assert (constructor.holdings["LATE"].iloc[:40] == 0).all()
+
+
+@pytest.mark.parametrize("rebalance", [None, 5, "M"])
+def test_cost_and_turnover_identities(frames, data_source, dates, rebalance):
+    weights = get_weights(dates)
+    constructor = TargetWeightConstructor(
+        weights,
+        data_source,
+        rebalance=rebalance,
+        initial_cash=INITIAL_CASH,
+        cost_model=COST_MODEL,
+    )
+    df = constructor.df
+    prices = pd.DataFrame({ticker: frames[ticker]["Adj Close"] for ticker in TICKERS})
+    prices = prices.reindex(dates).ffill().fillna(0).to_numpy()
+    shares = constructor.holdings.to_numpy()
+    np.testing.assert_allclose(df[TICKERS], shares * prices)
+    np.testing.assert_allclose(df[TICKERS].sum(axis=1) + df["cash"], df["value"])
+
+    # Before a rebalance the portfolio is the last bar's shares and cash at this bar's
+    # prices, after it the value is lower by the costs.
+    rows = df.index.get_indexer(constructor.turnover.index)
+    value_before = np.full(len(rows), float(INITIAL_CASH))
+    value_before[1:] = df["cash"].to_numpy()[rows[1:] - 1] + np.sum(
+        shares[rows[1:] - 1] * prices[rows[1:]], axis=1
+    )
+    value_after = df["value"].to_numpy()[rows]
+    costs = constructor.costs.to_numpy()
+    np.testing.assert_allclose(costs, COST_RATE * constructor.turnover * value_before)
+    np.testing.assert_allclose(value_after, value_before - costs)
+
+    # The turnover is between the weights drifted to and the pre-cost target weights.
+    drifted = np.zeros((len(rows), len(TICKERS)))
+    drifted[1:] = shares[rows[1:] - 1] * prices[rows[1:]]
+    drifted /= value_before[:, np.newaxis]
+    targets = shares[rows] * prices[rows] / value_after[:, np.newaxis]
+    np.testing.assert_allclose(
+        constructor.turnover, np.abs(targets - drifted).sum(axis=1)
+    )
+
+    # Turnover is in weights, so costs don't change it, and the value is the cost-free
+    # value x (1 - cost rate x turnover) of every rebalance so far.
+    cost_free = TargetWeightConstructor(
+        weights, data_source, rebalance=rebalance, initial_cash=INITIAL_CASH
+    )
+    np.testing.assert_allclose(cost_free.turnover, constructor.turnover)
+    assert (cost_free.costs == 0).all()
+    factors = np.zeros(len(df))
+    factors[rows] = np.log1p(-COST_RATE * constructor.turnover.to_numpy())
+    np.testing.assert_allclose(
+        df["value"] / cost_free.df["value"], np.exp(np.cumsum(factors))
+    )
+
+
+@pytest.mark.parametrize("rebalance", [0, -5, np.int64(0)])
+def test_non_positive_rebalance_period_is_rejected(data_source, dates, rebalance):
+    with pytest.raises(ValueError, match="positive number of bars"):
+        TargetWeightConstructor(get_weights(dates), data_source, rebalance=rebalance)
@@ -0,0 +1,16 @@
+import pandas as pd
+from Classes.TradeTable import TradeTable
+
+
+def test_rows_give_back_the_trades_list():
+    dates = pd.bdate_range("2020-01-01", periods=4)
+    # UTID:  Ticker:  Quantity:  Leverage: Buy Date:  Sell Date:
+    trades = [
+        [1, "AAA", 100, 1, dates[0], dates[1]],
+        [2, "A_VERY_LONG_TICKER_NAME", 0.5, 2.5, dates[1], dates[3]],
+        [3, "BBB", -20, 3, dates[2], dates[3]],
+    ]
+    rows = TradeTable.from_list(trades).to_list()
+    assert rows == trades
+    assert [type(value) for value in rows[0][:4]] == [int, str, int, int]
+    assert TradeTable.from_list(trades).get_row(1)[2:4] == [0.5, 2.5]
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+from Classes.TradingCalendar import TradingCalendar
+
+# Business days of January 2020 without the Martin Luther King Day holiday (a Monday).
+HOLIDAY = pd.Timestamp("2020-01-20")
+BARS = pd.bdate_range("2020-01-02", "2020-01-31").drop(HOLIDAY)
+
+
+@pytest.fixture
+def calendar():
+    return TradingCalendar(BARS)
+
+
+def test_bars_snap_to_themselves(calendar):
+    for snap in ["exact", "previous", "next"]:
+        np.testing.assert_array_equal(
+            calendar.get_positions(BARS, snap), np.arange(len(BARS))
+        )
+    assert calendar.get_position("2020-01-02") == 0
+    assert calendar.get_position(BARS[-1]) == len(BARS) - 1
+    assert BARS[5] in calendar
+
+
+@pytest.mark.parametrize(
+    "date, previous, following",
+    [
+        # Saturday and Sunday snap to the Friday before and the Monday after.
+        ("2020-01-11", "2020-01-10", "2020-01-13"),
+        ("2020-01-12", "2020-01-10", "2020-01-13"),
+        # The holiday and the weekend before it snap over all three days.
+        ("2020-01-18", "2020-01-17", "2020-01-21"),
+        (HOLIDAY, "2020-01-17", "2020-01-21"),
+        # A time during a bar's day is after that bar.
+        ("2020-01-15 12:00", "2020-01-15", "2020-01-16"),
+    ],
+)
+def test_dates_between_bars(calendar, date, previous, following):
+    assert date not in calendar
+    assert calendar.get_positions([date], "exact")[0] == -1
+    with pytest.raises(KeyError):
+        calendar.get_position(date)
+    assert calendar.get_date(calendar.get_position(date, "previous")) == pd.Timestamp(
+        previous
+    )
+    assert calendar.get_date(calendar.get_position(date, "next")) == pd.Timestamp(
+        following
+    )
+
+
+def test_dates_outside_the_range(calendar):
+    before, after = pd.Timestamp("2019-12-31"), pd.Timestamp("2020-02-03")
+    np.testing.assert_array_equal(
+        calendar.get_positions([before, after], "exact"), [-1, -1]
+    )
+    np.testing.assert_array_equal(
+        calendar.get_positions([before, after], "previous"), [-1, len(BARS) - 1]
+    )
+    np.testing.assert_array_equal(
+        calendar.get_positions([before, after], "next"), [0, -1]
+    )
+    with pytest.raises(KeyError):
+        calendar.get_position(before, "previous")
+    with pytest.raises(KeyError):
+        calendar.get_position(after, "next")
+    with pytest.raises(ValueError):
+        calendar.get_positions([before], "nearest")
+
+
+def test_slices(calendar):
+    # Both ends are included, dates between bars snap inwards.
+    assert calendar.get_slice("2020-01-11", HOLIDAY) == slice(7, 12)
+    assert calendar.get_slice() == slice(0, len(BARS))
+    assert calendar.get_slice("2019-01-01", "2019-12-31") == slice(0, 0)
+    assert calendar.get_slice("2020-02-01") == slice(len(BARS), len(BARS))
+
+
+def test_unsorted_dates_and_frames():
+    calendar = TradingCalendar(BARS[::-1].append(BARS[:3]))
+    assert calendar.dates.equals(BARS)
+
+    first = pd.DataFrame({"x": 1.0}, index=BARS[::2])
+    second = pd.DataFrame({"x": 2.0}, index=BARS[1::2])
+    calendar = TradingCalendar.from_frames({"A": first, "B": second})
+    assert calendar.dates.equals(BARS)
+    aligned = calendar.align(first)
+    assert aligned["x"].isna().sum() == len(BARS) // 2
+    assert (calendar.align(first, "ffill")["x"] == 1.0).all()
+    with pytest.raises(KeyError):
+        calendar.align(pd.DataFrame({"x": [1.0]}, index=[HOLIDAY]))
@@ -0,0 +1,49 @@
+import numpy as np
+from Classes.WalkForward import WalkForward, get_objective
+from Strategies.TestStrategy1 import TestStrategy1 as MovingAverageStrategy
+
+
+def test_stitched_equity_keeps_every_bar(dates, data_source):
+    walk_forward = WalkForward(
+        MovingAverageStrategy,
+        "AAA",
+        dates[0],
+        dates[-1],
+        {"MA_period": [2, 4, 8, 16]},
+        train_bars=40,
+        test_bars=10,
+        data_source=data_source,
+    )
+    results = walk_forward.run()
+    profit_and_loss = walk_forward.profit_and_loss
+    windows = walk_forward.get_windows()
+    best = [
+        walk_forward.grid.index({"MA_period": period})
+        for period in results["MA_period"]
+    ]
+
+    # Every bar after the first test bar earns the P&L of the parameters held into it:
+    # those of its window, or of the window before on a window's first bar.
+    expected = []
+    for number, (_, test_start, test_end) in enumerate(windows):
+        values = profit_and_loss[best[number], test_start:test_end].copy()
+        values[0] = 0 if number == 0 else profit_and_loss[best[number - 1], test_start]
+        expected.append(values)
+    equity = walk_forward.get_portfolio()["Portfolio Value"].to_numpy()
+    np.testing.assert_allclose(
+        np.diff(equity, prepend=walk_forward.initial_cash), np.concatenate(expected)
+    )
+    # Positions are held into some of the windows.
+    assert any(values[0] != 0 for values in expected)
+
+    # Each test window is still scored from initial_cash.
+    for number, (_, test_start, test_end) in enumerate(windows):
+        values = profit_and_loss[best[number], test_start:test_end].copy()
+        values[0] = 0
+        score = get_objective(
+            values,
+            walk_forward.dates[test_start:test_end],
+            walk_forward.initial_cash,
+            "Sharpe Ratio",
+        )[0]
+        np.testing.assert_allclose(results["Test Sharpe Ratio"][number], score)